@@ -0,0 +1,288 @@
+import time
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from schema import parse_dataset_context, PII_COLUMNS
+
+MAX_CATEGORIES = 30     # columns with more distinct answers aren't treated as categorical
+CUBE_OPS = ("counts", "crosstab", "mean_by", "association", "top_predictors", "describe")
+
+
+def cube_columns(columns: list = None, max_categories: int = MAX_CATEGORIES) -> tuple:
+    """
+    (categorical, measures) schema entries the cube covers: numeric columns
+    (ratings, numeric answers) are measures; any other non-identity column
+    with 2..max_categories distinct answers is categorical.
+    """
+    columns = columns if columns is not None else parse_dataset_context()
+    categorical, measures = [], []
+    for c in columns:
+        if c["name"] in PII_COLUMNS or "date/time" in c["type"]:
+            continue
+        if "numeric" in c["type"] and c["dtype"] in ("int64", "float64"):
+            measures.append(c)
+        elif 2 <= c["unique_count"] <= max_categories:
+            categorical.append(c)
+    return categorical, measures
+
+
+def _normalize_labels(series: pd.Series) -> pd.Series:
+    """Strip answers and merge case variants ("SOMETIMES" / "Sometimes") under the most common spelling."""
+    text = series.where(series.isna(), series.astype(str).str.strip())
+    text = text.where(text != "")
+    keys = text.str.casefold()
+    canonical = text.groupby(keys).agg(lambda s: s.value_counts().index[0])
+    return keys.map(canonical)
+
+
+def _cramers_v(table: np.ndarray) -> float:
+    table = table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0]
+    n = table.sum()
+    if n == 0 or min(table.shape) < 2:
+        return 0.0
+    expected = np.outer(table.sum(axis=1), table.sum(axis=0)) / n
+    chi2 = ((table - expected) ** 2 / expected).sum()
+    return float(np.sqrt(chi2 / n / (min(table.shape) - 1)))
+
+
+def _cramers_v_corrected(table: np.ndarray) -> float:
+    """Bias-corrected Cramér's V (Bergsma 2013): doesn't grow with the number of categories."""
+    table = table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0]
+    n = table.sum()
+    r, k = table.shape
+    if n < 2 or min(r, k) < 2:
+        return 0.0
+    expected = np.outer(table.sum(axis=1), table.sum(axis=0)) / n
+    phi2 = ((table - expected) ** 2 / expected).sum() / n
+    phi2 = max(0.0, phi2 - (k - 1) * (r - 1) / (n - 1))
+    r_, k_ = r - (r - 1) ** 2 / (n - 1), k - (k - 1) ** 2 / (n - 1)
+    denominator = min(k_ - 1, r_ - 1)
+    return float(np.sqrt(phi2 / denominator)) if denominator > 0 else 0.0
+
+
+def _eta(codes: np.ndarray, values: np.ndarray, n_categories: int) -> tuple:
+    """(correlation ratio, n, non-empty categories) of a measure across the categories of a column."""
+    mask = (codes >= 0) & ~np.isnan(values)
+    codes, values = codes[mask], values[mask]
+    if len(values) < 2:
+        return 0.0, len(values), 0
+    counts = np.bincount(codes, minlength=n_categories)
+    sums = np.bincount(codes, weights=values, minlength=n_categories)
+    nonzero = counts > 0
+    between = (sums[nonzero] ** 2 / counts[nonzero]).sum() - values.sum() ** 2 / len(values)
+    total = ((values - values.mean()) ** 2).sum()
+    eta = float(np.sqrt(max(0.0, between) / total)) if total > 0 else 0.0
+    return eta, len(values), int(nonzero.sum())
+
+
+def _eta_corrected(eta: float, n: int, groups: int) -> float:
+    """Eta from epsilon squared (eta² adjusted for the categories' degrees of freedom)."""
+    if n <= groups:
+        return 0.0
+    return float(np.sqrt(max(0.0, 1 - (1 - eta ** 2) * (n - 1) / (n - groups))))
+
+
+def _pearson(x: np.ndarray, y: np.ndarray) -> tuple:
+    mask = ~np.isnan(x) & ~np.isnan(y)
+    if mask.sum() < 3 or x[mask].std() == 0 or y[mask].std() == 0:
+        return 0.0, int(mask.sum())
+    return float(np.corrcoef(x[mask], y[mask])[0, 1]), int(mask.sum())
+
+
+class AnalyticCube:
+    """
+    Aggregates precomputed once from the decrypted DataFrame so common
+    quantitative questions (distributions, crosstabs, a rating by group,
+    "which factors predict X") are answered locally in milliseconds.
+
+    Holds value counts per categorical column, the crosstab and Cramér's V
+    of every pair of categorical columns, per-category means and the
+    correlation ratio (eta) of every measure by every categorical column,
+    and Pearson r between measures. Columns come from the schema
+    (cube_columns); answers are normalized for case and whitespace.
+
+    Read-only after construction, so safe to share across threads.
+    `run(query)` executes one cube query dict and returns it as text.
+    """
+
+    def __init__(self, df, columns: list = None, max_categories: int = MAX_CATEGORIES):
+        start = time.monotonic()
+        categorical, measures = cube_columns(columns, max_categories)
+        self.categorical = [c["name"] for c in categorical if c["name"] in df.columns]
+        self.measures = [c["name"] for c in measures if c["name"] in df.columns]
+        self._by_index = {str(c["index"]): c["name"] for c in categorical + measures}
+        self._index = {name: index for index, name in self._by_index.items()}
+        self.n_rows = len(df)
+
+        self._labels, self._codes = {}, {}
+        for col in self.categorical:
+            labels = _normalize_labels(df[col])
+            cat = pd.Categorical(labels)
+            self._labels[col] = list(cat.categories)
+            self._codes[col] = cat.codes.astype(np.int64)
+        self._values = {col: pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float) for col in self.measures}
+
+        self._crosstabs, self._cramers_v = {}, {}
+        for a, b in itertools.combinations(self.categorical, 2):
+            ca, cb = self._codes[a], self._codes[b]
+            na, nb = len(self._labels[a]), len(self._labels[b])
+            mask = (ca >= 0) & (cb >= 0)
+            table = np.bincount(ca[mask] * nb + cb[mask], minlength=na * nb).reshape(na, nb)
+            self._crosstabs[(a, b)] = table
+            self._cramers_v[(a, b)] = _cramers_v(table.astype(float))
+
+        self._eta = {}
+        for col, measure in itertools.product(self.categorical, self.measures):
+            self._eta[(col, measure)] = _eta(self._codes[col], self._values[measure], len(self._labels[col]))
+
+        self._pearson = {}
+        for a, b in itertools.combinations(self.measures, 2):
+            self._pearson[(a, b)] = _pearson(self._values[a], self._values[b])
+
+        self.build_seconds = time.monotonic() - start
+
+    ###########################################################################
+    # Query API
+    ###########################################################################
+    def resolve(self, column) -> str:
+        """Exact cube column name for a name, schema index, or case-insensitive unique prefix."""
+        name = str(column).strip()
+        if name in self._by_index and self._by_index[name] in self._labels.keys() | self._values.keys():
+            return self._by_index[name]
+        if name in self._labels or name in self._values:
+            return name
+        matches = [c for c in self.categorical + self.measures if c.casefold().startswith(name.casefold())]
+        if len(matches) == 1:
+            return matches[0]
+        raise KeyError(f"{column!r} is not a cube column")
+
+    def _kind(self, column: str) -> str:
+        return "measure" if column in self._values else "categorical"
+
+    def counts(self, column) -> pd.DataFrame:
+        column = self.resolve(column)
+        if self._kind(column) == "measure":
+            values = pd.Series(self._values[column]).dropna()
+            counts = values.value_counts().sort_index()
+        else:
+            codes = self._codes[column]
+            counts = pd.Series(
+                np.bincount(codes[codes >= 0], minlength=len(self._labels[column])), index=self._labels[column]
+            ).sort_values(ascending=False)
+        out = pd.DataFrame({"count": counts, "percent": (100 * counts / max(1, counts.sum())).round(1)})
+        out.loc["(no answer)"] = [self.n_rows - counts.sum(), np.nan]
+        out["count"] = out["count"].astype(int)
+        return out
+
+    def crosstab(self, row, col, normalize: str = None) -> pd.DataFrame:
+        row, col = self.resolve(row), self.resolve(col)
+        if row == col or self._kind(row) != "categorical" or self._kind(col) != "categorical":
+            raise ValueError("crosstab needs two different categorical columns")
+        key = (row, col) if (row, col) in self._crosstabs else (col, row)
+        table = self._crosstabs[key] if key == (row, col) else self._crosstabs[key].T
+        out = pd.DataFrame(table, index=self._labels[row], columns=self._labels[col])
+        if normalize == "row":
+            out = (100 * out.div(out.sum(axis=1).replace(0, np.nan), axis=0)).round(1)
+        elif normalize == "col":
+            out = (100 * out.div(out.sum(axis=0).replace(0, np.nan), axis=1)).round(1)
+        return out
+
+    def mean_by(self, measure, by) -> pd.DataFrame:
+        measure, by = self.resolve(measure), self.resolve(by)
+        if self._kind(measure) != "measure" or self._kind(by) != "categorical":
+            raise ValueError("mean_by needs a numeric measure and a categorical column")
+        frame = pd.DataFrame({"group": self._codes[by], "value": self._values[measure]})
+        frame = frame[(frame["group"] >= 0) & frame["value"].notna()]
+        out = frame.groupby("group")["value"].agg(["count", "mean", "std"]).round(3)
+        out.index = [self._labels[by][i] for i in out.index]
+        return out.sort_values("mean", ascending=False)
+
+    def association(self, a, b) -> dict:
+        a, b = self.resolve(a), self.resolve(b)
+        kinds = (self._kind(a), self._kind(b))
+        if a == b:
+            raise ValueError("association needs two different columns")
+        if kinds == ("categorical", "categorical"):
+            key = (a, b) if (a, b) in self._cramers_v else (b, a)
+            table = self._crosstabs[key]
+            return {"statistic": "cramers_v", "value": round(self._cramers_v[key], 4), "n": int(table.sum())}
+        if kinds == ("measure", "measure"):
+            r, n = self._pearson[(a, b)] if (a, b) in self._pearson else self._pearson[(b, a)]
+            return {"statistic": "pearson_r", "value": round(r, 4), "n": n}
+        col, measure = (a, b) if kinds[0] == "categorical" else (b, a)
+        eta, n, _ = self._eta[(col, measure)]
+        return {"statistic": "eta", "value": round(eta, 4), "n": n}
+
+    def _predictor_strength(self, target: str, other: str) -> dict:
+        kinds = (self._kind(target), self._kind(other))
+        if kinds == ("categorical", "categorical"):
+            key = (target, other) if (target, other) in self._crosstabs else (other, target)
+            table = self._crosstabs[key]
+            return {"statistic": "cramers_v_corrected", "value": _cramers_v_corrected(table.astype(float)),
+                    "n": int(table.sum())}
+        if kinds == ("measure", "measure"):
+            return self.association(target, other)
+        col, measure = (target, other) if kinds[0] == "categorical" else (other, target)
+        eta, n, groups = self._eta[(col, measure)]
+        return {"statistic": "eta_corrected", "value": _eta_corrected(eta, n, groups), "n": n}
+
+    def top_predictors(self, target, k: int = 5) -> pd.DataFrame:
+        """
+        The k columns most associated with target, ranked separately per
+        statistic (Cramér's V, eta and Pearson r aren't on a common scale).
+        V and eta are bias-corrected, so many-category columns aren't favored.
+        """
+        target = self.resolve(target)
+        rows = [
+            {"column": other, **self._predictor_strength(target, other)}
+            for other in self.categorical + self.measures if other != target
+        ]
+        out = pd.DataFrame(rows)
+        out["value"] = out["value"].round(4)
+        out["strength"] = out["value"].abs()
+        out = out[out["n"] >= 10].sort_values(["statistic", "strength"], ascending=[True, False])
+        out = out.groupby("statistic", sort=False).head(int(k))
+        return out[["statistic", "column", "value", "n"]].reset_index(drop=True)
+
+    def describe(self, measure) -> pd.DataFrame:
+        measure = self.resolve(measure)
+        if self._kind(measure) != "measure":
+            raise ValueError("describe needs a numeric measure")
+        return pd.Series(self._values[measure]).describe().round(3).to_frame(measure)
+
+    def run(self, query: dict) -> str:
+        """Execute one query dict ({"op": ..., **args}) and render the result as text."""
+        args = dict(query)
+        op = args.pop("op", None)
+        if op not in CUBE_OPS:
+            raise ValueError(f"unknown cube op {op!r}")
+        result = getattr(self, op)(**args)
+        text = result.to_string() if isinstance(result, pd.DataFrame) else str(result)
+        described = ", ".join(f"{k}={v}" for k, v in args.items())
+        return f"{op}({described}):\n{text}"
+
+    def prompt(self) -> str:
+        """Agent #1's description of the cube (deterministic for a given schema and dataset columns)."""
+        return (
+            "Precomputed aggregates (the analytic cube) cover these columns, by index:\n"
+            f"  categorical: {', '.join(self._index[c] for c in self.categorical)}\n"
+            f"  numeric measures: {', '.join(self._index[c] for c in self.measures)}\n"
+            "Cube queries (columns by index or exact name):\n"
+            '  {"op":"counts","column":C}\n'
+            '  {"op":"crosstab","row":C,"col":C,"normalize":"row"|"col"|null}\n'
+            '  {"op":"mean_by","measure":M,"by":C}\n'
+            '  {"op":"association","a":C_or_M,"b":C_or_M}   (Cramér\'s V, correlation ratio eta, or Pearson r)\n'
+            '  {"op":"top_predictors","target":C_or_M,"k":5}   (top k per statistic: bias-corrected V / eta, Pearson r)\n'
+            '  {"op":"describe","measure":M}\n'
+        )
+
+    def stats(self) -> dict:
+        return {
+            "rows": self.n_rows,
+            "categorical_columns": len(self.categorical),
+            "measures": len(self.measures),
+            "crosstabs": len(self._crosstabs),
+            "build_seconds": round(self.build_seconds, 3),
+        }
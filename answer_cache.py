@@ -0,0 +1,198 @@
+import re
+import time
+import hashlib
+import sqlite3
+import threading
+
+import numpy as np
+
+
+_FUNCTION_WORDS = {
+    "a", "an", "the", "of", "in", "on", "to", "do", "does", "did", "is", "are", "was", "were", "be",
+    "been", "have", "has", "had", "and", "or", "it", "its", "this", "that", "there", "what", "which",
+    "who", "how", "me", "please", "can", "you", "tell", "show", "give",
+}
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace, drop surrounding punctuation."""
+    q = re.sub(r"\s+", " ", query.strip().lower())
+    return q.strip(" ?!.,;:\"'")
+
+
+def content_terms(query_norm: str) -> frozenset:
+    """
+    Numbers and content words (plural "s" dropped) of a normalized query.
+    Two questions can only share a semantic match if these are equal, so
+    "not", "only", a subgroup or a threshold can't be embedded away.
+    """
+    words = re.findall(r"\d+(?:\.\d+)?|[a-z]+", query_norm)
+    return frozenset(
+        w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+        for w in words if w not in _FUNCTION_WORDS
+    )
+
+
+class AnswerCache:
+    """
+    SQLite-backed cache of full pipeline results (plan, analysis output,
+    final markdown, image bytes), keyed on the normalized query + a dataset
+    hash.
+
+    Two lookup tiers:
+      1) exact (`get`): sha256(dataset_hash + normalized query)
+      2) semantic (`get_similar`): the same numbers and content words
+         (`content_terms`), so rephrasings hit but a negation, subgroup or
+         threshold change doesn't, and cosine similarity between the
+         normalized queries' embeddings >= `similarity_threshold` (None
+         => exact tier only)
+
+    The caller computes embeddings (of `normalize_query(query)`), and only
+    needs one for a lookup when `has_similar` finds a candidate.
+
+    Entries expire after `ttl_seconds` and the least recently used ones are
+    dropped beyond `max_entries`. Entries recorded against another
+    dataset_hash are purged on open, so a changed dataset invalidates
+    everything. Thread-safe.
+    """
+
+    def __init__(self, path: str, dataset_hash: str, similarity_threshold: float = 0.95,
+                 ttl_seconds: float = 7 * 24 * 3600, max_entries: int = 500):
+        self.dataset_hash = dataset_hash
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                key          TEXT PRIMARY KEY,
+                dataset_hash TEXT NOT NULL,
+                query_norm   TEXT NOT NULL,
+                embedding    BLOB,
+                plan         TEXT,
+                analysis     TEXT,
+                summary      TEXT,
+                created_at   REAL NOT NULL,
+                last_used    REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS answer_images (
+                key  TEXT NOT NULL,
+                idx  INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (key, idx)
+            );
+            """
+        )
+        with self._lock, self._db:
+            stale = [r[0] for r in self._db.execute(
+                "SELECT key FROM answers WHERE dataset_hash != ?", (dataset_hash,)
+            )]
+            self._delete(stale)
+            self._expire()
+
+    def _key(self, query_norm: str) -> str:
+        return hashlib.sha256((self.dataset_hash + "\n" + query_norm).encode("utf-8")).hexdigest()
+
+    def _delete(self, keys):
+        for key in keys:
+            self._db.execute("DELETE FROM answers WHERE key = ?", (key,))
+            self._db.execute("DELETE FROM answer_images WHERE key = ?", (key,))
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [r[0] for r in self._db.execute(
+            "SELECT key FROM answers WHERE created_at < ?", (cutoff,)
+        )]
+        over = [r[0] for r in self._db.execute(
+            "SELECT key FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?", (self.max_entries,)
+        )]
+        self._delete(set(expired) | set(over))
+
+    @staticmethod
+    def _unit(embedding):
+        if embedding is None:
+            return None
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else None
+
+    def _candidates(self, query_norm: str) -> list:
+        """(key, embedding blob) of the entries a semantic match may return for query_norm."""
+        terms = content_terms(query_norm)
+        return [
+            (row_key, blob) for row_key, row_query, blob in self._db.execute(
+                "SELECT key, query_norm, embedding FROM answers WHERE embedding IS NOT NULL"
+            )
+            if content_terms(row_query) == terms
+        ]
+
+    def _load(self, key: str) -> dict:
+        row = self._db.execute(
+            "SELECT plan, analysis, summary FROM answers WHERE key = ?", (key,)
+        ).fetchone()
+        images = [r[0] for r in self._db.execute(
+            "SELECT data FROM answer_images WHERE key = ? ORDER BY idx", (key,)
+        )]
+        self._db.execute("UPDATE answers SET last_used = ? WHERE key = ?", (time.time(), key))
+        return {"plan": row[0], "analysis": row[1], "summary": row[2], "images": images}
+
+    def get(self, query: str):
+        """
+        Cached result for exactly `query` (after normalization), or None. On a
+        hit returns {"plan", "analysis", "summary", "images": [bytes], "match": "exact"}.
+        """
+        query_norm = normalize_query(query)
+        key = self._key(query_norm)
+        with self._lock, self._db:
+            self._expire()
+            if self._db.execute("SELECT 1 FROM answers WHERE key = ?", (key,)).fetchone():
+                return dict(self._load(key), match="exact")
+        return None
+
+    def has_similar(self, query: str) -> bool:
+        """Whether `get_similar` could hit, i.e. an embedding for `query` is worth computing."""
+        if self.similarity_threshold is None:
+            return False
+        with self._lock:
+            return bool(self._candidates(normalize_query(query)))
+
+    def get_similar(self, query: str, embedding):
+        """Like `get`, for the closest same-terms entry to `embedding` ("match": "semantic")."""
+        vec = self._unit(embedding)
+        if vec is None or self.similarity_threshold is None:
+            return None
+        with self._lock, self._db:
+            best_key, best_score = None, -1.0
+            for row_key, blob in self._candidates(normalize_query(query)):
+                score = float(np.dot(vec, np.frombuffer(blob, dtype=np.float32)))
+                if score > best_score:
+                    best_key, best_score = row_key, score
+            if best_key is not None and best_score >= self.similarity_threshold:
+                return dict(self._load(best_key), match="semantic")
+        return None
+
+    def put(self, query: str, plan: str, analysis: str, summary: str, images: list, embedding=None):
+        query_norm = normalize_query(query)
+        key = self._key(query_norm)
+        vec = self._unit(embedding)
+        now = time.time()
+        with self._lock, self._db:
+            self._delete([key])
+            self._db.execute(
+                "INSERT INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, self.dataset_hash, query_norm,
+                 vec.tobytes() if vec is not None else None,
+                 plan, analysis, summary, now, now),
+            )
+            self._db.executemany(
+                "INSERT INTO answer_images VALUES (?, ?, ?)",
+                [(key, i, sqlite3.Binary(b_)) for i, b_ in enumerate(images)],
+            )
+            self._expire()
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM answers")
+            self._db.execute("DELETE FROM answer_images")
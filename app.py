@@ -1,11 +1,15 @@
-import re
+import os
 import json
+import hashlib
 import html
-import requests
+import hmac
+import secrets
+import functools
+import contextlib
 import streamlit as st
 import pandas as pd
 from io import BytesIO
-from openai import OpenAI
+from openai import OpenAI, NotFoundError
 
 # For PDF creation
 from reportlab.platypus import (
@@ -24,7 +28,18 @@ from PIL import Image as PILImage
 from markdown import markdown
 from bs4 import BeautifulSoup
 
-from prompts import dataset_context
+from image_cache import ImageCache, SYNTHETIC_ID_PREFIXES
+from local_exec import WorkerPool
+from answer_cache import AnswerCache
+from plan_cache import PlanCache, schema_version
+from text_digest import load_digests, dataset_sha256
+from response_index import ResponseIndex, load_embedder
+from schema import open_ended_text_columns
+from pipeline import PipelineEngine, PipelineResources, PipelineConfig, Job, agent1_instructions
+from job_store import JobStore
+from analytic_cube import AnalyticCube
+from dataset import decrypt_dataset
+from tracing import DEFAULT_MODEL_PRICES
 
 st.set_page_config(
     page_title="Moshiach.ai",
@@ -37,6 +52,86 @@ st.set_page_config(
 VERBOSITY = 0  # 0 => Hide Agents #1, #2 outputs. Only show final summary (Agent #3) + images
                # 1 => Show everything (Agent #1 plan, Agent #2 code, etc.)
 
+ENCRYPTED_CSV_PATH = "super_cleaned_data.csv.encrypted"
+OPENAI_REGISTRY_PATH = ".openai_registry.json"  # persisted file/assistant IDs, reused across restarts
+
+IMAGE_FETCH_WORKERS = 4     # max parallel plot downloads per run
+IMAGE_FETCH_TIMEOUT = 30    # seconds, per download attempt
+IMAGE_CACHE_DIR = ".image_cache"
+IMAGE_CACHE_MAX_BYTES = 200 * 1024 * 1024  # LRU-evicted beyond this
+
+AGENT2_EXECUTION_MODE = "remote"  # "remote" => OpenAI Code Interpreter
+                                  # "local"  => run Agent #1's code in a local isolated worker process (Linux)
+LOCAL_EXEC_TIMEOUT = 30           # seconds (wall clock) per local execution
+LOCAL_EXEC_CPU_SECONDS = 30       # CPU-time budget per local execution
+LOCAL_EXEC_MEMORY_BYTES = 2 * 1024 ** 3  # address-space cap per worker process
+LOCAL_EXEC_WORKERS = None         # pre-started worker processes (None => one per CPU core)
+LOCAL_EXEC_MAX_JOBS_PER_WORKER = 50  # recycle a worker after this many jobs
+LOCAL_EXEC_FALLBACK_TO_REMOTE = True  # retry on Code Interpreter if local execution raises
+LOCAL_EXEC_ISOLATE = True         # confine workers (no env, network or host files; see local_exec.isolate_process).
+                                  # False runs LLM-generated code with this server's secrets and network access.
+
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_PATH = ".answer_cache.sqlite"
+ANSWER_CACHE_TTL_SECONDS = 7 * 24 * 3600
+ANSWER_CACHE_MAX_ENTRIES = 500
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95  # cosine; None => exact matches only
+ANSWER_CACHE_EMBEDDING_MODEL = "text-embedding-3-small"
+
+PLAN_CACHE_ENABLED = True
+PLAN_CACHE_PATH = ".plan_cache.sqlite"
+PINNED_PLANS_PATH = "pinned_plans.json"  # vetted Agent #1 plans, meant to be committed
+PLAN_CACHE_MAX_ENTRIES = 1000
+
+QUAL_CHUNK_TOKENS = 12000   # token budget per map chunk for qualitative text analysis
+QUAL_MAP_WORKERS = 4        # max concurrent map calls
+QUAL_MAP_MODEL = "gpt-4o"   # map step (per chunk); the reduce step keeps o1
+QUAL_USE_DIGESTS = True     # answer from precomputed column digests (build_text_digests.py) when available
+DIGEST_NEEDS_RAW_MARKER = "NEED_RAW_TEXT"
+DIGEST_CHECK_MODEL = "gpt-4o"  # decides whether the digests can answer, so o1 runs only on the path taken
+QUAL_RETRIEVAL_ENABLED = True   # prompt with the top-k most relevant responses instead of whole columns
+QUAL_RETRIEVAL_TOP_K = 60
+RESPONSE_INDEX_DIR = ".response_index"
+RESPONSE_INDEX_MODEL = "BAAI/bge-small-en-v1.5"  # CPU-only embedding model (fastembed)
+
+SPECULATIVE_EXECUTION = True  # overlap Agent #1 planning with work both branches may need
+JOB_POLL_SECONDS = 0.5        # UI refresh interval while a background job is running
+JOB_STORE_PATH = ".jobs.sqlite"  # per-stage checkpoints; jobs resume after a restart
+MAX_CONCURRENT_JOBS = 8          # pipeline jobs running at once for this deployment's API key
+MAX_FINISHED_JOBS = 500          # finished jobs kept for reattaching
+TRACE_PATH = "traces.jsonl"      # per-stage spans (OpenTelemetry-shaped JSONL); None => admin panel only
+MODEL_PRICES = {}                # overrides for tracing.DEFAULT_MODEL_PRICES: model => USD per 1M (input, cached, output)
+
+# Client-side OpenAI rate limits, shared by all sessions of this process.
+# Set them a little under the organization's tier limits.
+RATE_LIMITS = {                  # model => (requests/min, tokens/min)
+    "o1-2024-12-17": (500, 200_000),
+    "gpt-4o": (500, 300_000),
+}
+DEFAULT_RATE_LIMIT = (500, 200_000)
+OPENAI_MAX_RETRIES = 5           # retries (backoff + jitter) on 429 / 5xx / connection errors
+
+AGENT1_PLAN_FORMAT = "3"  # bump when Agent #1's JSON plan format changes (invalidates cached plans)
+AGENT1_SCHEMA_VARIANT = "full"  # "full" => prompts.dataset_context, "compact" => one generated line per column
+ANALYTIC_CUBE_ENABLED = True    # let Agent #1 answer from precomputed crosstabs/means/associations (no Code Interpreter)
+ANALYTIC_CUBE_MAX_CATEGORIES = 30  # columns with more distinct answers stay out of the cube
+FAST_PATH_ENABLED = True        # simple counts/distributions/averages of one column skip o1 (needs the cube)
+FAST_PATH_MODEL = "gpt-4o"      # summarizer for fast-path answers
+AGENT2_STREAM_RUNS = True         # follow Code Interpreter runs via streamed events (live step progress)
+AGENT2_POLL_INITIAL_SECONDS = 0.2 # fallback poller when streaming fails: first interval...
+AGENT2_POLL_MAX_SECONDS = 2.0     # ...backing off x1.5 up to this
+CI_POOL_SIZE = 2                  # pre-warmed Code Interpreter threads kept ready (0 => create on demand)
+CI_POOL_IDLE_SECONDS = 20 * 60    # recycle warm threads before their sandbox expires
+CI_POOL_LEASE_TIMEOUT = 5.0       # max wait for a warming thread before creating one cold
+CI_POOL_ACTIVE_SECONDS = 30 * 60  # stop warming (paid) threads after this long without a query needing one
+
+AGENT2_NAME = "Agent #2 - Code Interpreter"
+AGENT2_MODEL = "gpt-4o"
+AGENT2_INSTRUCTIONS = (
+    "You are Agent #2. You have a Code Interpreter tool that can analyze the CSV. "
+    "When the user provides Python code, run it on the CSV and return results."
+)
+
 ###############################################################################
 # 0) SETUP & CONFIG
 ###############################################################################
@@ -78,66 +173,119 @@ with tab2:
 ###############################################################################
 # 2) SETUP & FILE UPLOAD
 ###############################################################################
-from cryptography.fernet import Fernet
-from io import BytesIO
+@st.cache_resource(show_spinner="Loading dataset...")
+def load_dataset(encrypted_path: str = ENCRYPTED_CSV_PATH):
+    """
+    Process-wide dataset store. Decrypts the CSV once per server process and
+    keeps both the plaintext bytes and the parsed DataFrame in memory, shared
+    by every session. Returns (csv_bytes, df). Treat df as read-only.
+    """
+    return decrypt_dataset(st.secrets["ENCRYPTION_KEY"], encrypted_path)
 
-def load_and_decrypt_csv(encrypted_path: str) -> bytes:
+def _read_openai_registry() -> dict:
+    try:
+        with open(OPENAI_REGISTRY_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_openai_registry(registry: dict):
+    tmp_path = OPENAI_REGISTRY_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(registry, f, indent=2)
+    os.replace(tmp_path, OPENAI_REGISTRY_PATH)
+
+def _code_interpreter_registry_key(csv_bytes: bytes) -> str:
     """
-    Reads an .encrypted file from your repo and decrypts it using
-    st.secrets["ENCRYPTION_KEY"]. Returns the plaintext CSV bytes.
+    Content hash of the decrypted CSV + Agent #2's model and instructions.
+    A change to any of them yields a new key (=> new file + assistant).
     """
-    # This key must match the one you used to encrypt the CSV locally (base64-encoded)
-    encryption_key = st.secrets["ENCRYPTION_KEY"]  
-    fernet = Fernet(encryption_key)
+    h = hashlib.sha256()
+    h.update(csv_bytes)
+    h.update(AGENT2_MODEL.encode("utf-8"))
+    h.update(AGENT2_INSTRUCTIONS.encode("utf-8"))
+    return h.hexdigest()
+
+@st.cache_resource(show_spinner="Initializing AI...")
+def get_code_interpreter_assets() -> dict:
+    """
+    One uploaded CSV file + one "Agent #2 - Code Interpreter" assistant per
+    deployment, shared by all sessions. The IDs are persisted in
+    OPENAI_REGISTRY_PATH so a restart reuses them; they're only re-created
+    when the data or Agent #2's config changes. Superseded entries are
+    deleted remotely (best effort) so nothing is left orphaned.
+    Returns {"file_id": ..., "assistant_id": ...}.
+    """
+    csv_plain_bytes, _ = load_dataset()
+    key = _code_interpreter_registry_key(csv_plain_bytes)
+    registry = _read_openai_registry()
 
-    with open(encrypted_path, "rb") as f:
-        ciphertext = f.read()
+    entry = registry.get(key)
+    if entry:
+        # Once per process: make sure the persisted assistant still exists
+        try:
+            client.beta.assistants.retrieve(entry["assistant_id"])
+            return entry
+        except NotFoundError:
+            pass  # keep the entry: its uploaded file outlives the assistant and is deleted below
+
+    resp = client.files.create(
+        file=BytesIO(csv_plain_bytes),
+        purpose="assistants",
+    )
+    asst_2 = client.beta.assistants.create(
+        name=AGENT2_NAME,
+        instructions=AGENT2_INSTRUCTIONS,
+        tools=[{"type": "code_interpreter"}],
+        tool_resources={"code_interpreter": {"file_ids": [resp.id]}},
+        model=AGENT2_MODEL,
+    )
 
-    plaintext = fernet.decrypt(ciphertext)
-    return plaintext
+    for stale in registry.values():
+        try:
+            client.beta.assistants.delete(stale["assistant_id"])
+        except Exception:
+            pass
+        try:
+            client.files.delete(stale["file_id"])
+        except Exception:
+            pass
+
+    entry = {"file_id": resp.id, "assistant_id": asst_2.id}
+    _write_openai_registry({key: entry})
+    return entry
 
 def setup_file_upload():
     """
-    Replaces your existing setup_file_upload, but uses the encrypted CSV.
+    Attaches the shared dataset file + Agent #2 assistant to this session.
+    No remote calls unless this is the first session of the deployment.
     """
-    if "uploaded_file_id" not in st.session_state:
-        st.write("Uploading dataset for AI...")
-        try:
-            # 1) Decrypt the CSV from 'super_cleaned_data.csv.encrypted'
-            csv_plain_bytes = load_and_decrypt_csv("super_cleaned_data.csv.encrypted")
-
-            # 2) Provide these bytes to client.files.create
-            resp = client.files.create(
-                file=BytesIO(csv_plain_bytes),
-                purpose="assistants",
-            )
-            st.session_state["uploaded_file_id"] = resp.id
-            st.success(f"Uploaded file ID: {resp.id}")
-        except Exception as e:
-            st.error(f"Error uploading CSV: {e}")
-            st.stop()
-
-    if "assistant_2_id" not in st.session_state:
-        st.write("Initializing AI...")
+    if "uploaded_file_id" not in st.session_state or "assistant_2_id" not in st.session_state:
         try:
-            asst_2 = client.beta.assistants.create(
-                name="Agent #2 - Code Interpreter",
-                instructions=(
-                    "You are Agent #2. You have a Code Interpreter tool that can analyze the CSV. "
-                    "When the user provides Python code, run it on the CSV and return results."
-                ),
-                tools=[{"type": "code_interpreter"}],
-                tool_resources={"code_interpreter": {"file_ids": [st.session_state["uploaded_file_id"]]}},
-                model="gpt-4o",
-            )
-            st.session_state["assistant_2_id"] = asst_2.id
-            st.success(f"Agent #2 created. ID: {asst_2.id}")
-            st.rerun()
+            assets = get_code_interpreter_assets()
         except Exception as e:
-            st.error(f"Error creating GPT-4 Code Interpreter: {e}")
+            st.error(f"Error initializing AI: {e}")
             st.stop()
+        st.session_state["uploaded_file_id"] = assets["file_id"]
+        st.session_state["assistant_2_id"] = assets["assistant_id"]
+
+@st.cache_resource(show_spinner="Starting local analysis workers...")
+def get_worker_pool() -> WorkerPool:
+    """Process-wide pool of pre-warmed, isolated workers with the dataset loaded."""
+    _, df = load_dataset()
+    return WorkerPool(
+        df,
+        size=LOCAL_EXEC_WORKERS,
+        max_jobs_per_worker=LOCAL_EXEC_MAX_JOBS_PER_WORKER,
+        timeout=LOCAL_EXEC_TIMEOUT,
+        cpu_seconds=LOCAL_EXEC_CPU_SECONDS,
+        memory_bytes=LOCAL_EXEC_MEMORY_BYTES,
+        isolate=LOCAL_EXEC_ISOLATE,
+    )
 
 setup_file_upload()
+if AGENT2_EXECUTION_MODE == "local":
+    get_worker_pool()  # start (or reuse) the pre-warmed workers before the first query
 ###############################################################################
 # 3) SESSION STATE
 ###############################################################################
@@ -151,279 +299,295 @@ if "next_prompt_type" not in st.session_state:
     st.session_state["next_prompt_type"] = "Ask any question about this dataset..."
 if "agent2_thread_id" not in st.session_state:
     st.session_state["agent2_thread_id"] = None
-if "agent2_image_file_ids" not in st.session_state:
-    st.session_state["agent2_image_file_ids"] = []
+if "session_token" not in st.session_state:
+    # Owner token of this session's jobs; kept in the URL (?key=...) so a reloaded tab still owns them
+    st.session_state["session_token"] = st.query_params.get("key") or secrets.token_urlsafe(16)
+    st.query_params["key"] = st.session_state["session_token"]
+if "active_job_id" not in st.session_state:
+    st.session_state["active_job_id"] = None     # pipeline job this session is waiting on
+if "finished_job_id" not in st.session_state:
+    st.session_state["finished_job_id"] = None   # last finished job, re-rendered on reruns
+    if st.query_params.get("job"):
+        # reattach (reload / shared link); poll_active_job checks the job belongs to this token
+        st.session_state["active_job_id"] = st.query_params["job"]
 
 # Store final summary & images for PDF
 if "final_summary_markdown" not in st.session_state:
     st.session_state["final_summary_markdown"] = ""
 if "cached_images" not in st.session_state:
     st.session_state["cached_images"] = []
+if "pdf_bytes" not in st.session_state:
+    st.session_state["pdf_bytes"] = (None, None)   # (finished job id, generated PDF), built once per job
+if "images_traced_job_id" not in st.session_state:
+    st.session_state["images_traced_job_id"] = None  # job whose first plot render was traced
 if "user_query_for_pdf" not in st.session_state:
     st.session_state["user_query_for_pdf"] = ""
+if "last_agent1_query" not in st.session_state:
+    st.session_state["last_agent1_query"] = ""
+if "last_agent1_plan" not in st.session_state:
+    st.session_state["last_agent1_plan"] = ""
 
 ###############################################################################
-# 4) IMAGE FETCH & DISPLAY
+# 4) IMAGE DISPLAY
 ###############################################################################
-def fallback_download_file(file_id: str) -> bytes:
-    url = f"https://api.openai.com/v1/files/{file_id}/content"
-    headers = {"Authorization": f"Bearer {API_KEY}"}
-    r = requests.get(url, headers=headers)
-    r.raise_for_status()
-    return r.content
-
-def fetch_image_bytes(file_id: str) -> bytes:
+@st.cache_resource
+def get_image_cache() -> ImageCache:
+    """Process-wide, file-ID-keyed + content-addressed plot cache on disk."""
+    return ImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
+
+def load_cached_image(file_id: str, digest: str) -> bytes:
+    """Bytes for a cached_images entry; re-fetched if evicted in the meantime (b"" if it can't be)."""
+    cache = get_image_cache()
+    b_ = cache.get_by_digest(digest) if digest else None
+    if b_ is None and not file_id.startswith(SYNTHETIC_ID_PREFIXES):
+        b_ = get_pipeline_engine().fetch_images_sync([file_id])[0]
+    return b_ or b""
+
+def display_images_after_agent3(job: Job):
     """
-    Attempt to read from OpenAI's library approach, else do direct GET fallback.
+    Display a finished job's plots (already resolved into the image cache by
+    the engine) in their original order.
+    """
+    if not job.image_file_ids:
+        return
+    # Reruns re-render the same plots; only the first render is a stage of the job's trace
+    if st.session_state["images_traced_job_id"] == job.id:
+        span = contextlib.nullcontext()
+    else:
+        span = get_pipeline_engine().tracer.span("display_images_after_agent3", trace_id=job.id,
+                                                 images=len(job.image_file_ids))
+        st.session_state["images_traced_job_id"] = job.id
+    with span:
+        st.subheader("Plots / Images")
+        resolved = dict(job.images)
+        for fid in job.image_file_ids:
+            b_ = load_cached_image(fid, resolved[fid]) if fid in resolved else b""
+            if b_:
+                st.image(b_, use_column_width=True)
+            else:
+                st.error(f"Could not retrieve bytes for file_id={fid}")
+
+###############################################################################
+# 5) SHARED CACHES & INDEXES
+###############################################################################
+@st.cache_resource
+def get_text_digests():
+    """Precomputed per-column digests (None if not built for the current dataset)."""
+    csv_plain_bytes, _ = load_dataset()
+    return load_digests(st.secrets["ENCRYPTION_KEY"], csv_plain_bytes)
+
+def load_response_index(df, csv_plain_bytes: bytes):
+    """
+    (ResponseIndex, embed) over all open-ended responses, built once from
+    the decrypted DataFrame and memory-mapped from RESPONSE_INDEX_DIR.
+    None if the embedding model (fastembed) is unavailable. Called once by
+    the pipeline engine, in the background at startup.
     """
     try:
-        lib_obj = client.files.content(file_id)
-        if hasattr(lib_obj, "read"):
-            return lib_obj.read()
-        elif isinstance(lib_obj, bytes):
-            return lib_obj
-    except Exception:
-        pass
-    try:
-        return fallback_download_file(file_id)
+        embed = load_embedder(RESPONSE_INDEX_MODEL)
+        index = ResponseIndex.load_or_build(
+            RESPONSE_INDEX_DIR, df, open_ended_text_columns(), embed,
+            dataset_sha256(csv_plain_bytes), RESPONSE_INDEX_MODEL,
+        )
+        return index, embed
     except Exception:
-        return b""
+        return None
 
-def display_images_after_agent3():
-    """
-    For each file_id in agent2_image_file_ids, fetch the bytes, display in app,
-    and store in cached_images for PDF. Then clear them from state.
-    """
-    st.session_state["cached_images"].clear()
-    if not st.session_state["agent2_image_file_ids"]:
-        return
+@st.cache_resource
+def get_dataset_hash(encrypted_path: str = ENCRYPTED_CSV_PATH) -> str:
+    """SHA-256 of the encrypted CSV; any change to the file invalidates cached answers."""
+    with open(encrypted_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+@st.cache_resource
+def get_answer_cache() -> AnswerCache:
+    """Process-wide cache of full pipeline answers (exact + embedding-similarity tiers)."""
+    return AnswerCache(
+        ANSWER_CACHE_PATH,
+        get_dataset_hash(),
+        similarity_threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD,
+        ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    )
 
-    st.subheader("Plots / Images")
-    for idx, fid in enumerate(st.session_state["agent2_image_file_ids"]):
-        b_ = fetch_image_bytes(fid)
-        if b_ and len(b_) > 0:
-            st.image(b_, use_column_width=True)
-            fn = f"plot_{idx+1}.png"
-            st.session_state["cached_images"].append((fn, b_))
-        else:
-            st.error(f"Could not retrieve bytes for file_id={fid}")
-    st.session_state["agent2_image_file_ids"].clear()
+@st.cache_resource(show_spinner="Precomputing aggregates...")
+def get_analytic_cube() -> AnalyticCube:
+    """Process-wide crosstabs / means / associations over the categorical and rating columns."""
+    _, df = load_dataset()
+    return AnalyticCube(df, max_categories=ANALYTIC_CUBE_MAX_CATEGORIES)
+
+@st.cache_resource
+def get_plan_cache() -> PlanCache:
+    """Process-wide memo of Agent #1 plans, keyed by query + schema version."""
+    return PlanCache(
+        PLAN_CACHE_PATH,
+        PINNED_PLANS_PATH,
+        schema_version(
+            agent1_instructions(AGENT1_SCHEMA_VARIANT, get_analytic_cube() if ANALYTIC_CUBE_ENABLED else None),
+            AGENT1_PLAN_FORMAT,
+        ),
+        max_entries=PLAN_CACHE_MAX_ENTRIES,
+    )
 
 ###############################################################################
-# 5) AGENT #1
+# 6) PIPELINE ENGINE (async agents, see pipeline.py)
 ###############################################################################
-def run_agent_1(user_query: str) -> str:
+@st.cache_resource(show_spinner="Starting analysis engine...")
+def get_pipeline_engine() -> PipelineEngine:
     """
-    Returns JSON:
-      {"type":"quantitative","code":"..."}
-    or
-      {"type":"qualitative","column":"...","prompt":"..."}
+    Process-wide engine running every session's queries as background jobs
+    on one asyncio loop. Jobs outlive the Streamlit run that submitted them
+    and, via the job store, the server process.
     """
-    with st.spinner("Agent #1 is generating plan..."):
-        try:
-            llm_snippet = (
-                "from openai import OpenAI\n"
-                f"client = OpenAI(api_key='{API_KEY}')\n\n"
-                "completion = client.chat.completions.create(\n"
-                '  model="o1-2024-12-17",\n'
-                "  messages=[\n"
-                '    {"role": "developer", "content": "You are a helpful assistant."},\n'
-                '    {"role": "user", "content": "..."}\n'
-                "  ]\n"
-                ")\n\n"
-                "print(completion.choices[0].message.content)\n"
-            )
-
-            instructions_for_agent1 = (
-                "You are Agent #1. The dataset is 'super_cleaned_data.csv' with this schema:\n\n"
-                f"{dataset_context}\n\n"
-                "Decide if the question is numeric/quantitative vs. text/qualitative. "
-                "If numeric => produce JSON:\n"
-                '{"type":"quantitative","code":"(python for Agent2)"}\n\n'
-                "If text => produce JSON:\n"
-                '{"type":"qualitative","column":"somecol","prompt":"(instructions for the LLM). Please include direct quotes where possible."}\n\n'
-                "If you do LLM calls, use the exact snippet:\n"
-                f"{llm_snippet}\n"
-                "Keep your plan minimal. Only do text-based approach if the user specifically wants quotes/text insights."
-            )
-
-            c = client.chat.completions.create(
-                model="o1-2024-12-17",
-                reasoning_effort="high",
-                messages=[
-                    {"role": "developer", "content": instructions_for_agent1},
-                    {"role": "user", "content": user_query},
-                ],
-            )
-            return c.choices[0].message.content
-        except Exception as e:
-            return f"Error calling Agent #1: {e}"
-
-###############################################################################
-# 6) AGENT #2 (quantitative code)
-###############################################################################
-def run_agent_2(plan_code: str) -> str:
-    with st.spinner("Agent #2 is running code..."):
-        out_ = ""
-        try:
-            if st.session_state["agent2_thread_id"] is None:
-                thr = client.beta.threads.create()
-                st.session_state["agent2_thread_id"] = thr.id
-
-            thread_id = st.session_state["agent2_thread_id"]
-            asst_2id = st.session_state["assistant_2_id"]
-
-            content_ = (
-                "Here is the Python code from Agent #1. "
-                "Please run it and provide all outputs (text, plots, data). "
-                "Code:\n\n" + plan_code
-            )
-
-            client.beta.threads.messages.create(
-                thread_id=thread_id,
-                role="user",
-                content=content_
-            )
-
-            run_ = client.beta.threads.runs.create_and_poll(
-                thread_id=thread_id,
-                assistant_id=asst_2id,
-                instructions=(
-                    "You are Agent #2 (GPT-4o Code Interpreter). Execute the code on 'super_cleaned_data.csv' and return all results."
-                ),
-            )
-
-            msgs = client.beta.threads.messages.list(thread_id=thread_id)
-            for m in msgs.data:
-                if m.role == "assistant":
-                    cval = m.content
-                    if isinstance(cval, list):
-                        for block in cval:
-                            if isinstance(block, dict):
-                                btype = block.get("type")
-                                if btype == "text":
-                                    txt_ = block["text"].get("value", "")
-                                    out_ += txt_ + "\n\n"
-                                elif btype in ["image_file", "ImageFileContentBlock"]:
-                                    im = block.get("image_file", {})
-                                    fid = im.get("file_id", "")
-                                    out_ += f"[ImageFileContentBlock with file_id={fid}]\n"
-                                    st.session_state["agent2_image_file_ids"].append(fid)
-                                else:
-                                    out_ += str(block) + "\n\n"
-                            else:
-                                block_str = str(block)
-                                if "type='image_file'" in block_str:
-                                    match = re.search(r"file_id='(file-[^']+)'", block_str)
-                                    if match:
-                                        out_ += f"[ImageFileContentBlock with file_id={match.group(1)}]\n"
-                                        st.session_state["agent2_image_file_ids"].append(match.group(1))
-                                else:
-                                    out_ += block_str + "\n\n"
-                    else:
-                        out_ += str(cval) + "\n\n"
-            return out_.strip()
-        except Exception as ex:
-            return f"Error calling Agent #2: {ex}"
-
-###############################################################################
-# 7) LOCAL LLM FOR QUALITATIVE
-###############################################################################
-def run_local_llm_on_text(column_name: str, prompt: str) -> str:
-    with st.spinner("Agent #2 (Local LLM) analyzing text..."):
-        try:
-            df = pd.read_csv("super_cleaned_data.csv")
-            if column_name not in df.columns:
-                return f"Error: The column '{column_name}' is not found in the dataset."
-
-            text_data = df[column_name].dropna().astype(str).tolist()
-            joined_text = "\n".join(text_data)
-
-            local_prompt = (
-                prompt
-                + "\n\n=== SAMPLE TEXT DATA ===\n"
-                + joined_text
-            )
-
-            completion = client.chat.completions.create(
-                model="o1-2024-12-17",
-                messages=[
-                    {"role":"developer","content":"You are a helpful assistant that includes direct quotes if possible."},
-                    {"role":"user","content":local_prompt}
-                ]
-            )
-            return completion.choices[0].message.content
-        except Exception as e:
-            return f"Error during local LLM call: {e}"
+    csv_plain_bytes, df = load_dataset()
+    resources = PipelineResources(
+        df=df,
+        assistant_id=get_code_interpreter_assets()["assistant_id"],
+        image_cache=get_image_cache(),
+        plan_cache=get_plan_cache() if PLAN_CACHE_ENABLED else None,
+        answer_cache=get_answer_cache() if ANSWER_CACHE_ENABLED else None,
+        worker_pool=get_worker_pool() if AGENT2_EXECUTION_MODE == "local" else None,
+        digests=get_text_digests() if QUAL_USE_DIGESTS else None,
+        response_index_loader=(
+            functools.partial(load_response_index, df, csv_plain_bytes) if QUAL_RETRIEVAL_ENABLED else None
+        ),
+        job_store=JobStore(JOB_STORE_PATH, max_finished=MAX_FINISHED_JOBS),
+        analytic_cube=get_analytic_cube() if ANALYTIC_CUBE_ENABLED else None,
+    )
+    config = PipelineConfig(
+        agent2_execution_mode=AGENT2_EXECUTION_MODE,
+        local_exec_fallback_to_remote=LOCAL_EXEC_FALLBACK_TO_REMOTE,
+        image_fetch_workers=IMAGE_FETCH_WORKERS,
+        image_fetch_timeout=IMAGE_FETCH_TIMEOUT,
+        qual_chunk_tokens=QUAL_CHUNK_TOKENS,
+        qual_map_workers=QUAL_MAP_WORKERS,
+        qual_map_model=QUAL_MAP_MODEL,
+        qual_use_digests=QUAL_USE_DIGESTS,
+        digest_needs_raw_marker=DIGEST_NEEDS_RAW_MARKER,
+        digest_check_model=DIGEST_CHECK_MODEL,
+        answer_cache_embedding_model=ANSWER_CACHE_EMBEDDING_MODEL,
+        qual_retrieval_enabled=QUAL_RETRIEVAL_ENABLED,
+        qual_retrieval_top_k=QUAL_RETRIEVAL_TOP_K,
+        speculative_execution=SPECULATIVE_EXECUTION,
+        agent1_schema_variant=AGENT1_SCHEMA_VARIANT,
+        fast_path_enabled=FAST_PATH_ENABLED,
+        fast_path_model=FAST_PATH_MODEL,
+        trace_path=TRACE_PATH,
+        model_prices={**DEFAULT_MODEL_PRICES, **MODEL_PRICES},
+        agent2_model=AGENT2_MODEL,
+        agent2_stream_runs=AGENT2_STREAM_RUNS,
+        agent2_poll_initial=AGENT2_POLL_INITIAL_SECONDS,
+        agent2_poll_max=AGENT2_POLL_MAX_SECONDS,
+        ci_pool_size=CI_POOL_SIZE,
+        ci_pool_idle_seconds=CI_POOL_IDLE_SECONDS,
+        ci_pool_lease_timeout=CI_POOL_LEASE_TIMEOUT,
+        ci_pool_active_seconds=CI_POOL_ACTIVE_SECONDS,
+        rate_limits=RATE_LIMITS,
+        default_rate_limit=DEFAULT_RATE_LIMIT,
+        max_retries=OPENAI_MAX_RETRIES,
+        max_concurrent_jobs=MAX_CONCURRENT_JOBS,
+        max_finished_jobs=MAX_FINISHED_JOBS,
+    )
+    return PipelineEngine(API_KEY, resources, config)
 
 ###############################################################################
-# 8) AGENT #3 QUANT + QUAL
+# 7) JOBS: SUBMIT & RENDER
 ###############################################################################
-def run_agent_3_quant(user_q: str, plan_text: str, analysis_out: str) -> str:
-    with st.spinner("Agent #3 is summarizing (quantitative)..."):
-        try:
-            final_msg = (
-                f"You are Agent #3. The user asked:\n'{user_q}'\n\n"
-                "Agent #1's plan/code:\n"
-                f"{plan_text}\n\n"
-                "Agent #2's code execution outputs:\n"
-                f"{analysis_out}\n\n"
-                "Please produce a concise final answer in **Markdown** with minimal jargon. "
-                "Start with a direct numeric/statistical answer, then a short explanation. "
-                "Do **not** embed any images or plots in your text. NEVER RETURN OR SHOW ANY CODE "
-                "Do not mention 'agents' or the underlying process, and never suggest that the dataset needs further refinement/cleaning."
-            )
-
-            c = client.chat.completions.create(
-                model="o1-2024-12-17",
-                reasoning_effort="high",
-                messages=[
-                    {
-                        "role": "developer",
-                        "content": "You are Agent #3. Summarize a quantitative analysis in plain Markdown with no mention of images."
-                    },
-                    {"role": "user", "content": final_msg}
-                ]
-            )
-            return c.choices[0].message.content
-        except Exception as e:
-            return f"Error calling Agent #3 (quant): {e}"
+def submit_query(user_query: str):
+    """
+    Queue the pipeline for user_query in the background; the UI polls it.
+    The job ID goes in the URL (?job=...) next to the session's owner token
+    (?key=...) so a reloaded tab reattaches.
+    """
+    job_id = get_pipeline_engine().submit(
+        user_query, thread_id=st.session_state["agent2_thread_id"], owner=st.session_state["session_token"],
+    )
+    st.session_state["active_job_id"] = job_id
+    st.query_params["job"] = job_id
+    st.session_state["finished_job_id"] = None
+    st.session_state["final_summary_markdown"] = ""
+    st.session_state["cached_images"] = []
 
-def run_agent_3_qual(user_q: str, plan_text: str, analysis_out: str) -> str:
-    with st.spinner("Agent #3 is summarizing (qualitative)..."):
-        try:
-            final_msg = (
-                f"You are Agent #3. The user asked:\n'{user_q}'\n\n"
-                "Agent #1's plan (qualitative text analysis):\n"
-                f"{plan_text}\n\n"
-                "Local LLM analysis outputs:\n"
-                f"{analysis_out}\n\n"
-                "Please produce a final answer in **Markdown** that emphasizes the rich text insights, "
-                "including direct quotes if they appear in the analysis. Begin with a direct conclusion, then highlight any themes or sentiments. "
-                "Do not mention 'agents' or the underlying process, just present the text-based findings in a structured, user-friendly manner."
-            )
-
-            c = client.chat.completions.create(
-                model="o1-2024-12-17",
-                reasoning_effort="high",
-                messages=[
-                    {
-                        "role": "developer",
-                        "content": "You are Agent #3, summarizing a qualitative text analysis in plain Markdown with direct quotes."
-                    },
-                    {"role": "user", "content": final_msg}
-                ]
-            )
-            return c.choices[0].message.content
-        except Exception as e:
-            return f"Error calling Agent #3 (qual): {e}"
+def render_job(job: Job):
+    """
+    Render a job snapshot: plan/analysis (if VERBOSITY > 0), the summary as
+    streamed so far, and the current stage while it's still running.
+    If VERBOSITY=0, we hide Agent #1 plan and Agent #2 output expansions.
+    """
+    suffix = " (cached)" if job.cached else ""
+    if VERBOSITY > 0 and job.plan:
+        plan_label = "Fast-Path Route" if job.plan_type == "fast" else "Agent #1 Plan & Code"
+        with st.expander(f"{plan_label}{suffix}", expanded=False):
+            st.text(job.plan)
+    if VERBOSITY > 0 and job.analysis:
+        label = {
+            "quantitative": "Agent #2 Output",
+            "cube": "Analytic Cube Output",
+            "fast": "Analytic Cube Output",
+        }.get(job.plan_type, "Local LLM (Qualitative) Output")
+        with st.expander(f"{label if not job.cached else 'Analysis Output'}{suffix}", expanded=False):
+            st.text(job.analysis)
+
+    if job.summary:
+        st.divider()
+        st.markdown("## Final Response")
+        st.markdown(job.summary if job.finished else job.summary + "▌")
+    if not job.finished:
+        st.info(job.stage or "Waiting for a free worker...")
+        for line in job.progress[-5:]:
+            st.caption(f"• {line}")
+        st.caption(f"Job ID: {job.id} (reopen this page's URL to reattach)")
+    elif job.status == "error":
+        st.error(job.error)
+
+def finish_job(job: Job):
+    """Copy a finished job's results into session state (follow-ups, PDF, plan pinning)."""
+    st.session_state["active_job_id"] = None
+    st.session_state["finished_job_id"] = job.id
+    if job.thread_id:
+        st.session_state["agent2_thread_id"] = job.thread_id
+    if job.plan and not job.cached:
+        st.session_state["last_agent1_query"] = job.query
+        st.session_state["last_agent1_plan"] = job.plan
+    if job.status == "done":
+        st.session_state["final_summary_markdown"] = job.summary
+        st.session_state["user_query_for_pdf"] = job.query
+        st.session_state["cached_images"] = [
+            (f"plot_{idx+1}.png", fid, digest) for idx, (fid, digest) in enumerate(job.images)
+        ]
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def poll_active_job():
+    """Re-renders only this fragment while the job runs; a full rerun once it's done."""
+    job = get_pipeline_engine().get(st.session_state["active_job_id"])
+    if job is None or not hmac.compare_digest(job.owner or "", st.session_state["session_token"]):
+        st.session_state["active_job_id"] = None
+        st.query_params.pop("job", None)
+        st.rerun()
+    if job.finished:
+        finish_job(job)
+        st.rerun()
+    render_job(job)
+
+def show_finished_job():
+    job = get_pipeline_engine().get(st.session_state["finished_job_id"])
+    if job is None:
+        return
+    render_job(job)
+    if job.status == "done":
+        display_images_after_agent3(job)
+        if job.cached:
+            st.success(f"All steps completed (cached answer, {job.cached} match).")
+        else:
+            st.success("All steps completed.")
 
 ###############################################################################
-# 9) PDF GENERATION
+# 8) PDF GENERATION
 ###############################################################################
 def generate_pdf(query: str, summary_markdown: str, images: list):
     """
     Convert user query + final summary (Markdown) + images into a PDF.
+    `images` holds (filename, file_id, sha256) references into the image cache.
     We'll parse headings (#, ##, ###) using markdown->BeautifulSoup, then
     produce appropriate headings in the PDF. We'll do minimal coverage of tables/lists.
     """
@@ -536,11 +700,12 @@ def generate_pdf(query: str, summary_markdown: str, images: list):
             story.append(Paragraph(child.strip(), styleNormal))
             story.append(Spacer(1, 6))
 
-    # 3) images
-    for idx, (fname, b_) in enumerate(images):
+    # 3) images (read back from the on-disk image cache)
+    for idx, (fname, file_id, digest) in enumerate(images):
         story.append(Paragraph(f"Plot/Image {idx+1}:", styleNormal))
         story.append(Spacer(1, 6))
         try:
+            b_ = load_cached_image(file_id, digest)
             pil_img = PILImage.open(BytesIO(b_))
             w, h = pil_img.size
             ratio = h / float(w) if w != 0 else 1.0
@@ -557,77 +722,25 @@ def generate_pdf(query: str, summary_markdown: str, images: list):
     return pdf_buffer.getvalue()
 
 ###############################################################################
-# 10) MAIN PIPELINE
-###############################################################################
-def process_entire_pipeline(user_query: str):
-    """
-    If VERBOSITY=0, we hide Agent #1 plan and Agent #2 output expansions,
-    otherwise we show them.
-    """
-    st.session_state["agent2_image_file_ids"].clear()
-
-    # 1) AGENT #1
-    agent1_plan = run_agent_1(user_query)
-
-    if VERBOSITY > 0:
-        with st.expander("Agent #1 Plan & Code", expanded=False):
-            st.text(agent1_plan)
-
-    # parse plan
-    plan_type = "quantitative"
-    analysis_output = ""
-    try:
-        parsed_plan = json.loads(agent1_plan)
-        plan_type = parsed_plan.get("type","quantitative")
-    except:
-        parsed_plan = {}
-
-    # 2) If quant => code with Agent #2, else => local snippet
-    if plan_type == "quantitative":
-        code_ = parsed_plan.get("code","")
-        analysis_output = run_agent_2(code_)
-        if VERBOSITY > 0:
-            with st.expander("Agent #2 Output", expanded=False):
-                st.text(analysis_output)
-        agent3_out = run_agent_3_quant(user_query, agent1_plan, analysis_output)
-    else:
-        col_ = parsed_plan.get("column","")
-        prompt_ = parsed_plan.get("prompt","")
-        analysis_output = run_local_llm_on_text(col_, prompt_)
-        if VERBOSITY > 0:
-            with st.expander("Local LLM (Qualitative) Output", expanded=False):
-                st.text(analysis_output)
-        agent3_out = run_agent_3_qual(user_query, agent1_plan, analysis_output)
-
-    # 3) Final summary displayed full-width
-    st.divider()
-    st.markdown("## Final Response")
-    st.markdown(agent3_out)
-
-    # 4) Possibly show images
-    display_images_after_agent3()
-
-    # 5) Cache final summary + user query for PDF
-    st.session_state["final_summary_markdown"] = agent3_out
-    st.session_state["user_query_for_pdf"] = user_query
-
-    st.success("All steps completed.")
-
-###############################################################################
-# 11) RESET & FOLLOW-UP
+# 9) RESET & FOLLOW-UP
 ###############################################################################
 def reset_everything():
     st.session_state["agent1_messages"] = []
     st.session_state["agent2_combined_outputs"] = ""
-    st.session_state["agent2_image_file_ids"].clear()
+    st.session_state["active_job_id"] = None
+    st.session_state["finished_job_id"] = None
+    st.query_params.pop("job", None)
     st.session_state["final_summary_markdown"] = ""
     st.session_state["cached_images"] = []
+    st.session_state["pdf_bytes"] = (None, None)
+    if st.session_state.get("agent2_thread_id"):
+        get_pipeline_engine().release_thread(st.session_state["agent2_thread_id"])
     st.session_state["agent2_thread_id"] = None
     st.session_state["user_query_for_pdf"] = ""
     st.rerun()
 
 ###############################################################################
-# 12) DOWNLOAD PDF
+# 10) DOWNLOAD PDF
 ###############################################################################
 def download_pdf():
     """Generate a PDF with the user's query, final summary, and images."""
@@ -635,11 +748,16 @@ def download_pdf():
         st.warning("No final summary to download yet.")
         return
 
-    user_query = st.session_state.get("user_query_for_pdf","(no query saved)")
-    summary_markdown = st.session_state["final_summary_markdown"]
-    images = st.session_state["cached_images"]
+    job_id = st.session_state["finished_job_id"]
+    built_for, pdf_data = st.session_state["pdf_bytes"]
+    if pdf_data is None or built_for != job_id:
+        user_query = st.session_state.get("user_query_for_pdf","(no query saved)")
+        summary_markdown = st.session_state["final_summary_markdown"]
+        images = st.session_state["cached_images"]
 
-    pdf_data = generate_pdf(user_query, summary_markdown, images)
+        with get_pipeline_engine().tracer.span("generate_pdf", trace_id=job_id, images=len(images)):
+            pdf_data = generate_pdf(user_query, summary_markdown, images)
+        st.session_state["pdf_bytes"] = (job_id, pdf_data)
     st.download_button(
         label="Download Results as PDF",
         data=pdf_data,
@@ -656,13 +774,18 @@ with tab1:
     user_input = st.text_area("Enter your question:", placeholder=prompt_placeholder)
 
     # Single row for submit
-    if st.button("Submit Query"):
+    if st.button("Submit Query", disabled=st.session_state["active_job_id"] is not None):
         if user_input.strip():
-            process_entire_pipeline(user_input.strip())
+            submit_query(user_input.strip())
             st.session_state["next_prompt_type"] = "Ask a follow-up question..."
         else:
             st.warning("Please enter a non-empty question.")
 
+    if st.session_state["active_job_id"] is not None:
+        poll_active_job()
+    elif st.session_state["finished_job_id"] is not None:
+        show_finished_job()
+
     st.divider()
     # Follow-up / New Q / Download PDF
     c1, c2, c3 = st.columns([1,1,1])
@@ -678,3 +801,44 @@ with tab1:
 
     with c3:
         download_pdf()
+
+    # Plan cache admin (only with VERBOSITY > 0)
+    if VERBOSITY > 0 and PLAN_CACHE_ENABLED:
+        with st.expander("Plan Cache", expanded=False):
+            plan_cache = get_plan_cache()
+            st.write(plan_cache.stats)
+            last_q = st.session_state["last_agent1_query"]
+            if last_q and st.session_state["last_agent1_plan"]:
+                if plan_cache.is_pinned(last_q):
+                    if st.button("Unpin plan for last question"):
+                        plan_cache.unpin(last_q)
+                        st.info("Plan unpinned.")
+                elif st.button("Pin plan for last question"):
+                    plan_cache.pin(last_q, st.session_state["last_agent1_plan"])
+                    st.info("Plan pinned.")
+
+    # Rate limiter / thread pool metrics (only with VERBOSITY > 0)
+    if VERBOSITY > 0:
+        with st.expander("OpenAI Rate Limiter", expanded=False):
+            st.write(get_pipeline_engine().limiter.stats())
+        with st.expander("Trace (last query)", expanded=False):
+            trace_id = st.session_state["finished_job_id"] or st.session_state["active_job_id"]
+            spans = get_pipeline_engine().tracer.spans(trace_id) if trace_id else []
+            if spans:
+                st.dataframe(pd.DataFrame([
+                    {"span": s_["name"], "status": s_["status"]["code"], **s_["attributes"]} for s_ in spans
+                ]))
+            else:
+                st.write("No spans recorded yet.")
+        with st.expander("Token Usage & Prompt Cache", expanded=False):
+            st.write(get_pipeline_engine().usage_summary())
+            st.dataframe(pd.DataFrame(list(get_pipeline_engine().usage_log)[-20:]))
+        if ANALYTIC_CUBE_ENABLED:
+            with st.expander("Analytic Cube", expanded=False):
+                st.write(get_analytic_cube().stats())
+        if get_pipeline_engine().router is not None:
+            with st.expander("Fast-Path Router", expanded=False):
+                st.write(get_pipeline_engine().router.stats)
+        if get_pipeline_engine().ci_pool is not None:
+            with st.expander("Code Interpreter Pool", expanded=False):
+                st.write(get_pipeline_engine().ci_pool.stats())
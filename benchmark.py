@@ -0,0 +1,214 @@
+"""
+Offline benchmark for the three-agent pipeline. Record the OpenAI traffic
+of a fixed question corpus once, then replay it any number of times with
+no network and no API spend:
+
+    python benchmark.py record --questions bench_questions.json --fixtures bench_fixtures.jsonl
+    python benchmark.py replay --fixtures bench_fixtures.jsonl --sessions 8 --repeat 5
+
+`record` needs API_KEY / ENCRYPTION_KEY (environment or .streamlit/secrets.toml)
+and the Code Interpreter assistant the app registered in .openai_registry.json
+(or --assistant-id). `replay` serves the fixtures from a local stand-in server
+(replay_server.py) in a child process, with the recorded latencies scaled by
+--latency (0 => as fast as possible), runs every question --repeat times on
+--sessions concurrent jobs, and reports end-to-end and per-stage p50/p95/p99,
+throughput, errors and peak RSS. Use --json to keep the report for comparing
+two commits.
+"""
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from collections import defaultdict
+
+import numpy as np
+import openai
+
+from pipeline import PipelineEngine, PipelineResources, PipelineConfig
+from image_cache import ImageCache
+from analytic_cube import AnalyticCube
+from text_digest import load_digests
+from replay_server import RecordingTransport, serve_forever
+from dataset import decrypt_dataset
+from build_text_digests import read_secret
+
+OPENAI_REGISTRY_PATH = ".openai_registry.json"
+REPLAY_API_KEY = "sk-replay"
+POLL_SECONDS = 0.05
+
+
+def registered_assistant_id() -> str:
+    """The most recently registered Code Interpreter assistant."""
+    try:
+        with open(OPENAI_REGISTRY_PATH, "r") as f:
+            entries = list(json.load(f).values())
+    except (OSError, ValueError):
+        entries = []
+    if not entries:
+        sys.exit(f"No assistant in {OPENAI_REGISTRY_PATH}; run the app once or pass --assistant-id")
+    return entries[-1]["assistant_id"]
+
+
+def build_engine(api_key: str, assistant_id: str, args, image_dir: str, client_options: dict,
+                 concurrency: int) -> PipelineEngine:
+    """
+    An engine configured like the app's, minus everything that would make
+    runs diverge from the recording: no answer/plan caches, no job store,
+    no pre-warmed threads, no embedding model, a fresh image cache.
+    """
+    csv_bytes, df = decrypt_dataset(read_secret("ENCRYPTION_KEY"))
+    resources = PipelineResources(
+        df=df,
+        assistant_id=assistant_id,
+        image_cache=ImageCache(image_dir, 200 * 1024 * 1024),
+        digests=load_digests(read_secret("ENCRYPTION_KEY"), csv_bytes),
+        analytic_cube=AnalyticCube(df),
+    )
+    config = PipelineConfig(
+        agent1_schema_variant=args.schema_variant,
+        qual_retrieval_enabled=False,
+        ci_pool_size=0,
+        max_concurrent_jobs=concurrency,
+        max_finished_jobs=10_000,
+    )
+    return PipelineEngine(api_key, resources, config, client_options=client_options)
+
+
+def run_jobs(engine: PipelineEngine, questions: list, repeat: int) -> tuple:
+    """Submit questions x repeat at once and wait for all; returns (jobs, wall seconds)."""
+    start = time.time()
+    job_ids = [engine.submit(q) for _ in range(repeat) for q in questions]
+    while True:
+        jobs = [engine.get(job_id) for job_id in job_ids]
+        if all(j.finished for j in jobs):
+            return jobs, time.time() - start
+        time.sleep(POLL_SECONDS)
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"n": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"n": len(values), "p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3)}
+
+
+def build_report(engine: PipelineEngine, jobs: list, wall_seconds: float) -> dict:
+    stage_seconds = defaultdict(list)
+    for job in jobs:
+        for span in engine.tracer.spans(job.id):
+            stage_seconds[span["name"]].append(span["attributes"]["wall_seconds"])
+    ok = [j for j in jobs if j.status == "done"]
+    return {
+        "jobs": len(jobs),
+        "errors": len(jobs) - len(ok),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_jobs_per_second": round(len(jobs) / wall_seconds, 3) if wall_seconds else 0.0,
+        "end_to_end_seconds": percentiles([j.finished_at - j.created_at for j in ok]),
+        "stage_seconds": {name: percentiles(v) for name, v in sorted(stage_seconds.items())},
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "usage": engine.usage_summary(),
+    }
+
+
+def print_report(report: dict):
+    print(f"\n{report['jobs']} jobs, {report['errors']} errors, {report['wall_seconds']}s wall, "
+          f"{report['throughput_jobs_per_second']} jobs/s, peak RSS {report['peak_rss_mb']} MB")
+    rows = [("end-to-end", report["end_to_end_seconds"])] + list(report["stage_seconds"].items())
+    print(f"\n{'stage':<24}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, p in rows:
+        if p["n"]:
+            print(f"{name:<24}{p['n']:>6}{p['p50']:>10}{p['p95']:>10}{p['p99']:>10}")
+    if "replay" in report:
+        print(f"\nreplay server: {report['replay']}")
+
+
+def record(args):
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+    assistant_id = args.assistant_id or registered_assistant_id()
+    transport = RecordingTransport(args.fixtures, meta={"assistant_id": assistant_id, "questions": questions})
+    image_dir = tempfile.mkdtemp(prefix="bench-images-")
+    try:
+        engine = build_engine(
+            read_secret("API_KEY"), assistant_id, args, image_dir,
+            {"http_client": openai.DefaultAsyncHttpxClient(transport=transport)},
+            concurrency=1,  # one at a time, so every question gets its own clean recording
+        )
+        jobs, wall_seconds = run_jobs(engine, questions, repeat=1)
+    finally:
+        shutil.rmtree(image_dir, ignore_errors=True)
+    for job in jobs:
+        print(f"[{job.status}] {job.query}" + (f" -- {job.error}" if job.error else ""))
+    print(f"Recorded {len(jobs)} questions in {wall_seconds:.1f}s to {args.fixtures}")
+
+
+def replay(args):
+    ctx = multiprocessing.get_context("spawn")  # keeps the server's memory out of our RSS
+    conn, child_conn = ctx.Pipe()
+    server = ctx.Process(target=serve_forever, args=(args.fixtures, args.latency, child_conn), daemon=True)
+    server.start()
+    base_url = conn.recv()
+
+    with open(args.fixtures, "r", encoding="utf-8") as f:
+        meta = json.loads(f.readline()).get("meta", {})
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = json.load(f)
+    else:
+        questions = meta.get("questions", [])
+    image_dir = tempfile.mkdtemp(prefix="bench-images-")
+    try:
+        engine = build_engine(
+            REPLAY_API_KEY, meta.get("assistant_id", "asst_replay"), args, image_dir,
+            {"base_url": base_url}, concurrency=args.sessions,
+        )
+        jobs, wall_seconds = run_jobs(engine, questions, args.repeat)
+        report = build_report(engine, jobs, wall_seconds)
+        conn.send("stats")
+        report["replay"] = conn.recv()
+    finally:
+        conn.send("stop")
+        server.join(5)
+        shutil.rmtree(image_dir, ignore_errors=True)
+    report.update(sessions=args.sessions, repeat=args.repeat, latency_scale=args.latency)
+
+    print_report(report)
+    for job in jobs:
+        if job.status != "done":
+            print(f"  error: {job.query[:60]} -- {job.error}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("record", help="run the corpus against the real API and save the traffic")
+    p.add_argument("--questions", default="bench_questions.json")
+    p.add_argument("--assistant-id")
+    p.set_defaults(func=record)
+
+    p = sub.add_parser("replay", help="run the corpus against the recorded traffic and report latencies")
+    p.add_argument("--questions", help="defaults to the questions stored in the fixtures")
+    p.add_argument("--sessions", type=int, default=1, help="concurrent jobs")
+    p.add_argument("--repeat", type=int, default=1, help="times each question is asked")
+    p.add_argument("--latency", type=float, default=1.0, help="scale on recorded latencies (0 => none)")
+    p.add_argument("--json", help="also write the report to this file")
+    p.set_defaults(func=replay)
+
+    for p in sub.choices.values():
+        p.add_argument("--fixtures", default="bench_fixtures.jsonl")
+        p.add_argument("--schema-variant", default="full", choices=("full", "compact"))
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
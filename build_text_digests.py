@@ -0,0 +1,47 @@
+"""
+Offline build step for the per-column text digests used by the qualitative
+path in app.py. Run it whenever the dataset changes:
+
+    python build_text_digests.py
+
+Reads API_KEY / ENCRYPTION_KEY from the environment or .streamlit/secrets.toml
+and writes super_cleaned_data.digests.json.encrypted next to the encrypted CSV.
+"""
+import os
+import sys
+import tomllib
+
+from openai import OpenAI
+
+from prompts import dataset_context
+from dataset import decrypt_dataset
+from plan_cache import schema_version
+from schema import open_ended_text_columns
+from text_digest import build_digests, save_digests, DIGESTS_PATH
+
+
+def read_secret(name: str) -> str:
+    if os.environ.get(name):
+        return os.environ[name]
+    try:
+        with open(os.path.join(".streamlit", "secrets.toml"), "rb") as f:
+            return tomllib.load(f)[name]
+    except (OSError, KeyError):
+        sys.exit(f"Missing secret {name} (set it in the environment or .streamlit/secrets.toml)")
+
+
+def main():
+    encryption_key = read_secret("ENCRYPTION_KEY")
+    client = OpenAI(api_key=read_secret("API_KEY"))
+
+    csv_bytes, df = decrypt_dataset(encryption_key)
+
+    columns = open_ended_text_columns()
+    print(f"Building digests for {len(columns)} open-ended columns...")
+    artifact = build_digests(client, df, columns, csv_bytes, schema_version(dataset_context))
+    save_digests(artifact, encryption_key)
+    print(f"Wrote {len(artifact['columns'])} column digests to {DIGESTS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
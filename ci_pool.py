@@ -0,0 +1,157 @@
+import time
+import asyncio
+import threading
+from collections import deque
+
+
+class CodeInterpreterPool:
+    """
+    Pool of pre-warmed Code Interpreter threads, shared by all sessions.
+
+    A warm thread has already run one short warm-up (`warm_up(thread_id)`,
+    which also deletes the warm-up's messages), so its sandbox is started
+    and the dataset loaded before any query needs it, with no conversation
+    history. A lease hands out a thread no one else has used; the pool
+    refills itself in the background to `size` idle threads.
+
+    Leases are per conversation, not per query: the engine leases on a
+    conversation's first Agent #2 run, and its follow-ups reuse that
+    thread, since Agent #2 needs the earlier turns' context (the thread is
+    deleted on "New Question").
+
+    Idle threads older than `idle_seconds` are deleted and replaced, since
+    their sandboxes expire. A lease waits up to `lease_timeout` for a thread
+    that is still warming, then falls back to a cold `create_thread()`.
+
+    Every warm-up is a paid run, so the pool only refills while it's in
+    use: with no lease for `active_seconds` it stops warming and lets its
+    idle threads expire, and the next lease (cold) starts it again.
+
+    Runs on the engine's asyncio loop; `stats()` is safe from any thread.
+    """
+
+    def __init__(self, create_thread, warm_up, delete_thread, size: int = 2,
+                 idle_seconds: float = 1200, lease_timeout: float = 5.0, active_seconds: float = 1800):
+        self.create_thread = create_thread
+        self.warm_up = warm_up
+        self.delete_thread = delete_thread
+        self.size = size
+        self.idle_seconds = idle_seconds
+        self.lease_timeout = lease_timeout
+        self.active_seconds = active_seconds
+        self._last_lease = time.time()  # starting up counts as demand, so the first query finds a warm thread
+        self._idle = deque()        # (thread_id, warmed_at), oldest first
+        self._warming = 0
+        self._cond = asyncio.Condition()
+        self._tasks = set()
+        self._stats = {
+            "leases": 0, "warm_hits": 0, "lease_wait_seconds": 0.0,
+            "max_lease_wait_seconds": 0.0, "warm_ups": 0, "warm_up_failures": 0, "recycled": 0,
+        }
+        self._stats_lock = threading.Lock()
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def start(self):
+        """Begin warming threads and recycling stale ones (call on the engine loop)."""
+        self._fill()
+        self._spawn(self._maintain())
+
+    def _paused(self) -> bool:
+        return time.time() - self._last_lease > self.active_seconds
+
+    def _fill(self):
+        if self._paused():
+            return
+        for _ in range(self.size - len(self._idle) - self._warming):
+            self._warming += 1
+            self._spawn(self._warm_one())
+
+    async def _warm_one(self):
+        try:
+            thread_id = await self.create_thread()
+            await self.warm_up(thread_id)
+        except Exception:
+            with self._stats_lock:
+                self._stats["warm_up_failures"] += 1
+            thread_id = None
+        async with self._cond:
+            self._warming -= 1
+            if thread_id is not None:
+                self._idle.append((thread_id, time.time()))
+                with self._stats_lock:
+                    self._stats["warm_ups"] += 1
+            self._cond.notify_all()
+
+    def _recycle_stale(self):
+        cutoff = time.time() - self.idle_seconds
+        while self._idle and self._idle[0][1] < cutoff:
+            thread_id, _ = self._idle.popleft()
+            self._spawn(self._delete(thread_id))
+            with self._stats_lock:
+                self._stats["recycled"] += 1
+
+    async def _delete(self, thread_id: str):
+        try:
+            await self.delete_thread(thread_id)
+        except Exception:
+            pass
+
+    def _delete_when_created(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is None:
+            self._spawn(self._delete(task.result()))
+
+    async def _maintain(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_seconds / 4))
+            async with self._cond:
+                self._recycle_stale()
+                self._fill()
+
+    async def lease(self) -> str:
+        """A clean thread for one query: warm if available, else created cold."""
+        start = time.monotonic()
+        thread_id = None
+        async with self._cond:
+            self._last_lease = time.time()
+            self._recycle_stale()
+            if not self._idle and self._warming:
+                try:
+                    await asyncio.wait_for(
+                        self._cond.wait_for(lambda: self._idle or not self._warming),
+                        self.lease_timeout,
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            if self._idle:
+                thread_id, _ = self._idle.popleft()
+            self._fill()
+        warm = thread_id is not None
+        if not warm:
+            # Shielded: a lease cancelled mid-create would otherwise leave the new thread orphaned
+            create = asyncio.ensure_future(self.create_thread())
+            try:
+                thread_id = await asyncio.shield(create)
+            except asyncio.CancelledError:
+                create.add_done_callback(self._delete_when_created)
+                raise
+        waited = time.monotonic() - start
+        with self._stats_lock:
+            self._stats["leases"] += 1
+            self._stats["warm_hits"] += int(warm)
+            self._stats["lease_wait_seconds"] += waited
+            self._stats["max_lease_wait_seconds"] = max(self._stats["max_lease_wait_seconds"], waited)
+        return thread_id
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            s = dict(self._stats)
+        s["idle"] = len(self._idle)
+        s["warming"] = self._warming
+        s["paused"] = self._paused()
+        s["warm_hit_rate"] = s["warm_hits"] / s["leases"] if s["leases"] else 0.0
+        s["avg_lease_wait_seconds"] = s["lease_wait_seconds"] / s["leases"] if s["leases"] else 0.0
+        return s
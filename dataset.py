@@ -0,0 +1,17 @@
+from io import BytesIO
+
+import pandas as pd
+from cryptography.fernet import Fernet
+
+ENCRYPTED_CSV_PATH = "super_cleaned_data.csv.encrypted"
+
+
+def decrypt_dataset(encryption_key: str, encrypted_path: str = ENCRYPTED_CSV_PATH) -> tuple:
+    """
+    Decrypt the survey CSV with `encryption_key` (the base64 Fernet key it
+    was encrypted with). Returns (plaintext CSV bytes, DataFrame).
+    """
+    with open(encrypted_path, "rb") as f:
+        csv_bytes = Fernet(encryption_key).decrypt(f.read())
+    # low_memory=False => infer each column's dtype from the whole file at once
+    return csv_bytes, pd.read_csv(BytesIO(csv_bytes), low_memory=False)
@@ -0,0 +1,130 @@
+import re
+import math
+import threading
+from collections import Counter
+
+from schema import parse_dataset_context
+
+# Anything asking for reasons, relationships, filters or text insights goes to the full pipeline
+# ("with", "who", "whose", ... restrict the population, which a whole-column count would ignore)
+_ANALYTICAL = re.compile(
+    r"\b(with|without|who|whose|whom|where|if|"
+    r"why|predict\w*|factors?|correlat\w*|relat\w*|associat\w*|compar\w*|impact\w*|influenc\w*|"
+    r"driv\w*|explain\w*|caus\w*|effects?|trends?|differ\w*|vary|varies|variation|versus|vs|by|across|"
+    r"between|among|each|per|segment\w*|group\w*|quotes?|insights?|themes?|sentiments?|suggest\w*|"
+    r"recommend\w*|ideas?|feel\w*|think\w*|opinions?|reasons?|barriers?|more|less|than|over|under|"
+    r"above|below|at least|at most|only|excluding|except|not)\b",
+    re.I,
+)
+_COUNT = re.compile(
+    r"\b(how many|number of|count|percent\w*|share|proportion|fraction|distribution|breakdown|"
+    r"most common|least common|most popular|split)\b",
+    re.I,
+)
+_MEAN = re.compile(r"\b(average|mean|median|typical)\b", re.I)
+_STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "do", "does", "did", "is", "are", "was", "were",
+    "be", "been", "have", "has", "had", "you", "your", "our", "their", "they", "we", "it", "its",
+    "and", "or", "with", "about", "this", "that", "these", "those", "there", "as", "at", "from",
+    "how", "many", "what", "which", "who", "whose", "when", "where", "percent", "percentage", "share",
+    "proportion", "fraction", "distribution", "breakdown", "number", "count", "most", "least",
+    "common", "popular", "split", "average", "mean", "median", "typical", "respondent", "people",
+    "shluchim", "shliach", "survey", "answer", "say", "said", "overall", "total", "all", "any",
+    "e", "g", "etc", "s",
+}
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ed", "es", "s", "e"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+            return word[: -len(suffix)]
+    return word
+
+
+def _terms(text: str) -> set:
+    return {_stem(w) for w in re.findall(r"[a-z]+", text.lower()) if w not in _STOPWORDS} - {""}
+
+
+class FastPathRouter:
+    """
+    Rule-based classifier in front of the pipeline. A question is routed to
+    the fast path only when it is a plain count / distribution / average
+    (no reasons, comparisons, filters or numbers) and its content words
+    pick out exactly one analytic cube column: matched against the
+    column's name, its schema type note and its answer options, weighted
+    by how rare each word is across columns. Everything else, including
+    any ambiguity, is escalated to the full pipeline.
+
+    `route(query)` returns a plan {"type": "fast", "column", "queries"} for
+    the cube, or None. `stats` counts routed vs escalated questions.
+    """
+
+    def __init__(self, cube, columns: list = None, min_query_coverage: float = 0.75,
+                 min_column_coverage: float = 0.3, min_margin: float = 0.2):
+        self.cube = cube
+        self.min_query_coverage = min_query_coverage
+        self.min_column_coverage = min_column_coverage
+        self.min_margin = min_margin
+        self.stats = {"fast": 0, "escalated": 0}
+        self._lock = threading.Lock()
+
+        schema = {c["name"]: c for c in (columns if columns is not None else parse_dataset_context())}
+        self._name_terms, self._all_terms = {}, {}
+        for name in cube.categorical + cube.measures:
+            c = schema.get(name, {})
+            type_note = re.findall(r"\(([^)]*)\)", c.get("type", ""))
+            self._name_terms[name] = _terms(name)
+            self._all_terms[name] = self._name_terms[name] | _terms(" ".join(type_note) + " " + c.get("samples", ""))
+        df = Counter(t for terms in self._all_terms.values() for t in terms)
+        n = len(self._all_terms)
+        self._idf = {t: math.log(1 + n / k) for t, k in df.items()}
+
+    def _weight(self, terms: set) -> float:
+        return sum(self._idf.get(t, 0.0) for t in terms)
+
+    def _match(self, query: str):
+        """The one cube column the query is about, or None if none / several fit."""
+        q_terms = _terms(query)
+        q_known = {t for t in q_terms if t in self._idf}
+        if not q_terms or len(q_known) < len(q_terms) - 1:  # more than one word the cube knows nothing about
+            return None
+        scored = []
+        for name, terms in self._all_terms.items():
+            matched = q_known & terms
+            if not matched:
+                continue
+            query_coverage = self._weight(matched) / self._weight(q_known)
+            column_coverage = self._weight(matched & self._name_terms[name]) / max(1e-9, self._weight(self._name_terms[name]))
+            scored.append((query_coverage + column_coverage, query_coverage, column_coverage, name))
+        if not scored:
+            return None
+        scored.sort(reverse=True)
+        score, query_coverage, column_coverage, name = scored[0]
+        if query_coverage < self.min_query_coverage or column_coverage < self.min_column_coverage:
+            return None
+        if len(scored) > 1 and score - scored[1][0] < self.min_margin:
+            return None
+        return name
+
+    def _classify(self, query: str):
+        if re.search(r"\d", query) or _ANALYTICAL.search(query):
+            return None
+        wants_count, wants_mean = bool(_COUNT.search(query)), bool(_MEAN.search(query))
+        if not (wants_count or wants_mean):
+            return None
+        column = self._match(query)
+        if column is None:
+            return None
+        if column in self.cube.measures:
+            op = {"op": "describe", "measure": column} if wants_mean else {"op": "counts", "column": column}
+        elif wants_mean:
+            return None
+        else:
+            op = {"op": "counts", "column": column}
+        return {"type": "fast", "column": column, "queries": [op]}
+
+    def route(self, query: str):
+        plan = self._classify(query)
+        with self._lock:
+            self.stats["fast" if plan else "escalated"] += 1
+        return plan
@@ -0,0 +1,125 @@
+import os
+import json
+import hashlib
+import threading
+
+# Plots that never came from the Files API (local execution, answer cache): not downloadable
+SYNTHETIC_ID_PREFIXES = ("local-", "cached-")
+
+
+class ImageCache:
+    """
+    Content-addressed on-disk cache for Code Interpreter output images.
+
+    Layout under `root`:
+      blobs/<sha256>   raw image bytes, one file per distinct content
+      index.json       {file_id: sha256}, so a known file_id never hits the network
+
+    Blob mtimes double as LRU timestamps (touched on every read); when the
+    total blob size exceeds `max_bytes` the least recently used blobs are
+    evicted, along with any file_ids that point at them. Blobs of the file
+    IDs returned by `pinned()` (e.g. those of answers still on screen) are
+    never evicted: synthetic IDs ("local-...", "cached-...") can't be
+    downloaded again.
+    Thread-safe; one instance is meant to be shared by the whole process.
+    """
+
+    def __init__(self, root: str, max_bytes: int, pinned=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.pinned = pinned    # () -> iterable of file_ids to keep, or None
+        self.blob_dir = os.path.join(root, "blobs")
+        self.index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest)
+
+    def _read_blob(self, digest: str):
+        path = self._blob_path(digest)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # mark as recently used
+            return data
+        except OSError:
+            return None
+
+    def get(self, file_id: str):
+        """Bytes for a file_id, or None if unknown / evicted."""
+        with self._lock:
+            digest = self._index.get(file_id)
+            if digest is None:
+                return None
+            data = self._read_blob(digest)
+            if data is None:
+                self._index.pop(file_id, None)
+                self._save_index()
+            return data
+
+    def digest_for(self, file_id: str):
+        with self._lock:
+            return self._index.get(file_id)
+
+    def get_by_digest(self, digest: str):
+        with self._lock:
+            return self._read_blob(digest)
+
+    def put(self, file_id: str, data: bytes) -> str:
+        """Store bytes under file_id; returns their sha256 digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        pinned_ids = set(self.pinned()) if self.pinned is not None else set()
+        with self._lock:
+            path = self._blob_path(digest)
+            if os.path.exists(path):
+                os.utime(path)
+            else:
+                tmp_path = path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            self._index[file_id] = digest
+            self._evict({digest} | {self._index[f] for f in pinned_ids if f in self._index})
+            self._save_index()
+        return digest
+
+    def _evict(self, keep: set):
+        blobs = []
+        total = 0
+        for name in os.listdir(self.blob_dir):
+            if name.endswith(".tmp"):
+                continue
+            st_ = os.stat(self._blob_path(name))
+            total += st_.st_size
+            if name not in keep:
+                blobs.append((st_.st_mtime, st_.st_size, name))
+        if total <= self.max_bytes:
+            return
+
+        evicted = set()
+        for _, size, name in sorted(blobs):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._blob_path(name))
+            except OSError:
+                continue
+            total -= size
+            evicted.add(name)
+        if evicted:
+            self._index = {fid: d for fid, d in self._index.items() if d not in evicted}
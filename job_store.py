@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+
+_FIELDS = (
+    "id", "query", "thread_id", "status", "stage", "plan", "plan_type", "analysis",
+    "summary", "image_file_ids", "images", "cached", "error", "created_at", "finished_at",
+    "owner",
+)
+_JSON_FIELDS = ("image_file_ids", "images")
+
+
+class JobStore:
+    """
+    SQLite-backed record of pipeline jobs. The engine checkpoints a job
+    after every stage (plan, analysis + image IDs, summary + resolved
+    images), so an interrupted job resumes from its last finished stage and
+    any session can reattach to a job by ID, even after a server restart.
+
+    Jobs are plain dicts with the pipeline.Job field names. Finished jobs
+    beyond `max_finished` are dropped oldest first. Thread-safe.
+
+    Several server processes may share one store. Each unfinished job is
+    claimed by the process running it ("<host>:<pid>:<instance>", set on
+    every save; the random instance ID tells a restarted container that
+    kept its hostname and PID apart from its dead predecessor) and kept
+    alive by `heartbeat()`. `claim_unfinished` only takes over jobs whose
+    process is gone: another instance under this host and PID, a dead pid
+    on this host, or no heartbeat for `stale_seconds`.
+    """
+
+    def __init__(self, path: str, max_finished: int = 500):
+        self.max_finished = max_finished
+        self.process_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id             TEXT PRIMARY KEY,
+                    query          TEXT NOT NULL,
+                    thread_id      TEXT,
+                    status         TEXT NOT NULL,
+                    stage          TEXT,
+                    plan           TEXT,
+                    plan_type      TEXT,
+                    analysis       TEXT,
+                    summary        TEXT,
+                    image_file_ids TEXT,
+                    images         TEXT,
+                    cached         TEXT,
+                    error          TEXT,
+                    created_at     REAL NOT NULL,
+                    finished_at    REAL,
+                    updated_at     REAL NOT NULL,
+                    owner          TEXT,
+                    claimed_by     TEXT,
+                    heartbeat_at   REAL
+                )
+                """
+            )
+            # Stores created before job ownership: add the columns in place
+            columns = {r[1] for r in self._db.execute("PRAGMA table_info(jobs)")}
+            for column, type_ in (("owner", "TEXT"), ("claimed_by", "TEXT"), ("heartbeat_at", "REAL")):
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {type_}")
+
+    def save(self, job: dict):
+        """Insert or overwrite the checkpoint for job["id"]."""
+        values = [
+            json.dumps(job[f]) if f in _JSON_FIELDS else job[f]
+            for f in _FIELDS
+        ]
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(_FIELDS)}, updated_at, claimed_by, heartbeat_at) "
+                f"VALUES ({', '.join('?' * len(_FIELDS))}, ?, ?, ?)",
+                values + [now, self.process_id, now],
+            )
+            if job["finished_at"] is not None:
+                self._db.execute(
+                    "DELETE FROM jobs WHERE id IN ("
+                    "SELECT id FROM jobs WHERE finished_at IS NOT NULL "
+                    "ORDER BY finished_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_finished,),
+                )
+
+    def _row_to_job(self, row) -> dict:
+        job = dict(zip(_FIELDS, row))
+        job["image_file_ids"] = json.loads(job["image_file_ids"] or "[]")
+        job["images"] = [tuple(i) for i in json.loads(job["images"] or "[]")]
+        return job
+
+    def load(self, job_id: str):
+        """The last checkpoint of `job_id` as a dict, or None if unknown."""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(_FIELDS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def heartbeat(self):
+        """Mark this process's unfinished jobs as still being worked on."""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE claimed_by = ? AND finished_at IS NULL",
+                (time.time(), self.process_id),
+            )
+
+    def _owner_alive(self, claimed_by, heartbeat_at, stale_seconds: float) -> bool:
+        if claimed_by is None or claimed_by == self.process_id:
+            return False
+        host, pid = (claimed_by.split(":") + [""])[:2]
+        if [host, pid] == self.process_id.split(":")[:2]:
+            return False  # an earlier instance with this host and PID: that process is gone
+        if host == socket.gethostname() and pid.isdigit():
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return False
+            except OSError:
+                pass  # exists, owned by another user
+        return heartbeat_at is not None and time.time() - heartbeat_at < stale_seconds
+
+    def claim_unfinished(self, stale_seconds: float) -> list:
+        """
+        Queued or interrupted jobs whose process is gone, oldest first,
+        claimed for this process (to resume). A job another process claims
+        first, or whose owner is still alive, is left alone.
+        """
+        claimed = []
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(_FIELDS)}, claimed_by, heartbeat_at FROM jobs "
+                "WHERE status IN ('queued', 'running') AND claimed_by IS NOT ? ORDER BY created_at",
+                (self.process_id,),
+            ).fetchall()
+            for row in rows:
+                claimed_by, heartbeat_at = row[-2:]
+                if self._owner_alive(claimed_by, heartbeat_at, stale_seconds):
+                    continue
+                with self._db:
+                    # compare-and-swap, so two processes can't both take the job over
+                    taken = self._db.execute(
+                        "UPDATE jobs SET claimed_by = ?, heartbeat_at = ? "
+                        "WHERE id = ? AND claimed_by IS ? AND heartbeat_at IS ?",
+                        (self.process_id, time.time(), row[0], claimed_by, heartbeat_at),
+                    ).rowcount
+                if taken:
+                    claimed.append(self._row_to_job(row[:len(_FIELDS)]))
+        return claimed
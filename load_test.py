@@ -0,0 +1,266 @@
+"""
+Load test for one app server process: drives M simulated Streamlit sessions
+through app.py at once against a mocked OpenAI backend (mock_openai.py),
+to find how many concurrent sessions one process can carry.
+
+    python load_test.py --sessions 1,4,8,16 --followups 1
+
+Each session is a streamlit.testing AppTest running the real app.py in
+this process, so all of them share the process-wide resources exactly as
+browser sessions do (dataset, pipeline engine, caches); their script runs
+are serialized (see _script_run_lock). A session:
+opens the app, submits a question, polls until the answer is done, asks
+--followups follow-up questions, then reruns once more with the PDF built.
+
+Per step (one value of --sessions) it reports: time to first paint (first
+full script run of a fresh session), query latency p50/p95, PDF rerun
+time, st.session_state growth per session, CPU used by this process,
+peak RSS, error rate, and the mock's request counts (e.g. how many
+assistants were created). The largest step with no errors and p95 query
+latency within --slo is reported as the ceiling.
+
+Runs from a scratch directory holding symlinks to the repo, so the
+registry, caches and job store it creates never touch the real ones.
+ENCRYPTION_KEY comes from the environment or .streamlit/secrets.toml;
+no API key is needed.
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import argparse
+import resource
+import tempfile
+import threading
+import multiprocessing
+
+import numpy as np
+import streamlit.testing.v1.app_test as app_test
+import streamlit.testing.v1.local_script_runner as local_script_runner
+from streamlit.testing.v1 import AppTest
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+from mock_openai import serve_forever
+from build_text_digests import read_secret
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+MOCK_API_KEY = "sk-mock"
+POLL_SECONDS = 0.5          # as JOB_POLL_SECONDS in app.py
+
+# AppTest swaps process-global Streamlit state (the runtime, secrets) for
+# the duration of each script run, so runs can't overlap. Sessions still
+# interleave between runs, and pipeline jobs, backend latency and polling
+# waits all overlap; in the real server script runs share the GIL anyway.
+_script_run_lock = threading.Lock()
+
+
+def make_scratch_dir(secrets: dict, repo_dir: str = REPO_DIR) -> str:
+    """
+    A temp dir with the repo's files symlinked in (no local state: registry,
+    caches, jobs) and its own .streamlit/secrets.toml holding `secrets`.
+    """
+    scratch = tempfile.mkdtemp(prefix="load-test-")
+    for name in os.listdir(repo_dir):
+        if not name.startswith("."):
+            os.symlink(os.path.join(repo_dir, name), os.path.join(scratch, name))
+    os.mkdir(os.path.join(scratch, ".streamlit"))
+    config_path = os.path.join(repo_dir, ".streamlit", "config.toml")
+    if os.path.exists(config_path):
+        os.symlink(config_path, os.path.join(scratch, ".streamlit", "config.toml"))
+    with open(os.path.join(scratch, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+        f.writelines(f"{k} = {json.dumps(v)}\n" for k, v in secrets.items())
+    return scratch
+
+
+def share_script_cache():
+    """
+    Compile app.py once for all sessions, as the real server does, rather
+    than on every simulated rerun (AppTest builds a ScriptCache per run).
+    """
+    shared = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: shared
+
+
+def state_bytes(at: AppTest) -> int:
+    """Approximate size of a session's st.session_state (pickled size per value)."""
+    total = 0
+    for value in at.session_state.to_dict().values():
+        try:
+            total += len(pickle.dumps(value))
+        except Exception:
+            total += sys.getsizeof(value)
+    return total
+
+
+def _click(at: AppTest, label: str):
+    button = next((b for b in at.button if b.label == label), None)
+    if button is None:
+        raise RuntimeError(f"no {label!r} button on the page")
+    button.click()
+
+
+def _run(at: AppTest):
+    with _script_run_lock:
+        at.run()
+
+
+def _errors(at: AppTest) -> list:
+    return [e.value for e in at.exception] + [e.value for e in at.error]
+
+
+def run_session(app_path: str, questions: list, timeout: float) -> dict:
+    """One simulated user: open, ask, follow up, download. Never raises."""
+    result = {"first_paint_seconds": None, "query_seconds": [], "pdf_seconds": None,
+              "state_growth_bytes": None, "errors": []}
+    try:
+        at = AppTest.from_file(app_path, default_timeout=timeout)  # secrets come from the scratch dir
+        start = time.monotonic()
+        _run(at)
+        result["first_paint_seconds"] = time.monotonic() - start
+        result["errors"] += _errors(at)
+        baseline = state_bytes(at)
+
+        for i, question in enumerate(questions):
+            if i:
+                _click(at, "Follow Up Question")
+                _run(at)
+            at.text_area[0].input(question)
+            _click(at, "Submit Query")
+            start = time.monotonic()
+            _run(at)
+            while at.session_state["active_job_id"] is not None:
+                if time.monotonic() - start > timeout:
+                    raise TimeoutError(f"no answer after {timeout:.0f}s")
+                time.sleep(POLL_SECONDS)
+                _run(at)
+            result["query_seconds"].append(time.monotonic() - start)
+            result["errors"] += _errors(at)
+
+        start = time.monotonic()
+        _run(at)  # what clicking the download button costs: a full rerun that rebuilds the PDF
+        result["pdf_seconds"] = time.monotonic() - start
+        if not at.get("download_button"):
+            result["errors"].append("no PDF download button")
+        result["errors"] += _errors(at)
+        result["state_growth_bytes"] = state_bytes(at) - baseline
+    except Exception as e:
+        result["errors"].append(f"{type(e).__name__}: {e}")
+    return result
+
+
+def _p(values: list, q: float):
+    return round(float(np.percentile(values, q)), 3) if values else None
+
+
+def run_step(app_path: str, corpus: list, sessions: int, followups: int,
+             ramp: float, timeout: float, step: int) -> dict:
+    """Run `sessions` concurrent sessions and summarize them."""
+    results = [None] * sessions
+
+    def user(n):
+        time.sleep(ramp * n / sessions)
+        questions = [
+            # distinct wording per session, so the answer cache doesn't short-circuit the pipeline
+            f"{corpus[(n + i) % len(corpus)]} (load test {step}.{n}.{i})" for i in range(1 + followups)
+        ]
+        results[n] = run_session(app_path, questions, timeout)
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.monotonic()
+    threads = [threading.Thread(target=user, args=(n,), name=f"session-{n}") for n in range(sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.monotonic() - start
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+
+    first_paint = [r["first_paint_seconds"] for r in results if r["first_paint_seconds"] is not None]
+    queries = [s for r in results for s in r["query_seconds"]]
+    pdf = [r["pdf_seconds"] for r in results if r["pdf_seconds"] is not None]
+    growth = [r["state_growth_bytes"] for r in results if r["state_growth_bytes"] is not None]
+    failed = [r for r in results if r["errors"]]
+    return {
+        "sessions": sessions,
+        "wall_seconds": round(wall, 2),
+        "error_rate": round(len(failed) / sessions, 3),
+        "errors": sorted({str(e)[:200] for r in failed for e in r["errors"]}),
+        "first_paint_p50": _p(first_paint, 50), "first_paint_p95": _p(first_paint, 95),
+        "query_p50": _p(queries, 50), "query_p95": _p(queries, 95),
+        "pdf_rerun_p50": _p(pdf, 50), "pdf_rerun_p95": _p(pdf, 95),
+        "state_growth_avg_bytes": int(np.mean(growth)) if growth else None,
+        "state_growth_max_bytes": max(growth) if growth else None,
+        "cpu_seconds": round(cpu, 2),
+        "cpu_cores_used": round(cpu / wall, 2) if wall else 0.0,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def print_step(report: dict):
+    print(
+        f"\n== {report['sessions']} sessions ({report['wall_seconds']}s) ==\n"
+        f"  first paint  p50 {report['first_paint_p50']}s  p95 {report['first_paint_p95']}s\n"
+        f"  query        p50 {report['query_p50']}s  p95 {report['query_p95']}s\n"
+        f"  PDF rerun    p50 {report['pdf_rerun_p50']}s  p95 {report['pdf_rerun_p95']}s\n"
+        f"  session_state growth  avg {report['state_growth_avg_bytes']} B  max {report['state_growth_max_bytes']} B\n"
+        f"  CPU {report['cpu_seconds']}s ({report['cpu_cores_used']} cores)  peak RSS {report['peak_rss_mb']} MB\n"
+        f"  error rate {report['error_rate']:.0%}"
+    )
+    for error in report["errors"][:5]:
+        print(f"    - {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", default="1,4,8,16", help="comma-separated concurrency steps")
+    parser.add_argument("--followups", type=int, default=1, help="follow-up questions per session")
+    parser.add_argument("--questions", default="bench_questions.json")
+    parser.add_argument("--latency", type=float, default=1.0, help="scale on the mock's latencies (0 => none)")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which a step's sessions start")
+    parser.add_argument("--timeout", type=float, default=300, help="per script run and per query, seconds")
+    parser.add_argument("--slo", type=float, default=60, help="p95 query latency a step must stay within")
+    parser.add_argument("--json", help="also write the reports to this file")
+    args = parser.parse_args()
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    secrets = {"API_KEY": MOCK_API_KEY, "ENCRYPTION_KEY": read_secret("ENCRYPTION_KEY")}
+
+    ctx = multiprocessing.get_context("spawn")  # keeps the mock's CPU and memory out of the numbers
+    conn, child_conn = ctx.Pipe()
+    mock = ctx.Process(target=serve_forever, args=(args.latency, child_conn), daemon=True)
+    mock.start()
+    os.environ["OPENAI_BASE_URL"] = conn.recv()  # picked up by every OpenAI client the app creates
+
+    scratch = make_scratch_dir(secrets)
+    os.chdir(scratch)
+    share_script_cache()
+    reports = []
+    try:
+        for step, sessions in enumerate(int(s) for s in args.sessions.split(",")):
+            report = run_step(os.path.join(scratch, "app.py"), corpus, sessions,
+                              args.followups, args.ramp, args.timeout, step)
+            conn.send("stats")
+            report["mock_requests"] = conn.recv()
+            reports.append(report)
+            print_step(report)
+    finally:
+        conn.send("stop")
+        mock.join(5)
+        os.chdir(REPO_DIR)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    passing = [r for r in reports if r["error_rate"] == 0 and (r["query_p95"] or 0) <= args.slo]
+    ceiling = max((r["sessions"] for r in passing), default=0)
+    print(f"\nConcurrency ceiling (no errors, p95 query <= {args.slo}s): {ceiling} sessions")
+    print(f"Mock requests (cumulative): {json.dumps(reports[-1]['mock_requests'] if reports else {}, indent=2)}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"steps": reports, "ceiling": ceiling}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
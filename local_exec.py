@@ -0,0 +1,490 @@
+import io
+import os
+import ast
+import time
+import queue
+import shutil
+import tempfile
+import threading
+import platform
+import traceback
+import sysconfig
+import contextlib
+import multiprocessing as mp
+
+# Set in each worker's environment from process start, before anything imports numpy (including a
+# re-import of the parent's __main__ by "spawn"). One job per worker per core: no per-core BLAS threads
+# and buffers in each.
+# Arrow's jemalloc background thread is off because isolation needs a single-threaded process.
+WORKER_ENV = {"OPENBLAS_NUM_THREADS": "1", "OMP_NUM_THREADS": "1", "MKL_NUM_THREADS": "1",
+              "JE_ARROW_MALLOC_CONF": "background_thread:false"}
+_spawn_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _worker_environment():
+    """os.environ + WORKER_ENV while a worker is spawned (it inherits the parent's environment)."""
+    with _spawn_lock:
+        saved = {k: os.environ.get(k) for k in WORKER_ENV}
+        os.environ.update(WORKER_ENV)
+        try:
+            yield
+        finally:
+            for k, v in saved.items():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
+
+
+# Linux namespace / mount constants (<sched.h>, <sys/mount.h>, <sys/prctl.h>)
+CLONE_NEWNS = 0x00020000
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+MS_RDONLY, MS_NOSUID, MS_NODEV, MS_NOEXEC = 1, 2, 4, 8
+MS_REMOUNT, MS_BIND, MS_REC, MS_PRIVATE = 32, 4096, 16384, 1 << 18
+MS_LOCKED_FLAGS = MS_NOEXEC | 1024 | 2048 | 4096  # noexec, noatime, nodiratime, relatime: must be kept
+MNT_DETACH = 2
+PR_CAPBSET_DROP, PR_SET_NO_NEW_PRIVS = 24, 38
+SYS_PIVOT_ROOT = {"x86_64": 155, "aarch64": 217}
+SANDBOX_WORKDIR = "/work"   # job code's cwd (and TMPDIR) inside the isolated root
+NOBODY = 65534              # uid/gid isolated workers switch to when the server runs as root
+
+
+class IsolationError(RuntimeError):
+    pass
+
+
+def _libc():
+    import ctypes
+    import ctypes.util
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    libc.mount.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_ulong, ctypes.c_void_p]
+    libc.umount2.argtypes = [ctypes.c_char_p, ctypes.c_int]
+    libc.syscall.argtypes = [ctypes.c_long, ctypes.c_char_p, ctypes.c_char_p]
+    return libc
+
+
+def _check(libc, ret: int, what: str):
+    if ret != 0:
+        import ctypes
+        errno = ctypes.get_errno()
+        raise IsolationError(f"{what} failed: {os.strerror(errno)}")
+
+
+def _read_only_dirs() -> list:
+    """
+    What job code may see of the host: the Python installation (stdlib and
+    site-packages, for lazy imports and matplotlib's fonts) and tz data.
+    Never a directory holding the server's cwd (the repo, its secrets).
+    """
+    import site
+    paths = sysconfig.get_paths()
+    candidates = [paths["stdlib"], paths["platstdlib"], paths["purelib"], paths["platlib"],
+                  *site.getsitepackages(), site.getusersitepackages(), "/usr/share/zoneinfo"]
+    cwd = os.path.realpath(os.getcwd())
+    dirs = []
+    for d in sorted({os.path.realpath(c) for c in candidates if c and os.path.isdir(c)}):
+        if cwd == d or cwd.startswith(d + os.sep):
+            continue
+        if not any(d.startswith(parent + os.sep) for parent in dirs):
+            dirs.append(d)
+    return dirs
+
+
+def _drop_bounding_set(libc):
+    for cap in range(64):
+        libc.prctl(PR_CAPBSET_DROP, cap, 0, 0, 0)  # EINVAL past the last capability; harmless
+
+
+def _drop_capabilities(libc):
+    import ctypes
+
+    class Header(ctypes.Structure):
+        _fields_ = [("version", ctypes.c_uint32), ("pid", ctypes.c_int)]
+
+    class Data(ctypes.Structure):
+        _fields_ = [("effective", ctypes.c_uint32), ("permitted", ctypes.c_uint32),
+                    ("inheritable", ctypes.c_uint32)]
+
+    header, data = Header(0x20080522, 0), (Data * 2)()  # _LINUX_CAPABILITY_VERSION_3, all sets empty
+    _check(libc, libc.capset(ctypes.byref(header), data), "capset")
+    _check(libc, libc.prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0), "prctl(NO_NEW_PRIVS)")
+
+
+def isolate_process(root_dir: str):
+    """
+    Confine the calling process (a pool worker, after its imports) so the
+    code it runs can't reach the server's secrets or the network:
+
+    - an empty environment (no API or encryption keys);
+    - new mount and network namespaces (and a user namespace unless the
+      server runs as root): no network interfaces but a down loopback;
+    - root_dir becomes "/" (pivot_root, old root detached): the only host
+      files visible are read-only bind mounts of the Python installation;
+      there is no /proc, /dev or repo directory;
+    - all capabilities dropped and no_new_privs set, so the mounts can't be
+      changed or the confinement undone; a root server's workers also
+      switch to the unprivileged user nobody.
+
+    Linux only; raises IsolationError if the kernel doesn't allow it
+    (e.g. unprivileged user namespaces disabled).
+    """
+    if platform.system() != "Linux" or platform.machine() not in SYS_PIVOT_ROOT:
+        raise IsolationError(f"unsupported platform {platform.system()}/{platform.machine()}")
+    threads = os.listdir("/proc/self/task")
+    if len(threads) > 1:  # unshare(CLONE_NEWUSER) refuses multithreaded callers
+        names = [open(f"/proc/self/task/{t}/comm").read().strip() for t in threads]
+        raise IsolationError(f"worker is multithreaded ({', '.join(names)})")
+    libc = _libc()
+    read_only = _read_only_dirs()
+    work_dir, old_root = root_dir + SANDBOX_WORKDIR, os.path.join(root_dir, ".old_root")
+    for d in [work_dir, old_root] + [root_dir + d for d in read_only]:
+        os.makedirs(d, exist_ok=True)
+
+    os.environ.clear()
+    os.environ.update(HOME=SANDBOX_WORKDIR, TMPDIR=SANDBOX_WORKDIR)
+    tempfile.tempdir = SANDBOX_WORKDIR
+
+    uid, gid = os.getuid(), os.getgid()
+    if uid == 0:
+        # Root needs no user namespace to mount; it switches to nobody once the mounts are done
+        os.chmod(root_dir, 0o755)
+        os.chown(work_dir, NOBODY, NOBODY)
+        _check(libc, libc.unshare(CLONE_NEWNS | CLONE_NEWNET), "unshare")
+    else:
+        _check(libc, libc.unshare(CLONE_NEWUSER | CLONE_NEWNS | CLONE_NEWNET), "unshare")
+        with open("/proc/self/setgroups", "w") as f:
+            f.write("deny")
+        with open("/proc/self/uid_map", "w") as f:
+            f.write(f"0 {uid} 1")
+        with open("/proc/self/gid_map", "w") as f:
+            f.write(f"0 {gid} 1")
+
+    _check(libc, libc.mount(None, b"/", None, MS_REC | MS_PRIVATE, None), "mount(private)")
+    _check(libc, libc.mount(root_dir.encode(), root_dir.encode(), None, MS_BIND | MS_REC, None), "mount(root)")
+    for d in read_only:
+        target = (root_dir + d).encode()
+        _check(libc, libc.mount(d.encode(), target, None, MS_BIND | MS_REC, None), f"mount({d})")
+        flags = MS_REMOUNT | MS_BIND | MS_RDONLY | MS_NOSUID | MS_NODEV | (os.statvfs(d).f_flag & MS_LOCKED_FLAGS)
+        _check(libc, libc.mount(None, target, None, flags, None), f"remount({d}, ro)")
+    _check(libc, libc.syscall(SYS_PIVOT_ROOT[platform.machine()], root_dir.encode(), old_root.encode()),
+           "pivot_root")
+    os.chdir("/")
+    _check(libc, libc.umount2(b"/.old_root", MNT_DETACH), "umount(old root)")
+    os.rmdir("/.old_root")
+    os.chdir(SANDBOX_WORKDIR)
+
+    _drop_bounding_set(libc)
+    if uid == 0:
+        os.setgroups([])
+        os.setgid(NOBODY)
+        os.setuid(NOBODY)   # clears every capability
+    _drop_capabilities(libc)
+
+
+def _apply_resource_limits(cpu_seconds: int, memory_bytes: int):
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+    if memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+
+def _patch_read_csv(pd, df):
+    """
+    Agent #1's code loads the dataset itself (pd.read_csv('super_cleaned_data.csv'),
+    '/mnt/data/...', etc.). Any read of a path that doesn't exist locally is
+    answered with a copy of the already-loaded DataFrame instead.
+    """
+    original_read_csv = pd.read_csv
+
+    def read_csv(filepath_or_buffer, *args, **kwargs):
+        if isinstance(filepath_or_buffer, (str, os.PathLike)) and not os.path.exists(filepath_or_buffer):
+            return df.copy()
+        return original_read_csv(filepath_or_buffer, *args, **kwargs)
+
+    pd.read_csv = read_csv
+
+
+def _format_value(value) -> str:
+    try:
+        import pandas as pd
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            return value.to_string()
+    except ImportError:
+        pass
+    return repr(value)
+
+
+def run_code(code: str, df) -> dict:
+    """
+    Execute `code` against `df` in the *current* process, Code Interpreter
+    style: stdout is captured, the value of a trailing expression is
+    printed, and every open matplotlib figure is returned as PNG bytes.
+    Returns {"output": str, "images": [bytes], "error": str|None}.
+    Meant to be called inside a worker process (see WorkerPool).
+    """
+    import pandas as pd
+    import numpy as np
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    _patch_read_csv(pd, df)
+    namespace = {
+        "__name__": "__main__",
+        "pd": pd,
+        "np": np,
+        "plt": plt,
+        "df": df.copy(),
+    }
+
+    stdout = io.StringIO()
+    error = None
+    try:
+        tree = ast.parse(code)
+        tail_expr = None
+        if tree.body and isinstance(tree.body[-1], ast.Expr):
+            tail_expr = ast.Expression(tree.body.pop().value)
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stdout):
+            exec(compile(tree, "<agent1_code>", "exec"), namespace)
+            if tail_expr is not None:
+                value = eval(compile(tail_expr, "<agent1_code>", "eval"), namespace)
+                if value is not None:
+                    print(_format_value(value))
+    except BaseException:
+        error = traceback.format_exc(limit=5)
+
+    images = []
+    for num in plt.get_fignums():
+        buf = io.BytesIO()
+        try:
+            plt.figure(num).savefig(buf, format="png", bbox_inches="tight")
+            images.append(buf.getvalue())
+        except Exception:
+            pass
+    plt.close("all")
+
+    return {"output": stdout.getvalue(), "images": images, "error": error}
+
+
+def _set_job_cpu_limit(cpu_seconds: int):
+    """RLIMIT_CPU is cumulative per process, so each job gets usage-so-far + its budget."""
+    try:
+        import resource
+    except ImportError:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime) + 1
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (used + cpu_seconds, hard))
+
+
+def _clear_dir(path: str):
+    for name in os.listdir(path):
+        full = os.path.join(path, name)
+        if os.path.isdir(full) and not os.path.islink(full):
+            shutil.rmtree(full, ignore_errors=True)
+        else:
+            try:
+                os.remove(full)
+            except OSError:
+                pass
+
+
+def _pool_worker_main(conn, memory_bytes, root_dir, isolate):
+    """
+    Long-lived worker: pay interpreter start, heavy imports and the dataset
+    once, then serve jobs until told to stop. The DataFrame is never handed
+    to job code directly (run_code gives each job its own copy).
+
+    The DataFrame arrives over `conn` rather than as a Process argument and
+    the address-space cap comes last, so the warm-up (BLAS buffers, the
+    dataset) can't trip it and only runaway jobs do. With `isolate`, the
+    worker confines itself (isolate_process) before its first job, and
+    reports ("unisolated", reason) instead of "ready" if it can't.
+    """
+    import pandas, numpy, matplotlib  # noqa: F401  (pre-warm imports)
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+    df = conn.recv()
+
+    if isolate:
+        try:
+            isolate_process(root_dir)
+        except Exception as e:
+            conn.send(("unisolated", str(e)))
+            return
+    else:
+        os.chdir(root_dir)
+    _apply_resource_limits(0, memory_bytes)
+    workdir = os.getcwd()
+    conn.send("ready")
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        code, cpu_seconds = msg
+        _set_job_cpu_limit(cpu_seconds)
+        try:
+            result = run_code(code, df)
+        except BaseException:
+            result = {"output": "", "images": [], "error": traceback.format_exc(limit=5)}
+        _clear_dir(workdir)
+        conn.send(result)
+
+
+class _Worker:
+    def __init__(self, proc, conn, root_dir):
+        self.proc = proc
+        self.conn = conn
+        self.root_dir = root_dir
+        self.jobs = 0
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.proc.join(1)
+        self.kill()
+
+    def kill(self):
+        if self.proc.is_alive():
+            self.proc.kill()
+        self.proc.join()
+        self.conn.close()
+        shutil.rmtree(self.root_dir, ignore_errors=True)  # its mounts died with the worker's namespace
+
+
+class WorkerPool:
+    """
+    Pool of pre-started worker processes, each holding the dataset already
+    loaded, for running Agent #1's analysis code locally.
+
+    Per job: a CPU-time budget (RLIMIT_CPU), a wall-clock timeout (the worker
+    is killed and replaced if it overruns) and a per-worker address-space cap
+    (RLIMIT_AS). Workers are recycled after `max_jobs_per_worker` jobs.
+
+    With `isolate` (the default), each worker runs job code confined by
+    isolate_process: no environment, network, privileges or host files
+    beyond the Python installation. If the host can't provide that, the
+    pool refuses to run code (see `unavailable`) rather than run it
+    unconfined; isolate=False runs it with the server's own privileges,
+    secrets and network access, so only use that for trusted code.
+    Replacements start in the background, so a killed or retired worker
+    never delays the caller. execute() is thread-safe; up to `size` jobs run
+    in parallel, one per core by default.
+    """
+
+    def __init__(self, df, size: int = None, max_jobs_per_worker: int = 50,
+                 timeout: float = 30.0, cpu_seconds: int = 30,
+                 memory_bytes: int = 2 * 1024 ** 3, isolate: bool = True):
+        self.df = df
+        self.isolate = isolate
+        self.unavailable = None     # why workers can't start (isolation not possible), if so
+        self.size = size or os.cpu_count() or 1
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self._ctx = mp.get_context("spawn")
+        self._idle = queue.Queue()
+        self._closed = False
+        for _ in range(self.size):
+            self._replace_async()
+
+    def _start_worker(self):
+        parent_conn, child_conn = self._ctx.Pipe(duplex=True)
+        root_dir = tempfile.mkdtemp(prefix="agent2_worker_")
+        proc = self._ctx.Process(
+            target=_pool_worker_main,
+            args=(child_conn, self.memory_bytes, root_dir, self.isolate),
+            daemon=True,
+        )
+        with _worker_environment():
+            proc.start()
+        child_conn.close()
+        worker = _Worker(proc, parent_conn, root_dir)
+        try:
+            parent_conn.send(self.df)
+            if parent_conn.poll(120):
+                msg = parent_conn.recv()
+                if msg == "ready":
+                    return worker
+                if isinstance(msg, tuple) and msg[0] == "unisolated":
+                    self.unavailable = f"local workers can't be isolated on this host ({msg[1]})"
+        except (EOFError, OSError):
+            pass
+        worker.kill()
+        return None
+
+    def _replace_async(self):
+        def spawn():
+            if self.unavailable:
+                return
+            worker = self._start_worker()
+            if worker is None:
+                return
+            if self._closed:
+                worker.stop()
+            else:
+                self._idle.put(worker)
+        threading.Thread(target=spawn, daemon=True).start()
+
+    def _retire(self, worker: _Worker, kill: bool = False):
+        if kill:
+            worker.kill()
+        else:
+            worker.stop()
+        if not self._closed:
+            self._replace_async()
+
+    def execute(self, code: str, timeout: float = None) -> dict:
+        """Run `code` on an idle worker. Returns the same dict as run_code."""
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        worker = None
+        while worker is None:
+            if self.unavailable:
+                return {"output": "", "images": [], "error": f"Local execution unavailable: {self.unavailable}"}
+            try:
+                worker = self._idle.get(timeout=min(1.0, max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                if time.monotonic() >= deadline:
+                    return {"output": "", "images": [], "error": f"No local worker available within {timeout:.0f}s"}
+
+        worker.jobs += 1
+        try:
+            worker.conn.send((code, self.cpu_seconds))
+            if not worker.conn.poll(timeout):
+                self._retire(worker, kill=True)
+                return {"output": "", "images": [], "error": f"Timed out after {timeout:.0f}s"}
+            result = worker.conn.recv()
+        except (EOFError, OSError):
+            worker.proc.join(1)
+            exitcode = worker.proc.exitcode
+            self._retire(worker, kill=True)
+            return {"output": "", "images": [], "error": f"Worker exited unexpectedly (exit code {exitcode}); "
+                                                         "the job likely exceeded its CPU or memory limit"}
+
+        if worker.jobs >= self.max_jobs_per_worker:
+            self._retire(worker)
+        else:
+            self._idle.put(worker)
+        return result
+
+    def shutdown(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
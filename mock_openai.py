@@ -0,0 +1,333 @@
+"""
+Synthetic stand-in for the OpenAI API, for load tests (see load_test.py).
+
+Unlike replay_server.py it needs no recording: every endpoint the app and
+the pipeline use answers with a canned, well-formed response after a
+configurable delay:
+  files, assistants       create / retrieve / delete (session init)
+  threads, messages       create / delete / list
+  runs                    streamed Code Interpreter run: one tool step, one
+                          message with a text block and a plot
+  chat completions        Agent #1 plans (qualitative when the question asks
+                          for quotes, analytic cube queries when it asks what
+                          predicts something), analysis text, streamed summaries
+  embeddings              deterministic pseudo-random vectors
+Delays are DEFAULT_LATENCIES scaled by `latency_scale` (0 => none).
+`stats` counts requests per endpoint.
+"""
+import re
+import json
+import time
+import uuid
+import hashlib
+import threading
+from io import BytesIO
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+from PIL import Image
+
+from schema import open_ended_text_columns
+
+DEFAULT_LATENCIES = {        # seconds
+    "plan": 2.0,             # Agent #1 (o1) planning call
+    "chat": 1.0,             # any other non-streamed completion
+    "first_token": 0.5,      # streamed completion, time to first token
+    "token": 0.02,           # streamed completion, per token
+    "run": 3.0,              # Code Interpreter run, start to finish
+    "embedding": 0.1,
+    "default": 0.05,         # files / assistants / threads / messages
+}
+SUMMARY_TOKENS = 60
+_ID = re.compile(r"/(file|asst|thread|msg|run|step)[-_][A-Za-z0-9]+")
+
+
+def _new_id(prefix: str) -> str:
+    sep = "-" if prefix == "file" else "_"  # as the real API does
+    return f"{prefix}{sep}{uuid.uuid4().hex[:24]}"
+
+
+def _png() -> bytes:
+    buf = BytesIO()
+    Image.new("RGB", (320, 240), (70, 130, 180)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> dict:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": 0},
+        "completion_tokens_details": {"reasoning_tokens": 0},
+    }
+
+
+class MockOpenAIServer:
+    def __init__(self, latency_scale: float = 1.0, host: str = "127.0.0.1", port: int = 0):
+        self.latency_scale = latency_scale
+        self.png = _png()
+        self.text_column = (open_ended_text_columns() or ["text"])[0]
+        self._lock = threading.Lock()
+        self.stats = {}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get("content-length") or 0)
+                body = self.rfile.read(length) if length else b""
+                path = self.path.split("?", 1)[0]
+                path = path[path.index("/v1") + 3:] if "/v1" in path else path
+                server._serve(self, self.command, path, body)
+
+            do_GET = do_POST = do_DELETE = _handle
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _sleep(self, kind: str):
+        time.sleep(DEFAULT_LATENCIES[kind] * self.latency_scale)
+
+    ###########################################################################
+    # Transport
+    ###########################################################################
+    def _send_json(self, handler, payload: dict, status: int = 200):
+        data = json.dumps(payload).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("content-type", "application/json")
+        handler.send_header("content-length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _send_bytes(self, handler, data: bytes, content_type: str):
+        handler.send_response(200)
+        handler.send_header("content-type", content_type)
+        handler.send_header("content-length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _send_sse(self, handler, events):
+        """events yields (event name or None, payload or "[DONE]", delay before it)."""
+        handler.send_response(200)
+        handler.send_header("content-type", "text/event-stream")
+        handler.send_header("transfer-encoding", "chunked")
+        handler.end_headers()
+        for name, payload, delay in events:
+            time.sleep(delay * self.latency_scale)
+            data = payload if isinstance(payload, str) else json.dumps(payload)
+            chunk = (f"event: {name}\n" if name else "") + f"data: {data}\n\n"
+            chunk = chunk.encode("utf-8")
+            handler.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            handler.wfile.flush()
+        handler.wfile.write(b"0\r\n\r\n")
+
+    def _serve(self, handler, method: str, path: str, body: bytes):
+        endpoint = f"{method} {_ID.sub(lambda m: '/{' + m.group(1) + '}', path)}"
+        with self._lock:
+            self.stats[endpoint] = self.stats.get(endpoint, 0) + 1
+        try:
+            request = json.loads(body) if body and body[:1] in (b"{", b"[") else {}
+        except ValueError:
+            request = {}
+        route = {
+            "POST /files": self._create_file,
+            "GET /files/{file}/content": self._file_content,
+            "POST /assistants": self._assistant,
+            "GET /assistants/{asst}": self._assistant,
+            "POST /threads": self._create_thread,
+            "POST /threads/{thread}/messages": self._create_message,
+            "GET /threads/{thread}/messages": self._list_messages,
+            "POST /threads/{thread}/runs": self._create_run,
+            "GET /threads/{thread}/runs/{run}": self._retrieve_run,
+            "POST /chat/completions": self._chat,
+            "POST /embeddings": self._embeddings,
+        }.get(endpoint)
+        if route is None and method == "DELETE":
+            self._sleep("default")
+            return self._send_json(handler, {"id": path.rsplit("/", 1)[-1], "deleted": True})
+        if route is None:
+            return self._send_json(handler, {"error": {"message": f"mock: no route for {endpoint}"}}, 404)
+        route(handler, path, request)
+
+    ###########################################################################
+    # Files, assistants, threads, messages
+    ###########################################################################
+    def _create_file(self, handler, path, request):
+        self._sleep("default")
+        self._send_json(handler, {
+            "id": _new_id("file"), "object": "file", "bytes": 0, "created_at": int(time.time()),
+            "filename": "super_cleaned_data.csv", "purpose": "assistants", "status": "processed",
+        })
+
+    def _file_content(self, handler, path, request):
+        self._sleep("default")
+        self._send_bytes(handler, self.png, "image/png")
+
+    def _assistant(self, handler, path, request):
+        self._sleep("default")
+        self._send_json(handler, {
+            "id": path.rsplit("/", 1)[-1] if path.count("/") > 1 else _new_id("asst"),
+            "object": "assistant", "created_at": int(time.time()), "model": request.get("model", "gpt-4o"),
+            "name": request.get("name"), "instructions": request.get("instructions"),
+            "tools": [{"type": "code_interpreter"}],
+        })
+
+    def _create_thread(self, handler, path, request):
+        self._sleep("default")
+        self._send_json(handler, {"id": _new_id("thread"), "object": "thread", "created_at": int(time.time())})
+
+    def _message(self, thread_id: str, role: str, content: list, run_id: str = None) -> dict:
+        return {
+            "id": _new_id("msg"), "object": "thread.message", "created_at": int(time.time()),
+            "thread_id": thread_id, "role": role, "content": content, "run_id": run_id,
+            "status": "completed", "attachments": [],
+        }
+
+    def _create_message(self, handler, path, request):
+        self._sleep("default")
+        content = [{"type": "text", "text": {"value": str(request.get("content", "")), "annotations": []}}]
+        self._send_json(handler, self._message(path.split("/")[2], "user", content))
+
+    def _analysis_message(self, thread_id: str, run_id: str) -> dict:
+        file_id = _new_id("file")
+        return self._message(thread_id, "assistant", [
+            {"type": "text", "text": {"value": "Mock analysis: 1,234 rows; mean rating 3.8 (sd 1.1).",
+                                      "annotations": []}},
+            {"type": "image_file", "image_file": {"file_id": file_id}},
+        ], run_id)
+
+    def _list_messages(self, handler, path, request):
+        self._sleep("default")
+        thread_id = path.split("/")[2]
+        if "after=" in handler.path:  # the SDK asks for the next page until one comes back empty
+            return self._send_json(handler, {"object": "list", "data": [], "first_id": None,
+                                             "last_id": None, "has_more": False})
+        data = [self._analysis_message(thread_id, _new_id("run"))]
+        self._send_json(handler, {"object": "list", "data": data, "first_id": data[0]["id"],
+                                  "last_id": data[0]["id"], "has_more": False})
+
+    ###########################################################################
+    # Runs
+    ###########################################################################
+    def _run(self, thread_id: str, run_id: str, assistant_id: str, status: str) -> dict:
+        return {
+            "id": run_id, "object": "thread.run", "created_at": int(time.time()), "thread_id": thread_id,
+            "assistant_id": assistant_id, "status": status, "model": "gpt-4o", "instructions": "",
+            "tools": [{"type": "code_interpreter"}], "last_error": None,
+            "usage": _usage(1500, 300) if status == "completed" else None,
+        }
+
+    def _create_run(self, handler, path, request):
+        thread_id, run_id = path.split("/")[2], _new_id("run")
+        assistant_id = request.get("assistant_id", "")
+        if not request.get("stream"):
+            self._sleep("default")
+            return self._send_json(handler, self._run(thread_id, run_id, assistant_id, "queued"))
+        step = {
+            "id": _new_id("step"), "object": "thread.run.step", "run_id": run_id, "thread_id": thread_id,
+            "type": "tool_calls", "status": "in_progress",
+            "step_details": {"type": "tool_calls", "tool_calls": [{
+                "id": _new_id("call"), "type": "code_interpreter",
+                "code_interpreter": {"input": "import pandas as pd\ndf = pd.read_csv('super_cleaned_data.csv')",
+                                     "outputs": [{"type": "logs", "logs": "(1234, 120)"}]},
+            }]},
+        }
+        run_seconds = DEFAULT_LATENCIES["run"]
+        self._send_sse(handler, [
+            ("thread.run.created", self._run(thread_id, run_id, assistant_id, "queued"), 0),
+            ("thread.run.in_progress", self._run(thread_id, run_id, assistant_id, "in_progress"), 0.1),
+            ("thread.run.step.created", step, 0.1),
+            ("thread.run.step.completed", {**step, "status": "completed"}, run_seconds * 0.6),
+            ("thread.message.completed", self._analysis_message(thread_id, run_id), run_seconds * 0.2),
+            ("thread.run.completed", self._run(thread_id, run_id, assistant_id, "completed"), 0),
+            ("done", "[DONE]", 0),
+        ])
+
+    def _retrieve_run(self, handler, path, request):
+        self._sleep("run")
+        parts = path.split("/")
+        self._send_json(handler, self._run(parts[2], parts[4], "", "completed"))
+
+    ###########################################################################
+    # Chat completions & embeddings
+    ###########################################################################
+    def _plan(self, request) -> str:
+        query = next((m.get("content", "") for m in reversed(request.get("messages", []))
+                      if m.get("role") == "user"), "")
+        if "quote" in str(query).lower():
+            return json.dumps({"type": "qualitative", "column": self.text_column,
+                               "prompt": "Summarize the main themes. Please include direct quotes where possible."})
+        if "predict" in str(query).lower():
+            return json.dumps({"type": "cube", "queries": [{"op": "top_predictors", "target": "22", "k": 5}],
+                               "code": "print(df.describe())"})
+        return json.dumps({"type": "quantitative", "code": "print(df.describe())"})
+
+    def _chat(self, handler, path, request):
+        model = request.get("model", "gpt-4o")
+        completion_id = _new_id("chatcmpl")
+        if request.get("stream"):
+            words = [f"word{i} " for i in range(SUMMARY_TOKENS)]
+            chunks = [
+                (None, {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": model, "choices": [{"index": 0, "delta": {"content": w}, "finish_reason": None}]},
+                 DEFAULT_LATENCIES["first_token"] if i == 0 else DEFAULT_LATENCIES["token"])
+                for i, w in enumerate(["## Summary\n\n"] + words)
+            ]
+            chunks.append((None, {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                                  "model": model, "choices": [], "usage": _usage(2000, SUMMARY_TOKENS)}, 0))
+            chunks.append((None, "[DONE]", 0))
+            return self._send_sse(handler, chunks)
+
+        is_plan = any(str(m.get("content", "")).startswith("Dataset 'super_cleaned_data.csv' schema")
+                      for m in request.get("messages", []))
+        self._sleep("plan" if is_plan else "chat")
+        content = self._plan(request) if is_plan else "Mock qualitative analysis with a \"direct quote\"."
+        self._send_json(handler, {
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": _usage(6000 if is_plan else 3000, 400),
+        })
+
+    def _embeddings(self, handler, path, request):
+        self._sleep("embedding")
+        inputs = request.get("input", "")
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        data = []
+        for i, text in enumerate(inputs):
+            seed = int.from_bytes(hashlib.sha256(str(text).encode("utf-8")).digest()[:4], "big")
+            vector = np.random.default_rng(seed).standard_normal(256)
+            data.append({"object": "embedding", "index": i, "embedding": (vector / np.linalg.norm(vector)).tolist()})
+        self._send_json(handler, {"object": "list", "data": data, "model": request.get("model", ""),
+                                  "usage": {"prompt_tokens": 8, "total_tokens": 8}})
+
+    ###########################################################################
+    def start(self) -> str:
+        threading.Thread(target=self._httpd.serve_forever, name="mock-openai", daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def serve_forever(latency_scale: float, conn):
+    """
+    Entry point for running the server in a separate process: sends
+    base_url through `conn`, then answers "stats" until "stop".
+    """
+    server = MockOpenAIServer(latency_scale)
+    conn.send(server.start())
+    while conn.recv() != "stop":
+        with server._lock:
+            conn.send(dict(server.stats))
+    server.stop()
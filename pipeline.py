@@ -0,0 +1,1247 @@
+"""
+Async core of the three-agent pipeline (plan => analyze => summarize),
+independent of Streamlit.
+
+A PipelineEngine owns an asyncio event loop on a background thread and an
+AsyncOpenAI client. Each query runs there as a Job; the UI only submits
+jobs and polls their snapshots, so Streamlit reruns (or closed tabs) don't
+kill in-flight work and one server process can serve many concurrent
+queries. Jobs are queued and run by max_concurrent_jobs workers; with a
+JobStore they are checkpointed after every stage and resumed on restart.
+"""
+import re
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import threading
+import dataclasses
+import collections
+from dataclasses import dataclass, field
+
+import httpx
+from openai import AsyncOpenAI
+
+from prompts import dataset_context
+from schema import compact_dataset_context
+from text_digest import chunk_responses, render_digest, estimate_tokens
+from rate_limit import RateLimiter, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BULK
+from ci_pool import CodeInterpreterPool
+from fast_path import FastPathRouter
+from answer_cache import normalize_query
+from image_cache import SYNTHETIC_ID_PREFIXES
+from tracing import Tracer, traced, DEFAULT_MODEL_PRICES
+
+REASONING_MODEL = "o1-2024-12-17"
+AGENT2_RUN_INSTRUCTIONS = (
+    "You are Agent #2 (GPT-4o Code Interpreter). Execute the code on 'super_cleaned_data.csv' and return all results."
+)
+AGENT1_LLM_SNIPPET = (
+    "from openai import OpenAI\n"
+    "client = OpenAI()\n\n"
+    "completion = client.chat.completions.create(\n"
+    '  model="o1-2024-12-17",\n'
+    "  messages=[\n"
+    '    {"role": "developer", "content": "You are a helpful assistant."},\n'
+    '    {"role": "user", "content": "..."}\n'
+    "  ]\n"
+    ")\n\n"
+    "print(completion.choices[0].message.content)\n"
+)
+
+
+def agent1_instructions(schema_variant: str = "full", analytic_cube=None) -> str:
+    """
+    Agent #1's developer message. Fully static and schema-first, so every
+    planning call shares a byte-identical prefix the provider's prompt
+    cache can reuse; only the user message varies per query.
+    Given an AnalyticCube, Agent #1 may also plan "cube" queries against it.
+    """
+    schema_text = compact_dataset_context() if schema_variant == "compact" else dataset_context
+    cube_text = (
+        f"{analytic_cube.prompt()}\n"
+        "If the question can be answered from these aggregates (distributions, crosstabs, a rating by group, "
+        "\"which factors predict X\"), prefer => produce JSON:\n"
+        '{"type":"cube","queries":[{"op":"...", ...}, ...],"code":"(python for Agent2, used if the queries fail)"}\n\n'
+    ) if analytic_cube is not None else ""
+    return (
+        "Dataset 'super_cleaned_data.csv' schema:\n\n"
+        f"{schema_text}\n\n"
+        "You are Agent #1. "
+        "Decide if the question is numeric/quantitative vs. text/qualitative. "
+        "If numeric => produce JSON:\n"
+        '{"type":"quantitative","code":"(python for Agent2)"}\n\n'
+        "If text => produce JSON:\n"
+        '{"type":"qualitative","column":"somecol","prompt":"(instructions for the LLM). Please include direct quotes where possible."}\n'
+        "(\"column\" may also be a list of column names when the question spans several text columns.)\n\n"
+        f"{cube_text}"
+        "If you do LLM calls, use the exact snippet:\n"
+        f"{AGENT1_LLM_SNIPPET}\n"
+        "Keep your plan minimal. Only do text-based approach if the user specifically wants quotes/text insights."
+    )
+
+
+PREDICTOR_NOTE = (
+    "Predictor rankings are per statistic (bias-corrected Cramér's V, bias-corrected eta, Pearson r); "
+    "these are not on a common scale, so don't rank predictors across statistics, and name the "
+    "statistic next to each predictor you mention.\n\n"
+)
+WARM_UP_MESSAGE = (
+    "Load 'super_cleaned_data.csv' into a pandas DataFrame named df and reply with its shape only."
+)
+
+
+@dataclass
+class PipelineConfig:
+    agent2_execution_mode: str = "remote"   # "remote" (Code Interpreter) or "local" (worker pool)
+    local_exec_fallback_to_remote: bool = True
+    image_fetch_workers: int = 4
+    image_fetch_timeout: float = 30
+    qual_chunk_tokens: int = 12000
+    qual_map_workers: int = 4
+    qual_map_model: str = "gpt-4o"
+    qual_use_digests: bool = True
+    digest_needs_raw_marker: str = "NEED_RAW_TEXT"
+    digest_check_model: str = "gpt-4o"      # decides whether the digests suffice, before any o1 call
+    qual_retrieval_enabled: bool = True
+    qual_retrieval_top_k: int = 60
+    speculative_execution: bool = True
+    agent1_schema_variant: str = "full"     # "full" (prompts.dataset_context) or "compact" (one line per column)
+    usage_log_size: int = 200               # recent per-request token usage entries kept
+    trace_path: str = None                  # JSONL span export (None => in-memory only)
+    model_prices: dict = field(default_factory=lambda: dict(DEFAULT_MODEL_PRICES))
+    agent2_model: str = "gpt-4o"            # Code Interpreter assistant's model (for rate limiting)
+    answer_cache_embedding_model: str = "text-embedding-3-small"  # answer cache's semantic tier
+    agent2_stream_runs: bool = True         # follow Code Interpreter runs via streamed events
+    agent2_poll_initial: float = 0.2        # fallback poller: first interval (seconds)
+    agent2_poll_max: float = 2.0            # fallback poller: backoff cap (seconds)
+    ci_pool_size: int = 2                   # pre-warmed Code Interpreter threads kept idle (0 => off)
+    ci_pool_idle_seconds: float = 1200      # recycle warm threads idle longer than this
+    ci_pool_lease_timeout: float = 5.0      # max wait for a warming thread before creating one cold
+    ci_pool_active_seconds: float = 1800    # stop warming threads after this long without a lease
+    rate_limits: dict = field(default_factory=dict)  # {model: (requests/min, tokens/min)}
+    default_rate_limit: tuple = (500, 200_000)
+    max_retries: int = 5                    # per call, on 429 / 5xx / connection errors
+    output_tokens_estimate: int = 4000      # reserved per call on top of the prompt, settled after
+    max_concurrent_jobs: int = 8            # jobs running at once (an engine uses a single API key)
+    max_finished_jobs: int = 500            # finished jobs kept in memory for polling
+    job_heartbeat_seconds: float = 15       # how often this process marks its unfinished jobs alive
+    job_stale_seconds: float = 60           # another process's job with no heartbeat this long is taken over
+    fast_path_enabled: bool = True          # answer simple lookups from the cube, skipping Agent #1
+    fast_path_model: str = "gpt-4o"         # summarizer for fast-path answers
+
+
+@dataclass
+class PipelineResources:
+    """Process-wide objects the pipeline reads from (built once by the app)."""
+    df: object
+    assistant_id: str
+    image_cache: object
+    plan_cache: object = None
+    answer_cache: object = None
+    worker_pool: object = None
+    digests: dict = None
+    response_index_loader: object = None    # () -> (ResponseIndex, embed) or None; called once, at startup
+    job_store: object = None                # JobStore for checkpoints / resume / reattach
+    analytic_cube: object = None            # AnalyticCube; enables Agent #1's "cube" plans
+
+
+@dataclass
+class Job:
+    id: str
+    query: str
+    thread_id: str = None       # Code Interpreter thread (session's, or created by this job)
+    status: str = "queued"      # queued | running | done | error
+    stage: str = ""             # spinner text for the current stage
+    plan: str = ""
+    plan_type: str = ""
+    analysis: str = ""
+    summary: str = ""           # grows token by token while Agent #3 streams
+    progress: list = field(default_factory=list)  # Code Interpreter steps, live (not checkpointed)
+    image_file_ids: list = field(default_factory=list)
+    images: list = field(default_factory=list)  # [(file_id, sha256)] in the image cache, display order
+    cached: str = ""            # "exact" / "semantic" when served from the answer cache
+    error: str = ""
+    created_at: float = field(default_factory=time.time)
+    finished_at: float = None
+    owner: str = ""             # token of the session that submitted it (required to reattach)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "error")
+
+
+_TERMINAL_RUN_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete", "requires_action")
+_TERMINAL_RUN_EVENTS = tuple(f"thread.run.{s}" for s in _TERMINAL_RUN_STATUSES)
+
+
+def _is_error(text: str) -> bool:
+    return text.startswith("Error")
+
+
+class PipelineEngine:
+    def __init__(self, api_key: str, resources: PipelineResources, config: PipelineConfig = None,
+                 client_options: dict = None):
+        """client_options: extra AsyncOpenAI kwargs (e.g. base_url / http_client for benchmarks)."""
+        self.api_key = api_key
+        self.client_options = client_options or {}
+        self.resources = resources
+        self.config = config or PipelineConfig()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.usage_log = collections.deque(maxlen=self.config.usage_log_size)
+        self.tracer = Tracer(self.config.trace_path, prices=self.config.model_prices)
+        self.agent1_instructions = agent1_instructions(self.config.agent1_schema_variant, resources.analytic_cube)
+        self.router = (
+            FastPathRouter(resources.analytic_cube)
+            if self.config.fast_path_enabled and resources.analytic_cube is not None else None
+        )
+
+        if resources.image_cache is not None and resources.image_cache.pinned is None:
+            resources.image_cache.pinned = self._live_image_ids
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="pipeline-loop", daemon=True)
+        self._thread.start()
+        self.run(self._init_loop_state())
+        self._resume_unfinished_jobs()
+
+    async def _init_loop_state(self):
+        self.client = AsyncOpenAI(api_key=self.api_key, **self.client_options)
+        # Calls made through the limiter are retried there; everything else keeps the SDK's own retries
+        self._limited_client = self.client.with_options(max_retries=0)
+        self.limiter = RateLimiter(
+            self.config.rate_limits,
+            self.config.default_rate_limit,
+            max_retries=self.config.max_retries,
+        )
+        self._http = httpx.AsyncClient(
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            timeout=self.config.image_fetch_timeout,
+            limits=httpx.Limits(max_connections=self.config.image_fetch_workers),
+        )
+        # Built in the background from startup; qualitative queries use the
+        # full-text path until it's ready rather than waiting for the build
+        self._response_index = None
+        if self.resources.response_index_loader is not None:
+            self._response_index = asyncio.create_task(asyncio.to_thread(self.resources.response_index_loader))
+        self._background = set()    # fire-and-forget tasks (thread deletes), kept referenced until done
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.config.max_concurrent_jobs)
+        ]
+        self.ci_pool = None
+        if self.config.agent2_execution_mode != "local" and self.config.ci_pool_size > 0:
+            self.ci_pool = CodeInterpreterPool(
+                self._create_thread,
+                self._warm_up_thread,
+                self.client.beta.threads.delete,
+                size=self.config.ci_pool_size,
+                idle_seconds=self.config.ci_pool_idle_seconds,
+                lease_timeout=self.config.ci_pool_lease_timeout,
+                active_seconds=self.config.ci_pool_active_seconds,
+            )
+            self.ci_pool.start()
+        if self.resources.job_store is not None:
+            self._heartbeat = asyncio.create_task(self._heartbeat_jobs())
+
+    def _resume_unfinished_jobs(self):
+        """
+        Re-queue jobs a dead process left queued or running. Jobs of other
+        live processes sharing the job store are left to them.
+        """
+        if self.resources.job_store is None:
+            return
+        for row in self.resources.job_store.claim_unfinished(self.config.job_stale_seconds):
+            job = Job(**row)
+            job.status, job.stage = "queued", ""
+            self._enqueue(job)
+
+    ###########################################################################
+    # Public (thread-safe) API
+    ###########################################################################
+    def run(self, coro):
+        """Run a coroutine on the engine loop and wait for its result (sync bridge)."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def submit(self, query: str, thread_id: str = None, owner: str = "") -> str:
+        """
+        Start a background job for `query`; returns its job ID immediately.
+        `owner` is the submitting session's token, checked on reattach.
+        """
+        job = Job(id=uuid.uuid4().hex, query=query, thread_id=thread_id, owner=owner)
+        if self.resources.job_store is not None:
+            self.resources.job_store.save(dataclasses.asdict(job))
+        self._enqueue(job)
+        return job.id
+
+    def get(self, job_id: str):
+        """
+        Snapshot of a job (safe to read from any thread), or None if unknown.
+        Jobs no longer in memory (e.g. from before a restart) are read back
+        from the job store.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dataclasses.replace(
+                    job, image_file_ids=list(job.image_file_ids), images=list(job.images),
+                    progress=list(job.progress),
+                )
+        if self.resources.job_store is not None:
+            row = self.resources.job_store.load(job_id)
+            if row is not None:
+                return Job(**row)
+        return None
+
+    def _enqueue(self, job: Job):
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim_jobs()
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, job)
+
+    def release_thread(self, thread_id: str):
+        """Delete a conversation's Code Interpreter thread in the background (e.g. on "New Question")."""
+        if thread_id:
+            asyncio.run_coroutine_threadsafe(self._delete_thread(thread_id), self._loop)
+
+    def fetch_images_sync(self, file_ids: list) -> list:
+        return self.run(self.fetch_images(file_ids))
+
+    def _live_image_ids(self) -> set:
+        """File IDs of the plots of jobs still held in memory (kept in the image cache)."""
+        with self._lock:
+            return {fid for job in self._jobs.values() for fid in job.image_file_ids}
+
+    def _trim_jobs(self):
+        finished = sorted(
+            (j for j in self._jobs.values() if j.finished), key=lambda j: j.finished_at
+        )
+        for j in finished[:max(0, len(finished) - self.config.max_finished_jobs)]:
+            del self._jobs[j.id]
+
+    ###########################################################################
+    # Job driver
+    ###########################################################################
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run_job(job)
+            finally:
+                self._queue.task_done()
+
+    async def _heartbeat_jobs(self):
+        """Keep this process's claim on its jobs alive, and take over jobs of processes that died."""
+        while True:
+            await asyncio.sleep(self.config.job_heartbeat_seconds)
+            try:
+                await asyncio.to_thread(self.resources.job_store.heartbeat)
+                await asyncio.to_thread(self._resume_unfinished_jobs)
+            except Exception:
+                pass
+
+    async def _checkpoint(self, job: Job):
+        if self.resources.job_store is None:
+            return
+        try:
+            await asyncio.to_thread(self.resources.job_store.save, dataclasses.asdict(job))
+        except Exception:
+            pass
+
+    async def _run_job(self, job: Job):
+        job.status = "running"
+        await self._checkpoint(job)
+        with self.tracer.span("pipeline", trace_id=job.id, query=job.query[:200]) as root:
+            root.add_queue_time(max(0.0, time.time() - job.created_at))  # waiting for a free worker
+            try:
+                await self._run_stages(job)
+                job.status = "done"
+            except Exception as e:
+                job.error = f"Error running pipeline: {e}"
+                job.status = "error"
+                root.status, root.error = "error", job.error
+            finally:
+                job.stage = ""
+                job.finished_at = time.time()
+                root.attributes.update(plan_type=job.plan_type, cached=job.cached)
+            await self._checkpoint(job)
+
+    async def _run_stages(self, job: Job):
+        """
+        Runs the stages a job has no checkpoint for yet: a resumed job with
+        a plan skips Agent #1, one with an analysis skips Agent #2 too.
+        The summary is always regenerated (partial streams aren't kept).
+        """
+        tasks = {}
+        query_embedding = None
+        # A follow-up runs on the conversation's Code Interpreter thread, so its answer
+        # depends on context the cache key and the fast path don't have: follow-ups skip both
+        top_level = job.thread_id is None
+        if not job.plan:
+            # 0) Answer cache (exact, then semantic match)
+            if self.resources.answer_cache is not None and top_level:
+                job.stage = "Checking previous answers..."
+                cached = None
+                try:
+                    cache = self.resources.answer_cache
+                    cached = await asyncio.to_thread(cache.get, job.query)
+                    # Embed only if some entry has the same content terms (a semantic hit needs them)
+                    if cached is None and await asyncio.to_thread(cache.has_similar, job.query):
+                        query_embedding = await self.embed_for_cache(job.query)
+                        cached = await asyncio.to_thread(cache.get_similar, job.query, query_embedding)
+                except Exception:
+                    pass
+                if cached:
+                    await self._use_cached_answer(job, cached)
+                    return
+
+            # 0b) Fast path: a simple count / distribution / average of one column
+            #     is answered from the cube, with no Agent #1 or Agent #2
+            #     (top-level only: a follow-up leans on context the router can't see)
+            fast_plan = self.router.route(job.query) if self.router is not None and top_level else None
+            if fast_plan is not None:
+                job.stage = "Answering from precomputed aggregates..."
+                analysis = await self.run_cube(fast_plan["queries"])
+                if not _is_error(analysis):
+                    job.plan, job.analysis = json.dumps(fast_plan), analysis
+                    await self._checkpoint(job)
+
+        if not job.plan:
+            # 1) AGENT #1, speculatively overlapped with preparation for both branches
+            job.stage = "Agent #1 is generating plan..."
+            tasks = self._start_speculative_tasks(job) if self.config.speculative_execution else {}
+            job.plan = await self.get_agent1_plan(job.query)
+            await self._checkpoint(job)
+
+        try:
+            parsed_plan = json.loads(job.plan)
+            job.plan_type = parsed_plan.get("type", "quantitative")
+        except Exception:
+            parsed_plan = {}
+            job.plan_type = "quantitative"
+
+        # 2) If quant => code with Agent #2, cube => precomputed aggregates
+        #    (Agent #2 only if the queries fail), else => text analysis
+        if not job.analysis:
+            job.image_file_ids.clear()
+            job.progress.clear()
+            if job.plan_type == "quantitative":
+                self._cancel_unneeded(tasks, {"agent2_thread"})
+                await self._adopt_speculative_thread(job, tasks)
+                job.analysis = await self.run_agent_2(job, parsed_plan.get("code", ""))
+            elif job.plan_type in ("cube", "fast"):
+                self._cancel_unneeded(tasks, {"agent2_thread"})
+                job.stage = "Answering from precomputed aggregates..."
+                job.analysis = await self.run_cube(parsed_plan.get("queries", []))
+                if _is_error(job.analysis) and parsed_plan.get("code"):
+                    job.plan_type = "quantitative"
+                    await self._adopt_speculative_thread(job, tasks)
+                    job.analysis = await self.run_agent_2(job, parsed_plan["code"])
+            else:
+                self._cancel_unneeded(tasks, {"query_vector"})
+                job.stage = "Agent #2 (Local LLM) analyzing text..."
+                query_vector = await self._task_result(tasks, "query_vector")
+                job.analysis = await self.run_local_llm_on_text(
+                    parsed_plan.get("column", ""), parsed_plan.get("prompt", ""), job.query, query_vector
+                )
+            self._cancel_unneeded(tasks, set())
+            await self._checkpoint(job)
+
+        # 3) Final summary (streamed) and plot downloads run concurrently
+        job.stage = f"Agent #3 is summarizing ({job.plan_type})..."
+        job.summary = ""
+        if job.plan_type == "fast":
+            summarize = self.run_agent_3_fast
+        elif job.plan_type in ("quantitative", "cube"):
+            summarize = self.run_agent_3_quant
+        else:
+            summarize = self.run_agent_3_qual
+        _, images = await asyncio.gather(
+            summarize(job),
+            self.fetch_images(job.image_file_ids),
+        )
+        job.images = [
+            (fid, self.resources.image_cache.digest_for(fid))
+            for fid, b_ in zip(job.image_file_ids, images) if b_
+        ]
+
+        # 4) Cache the whole answer for repeat questions
+        if (parsed_plan and self.resources.answer_cache is not None and top_level
+                and not _is_error(job.plan) and not _is_error(job.analysis) and not _is_error(job.summary)):
+            try:
+                if query_embedding is None and self.resources.answer_cache.similarity_threshold is not None:
+                    query_embedding = await self.embed_for_cache(job.query)
+                await asyncio.to_thread(
+                    self.resources.answer_cache.put,
+                    job.query, job.plan, job.analysis, job.summary, [b_ for b_ in images if b_],
+                    query_embedding,
+                )
+            except Exception:
+                pass
+
+    async def _use_cached_answer(self, job: Job, cached: dict):
+        job.plan, job.analysis, job.summary = cached["plan"], cached["analysis"], cached["summary"]
+        job.cached = cached["match"]
+        for b_ in cached["images"]:
+            fid = "cached-" + hashlib.sha256(b_).hexdigest()[:24]
+            digest = await asyncio.to_thread(self.resources.image_cache.put, fid, b_)
+            job.image_file_ids.append(fid)
+            job.images.append((fid, digest))
+
+    ###########################################################################
+    # Speculative tasks (started while Agent #1 plans)
+    ###########################################################################
+    def _start_speculative_tasks(self, job: Job) -> dict:
+        tasks = {}
+        # quantitative branch: a (free) cold Code Interpreter thread. With a warm pool there is
+        # nothing to overlap, and a lease is only taken once the plan turns out to need one.
+        if self.config.agent2_execution_mode != "local" and job.thread_id is None and self.ci_pool is None:
+            tasks["agent2_thread"] = asyncio.create_task(self._create_thread())
+        # qualitative branch: response index + the query's vector for retrieval
+        if self.config.qual_retrieval_enabled:
+            tasks["query_vector"] = asyncio.create_task(self.embed_for_retrieval(job.query))
+        return tasks
+
+    def _cancel_unneeded(self, tasks: dict, needed: set):
+        for name in [n for n in tasks if n not in needed]:
+            task = tasks.pop(name)
+            if name == "agent2_thread":
+                # Cancelling mid-create could orphan the remote thread: delete it once it exists
+                task.add_done_callback(self._delete_created_thread)
+            else:
+                task.cancel()
+
+    def _delete_created_thread(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is None:
+            self._spawn_background(self._delete_thread(task.result()))
+
+    def _spawn_background(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _delete_thread(self, thread_id: str):
+        try:
+            await self.client.beta.threads.delete(thread_id)
+        except Exception:
+            pass
+
+    @staticmethod
+    async def _task_result(tasks: dict, name: str):
+        task = tasks.get(name)
+        if task is None:
+            return None
+        try:
+            return await task
+        except (Exception, asyncio.CancelledError):
+            return None
+
+    async def _adopt_speculative_thread(self, job: Job, tasks: dict):
+        """Run Agent #2 on the speculatively created Code Interpreter thread, if there is one."""
+        thread_id = await self._task_result(tasks, "agent2_thread")
+        tasks.pop("agent2_thread", None)
+        if thread_id is not None and job.thread_id is None:
+            job.thread_id = thread_id
+
+    ###########################################################################
+    # RATE-LIMITED CALLS
+    ###########################################################################
+    def _estimate_tokens(self, messages: list) -> int:
+        return sum(estimate_tokens(m["content"]) for m in messages) + self.config.output_tokens_estimate
+
+    async def _chat(self, priority: int, stage: str, **create_kwargs):
+        """
+        chat.completions.create within the model's rate limit (with retries).
+        Token usage is recorded under `stage`; streamed calls record theirs
+        when the final usage chunk arrives.
+        """
+        model = create_kwargs["model"]
+        reserved = self._estimate_tokens(create_kwargs["messages"])
+        completion = await self.limiter.call(
+            model, reserved, lambda: self._limited_client.chat.completions.create(**create_kwargs), priority,
+            on_queue=self.tracer.add_queue_time,
+        )
+        if not create_kwargs.get("stream"):
+            self._record_usage(stage, model, reserved, completion.usage)
+        return completion
+
+    def _record_usage(self, stage: str, model: str, reserved: int, usage):
+        """
+        Settle the rate-limit reservation, log input (cached/uncached) and
+        output tokens, and attribute them (with cost) to the current span.
+        """
+        if usage is None:
+            return
+        self.limiter.settle(model, reserved, usage.total_tokens)
+        self.tracer.add_usage(model, usage)
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+        with self._lock:
+            self.usage_log.append({
+                "time": time.time(),
+                "stage": stage,
+                "model": model,
+                "input_tokens": usage.prompt_tokens,
+                "cached_tokens": cached,
+                "uncached_tokens": usage.prompt_tokens - cached,
+                "output_tokens": getattr(usage, "completion_tokens", 0) or 0,  # embeddings have none
+            })
+
+    def usage_summary(self) -> dict:
+        """Per stage totals over the usage log, with the share of input tokens served from cache."""
+        with self._lock:
+            entries = list(self.usage_log)
+        out = {}
+        for e in entries:
+            s = out.setdefault(e["stage"], {
+                "requests": 0, "input_tokens": 0, "cached_tokens": 0, "uncached_tokens": 0, "output_tokens": 0,
+            })
+            s["requests"] += 1
+            for k in ("input_tokens", "cached_tokens", "uncached_tokens", "output_tokens"):
+                s[k] += e[k]
+        for s in out.values():
+            s["cached_ratio"] = s["cached_tokens"] / s["input_tokens"] if s["input_tokens"] else 0.0
+        return out
+
+    async def _limited(self, model: str, tokens: int, make_request, priority: int = PRIORITY_NORMAL):
+        """
+        Any other API call (Assistants) within `model`'s rate limit. The
+        request should use self._limited_client, so it isn't retried twice.
+        """
+        return await self.limiter.call(
+            model, tokens, make_request, priority, on_queue=self.tracer.add_queue_time
+        )
+
+    @traced("embed_for_cache")
+    async def embed_for_cache(self, query: str):
+        """Embedding of the normalized query for the answer cache's semantic tier (None on failure)."""
+        model = self.config.answer_cache_embedding_model
+        text = normalize_query(query)
+        reserved = estimate_tokens(text)
+        try:
+            resp = await self._limited(
+                model, reserved,
+                lambda: self._limited_client.embeddings.create(model=model, input=text),
+                PRIORITY_INTERACTIVE,
+            )
+        except Exception:
+            return None
+        self._record_usage("answer_cache_embed", model, reserved, resp.usage)
+        return resp.data[0].embedding
+
+    ###########################################################################
+    # AGENT #1
+    ###########################################################################
+    async def get_agent1_plan(self, user_query: str) -> str:
+        """Agent #1's plan from the plan cache if known, else a fresh run_agent_1 call."""
+        plan_cache = self.resources.plan_cache
+        if plan_cache is not None:
+            try:
+                plan = await asyncio.to_thread(plan_cache.get, user_query)
+                if plan is not None:
+                    return plan
+            except Exception:
+                pass
+
+        plan = await self.run_agent_1(user_query)
+        if plan_cache is not None:
+            try:
+                parsed = json.loads(plan)
+                if isinstance(parsed, dict) and parsed.get("type") in ("quantitative", "qualitative", "cube"):
+                    await asyncio.to_thread(plan_cache.put, user_query, plan)
+            except Exception:
+                pass
+        return plan
+
+    @traced("run_agent_1")
+    async def run_agent_1(self, user_query: str) -> str:
+        """
+        Returns JSON:
+          {"type":"quantitative","code":"..."}
+        or
+          {"type":"qualitative","column":"..." or ["...", ...],"prompt":"..."}
+        or (with an analytic cube)
+          {"type":"cube","queries":[{"op":"...", ...}, ...],"code":"..."}
+        """
+        try:
+            c = await self._chat(
+                PRIORITY_INTERACTIVE,
+                "agent1",
+                model=REASONING_MODEL,
+                reasoning_effort="high",
+                messages=[
+                    {"role": "developer", "content": self.agent1_instructions},
+                    {"role": "user", "content": user_query},
+                ],
+            )
+            return c.choices[0].message.content
+        except Exception as e:
+            return f"Error calling Agent #1: {e}"
+
+    ###########################################################################
+    # ANALYTIC CUBE (precomputed aggregates)
+    ###########################################################################
+    @traced("run_cube")
+    async def run_cube(self, queries: list) -> str:
+        """Results of Agent #1's cube queries as text (local, no API calls)."""
+        cube = self.resources.analytic_cube
+        if cube is None:
+            return "Error querying the analytic cube: no cube loaded"
+        if not isinstance(queries, list) or not queries:
+            return "Error querying the analytic cube: no queries in the plan"
+        try:
+            results = await asyncio.to_thread(lambda: [cube.run(q) for q in queries])
+        except Exception as e:
+            return f"Error querying the analytic cube: {e}"
+        return "\n\n".join(results)
+
+    ###########################################################################
+    # AGENT #2 (quantitative code)
+    ###########################################################################
+    @traced("run_agent_2")
+    async def run_agent_2(self, job: Job, plan_code: str) -> str:
+        if self.config.agent2_execution_mode == "local":
+            out_, error = await self.run_agent_2_local(job, plan_code)
+            if error is None or not self.config.local_exec_fallback_to_remote:
+                return out_ if error is None else f"{out_}\n\nError: {error}".strip()
+            job.image_file_ids.clear()
+        return await self.run_agent_2_remote(job, plan_code)
+
+    async def run_agent_2_local(self, job: Job, plan_code: str) -> tuple:
+        """
+        Runs Agent #1's code on a pre-warmed isolated worker against the shared
+        DataFrame. Figures are stored in the image cache under synthetic
+        "local-..." file IDs so display/PDF treat them like Code Interpreter plots.
+        Returns (output_text, error_or_None).
+        """
+        job.stage = "Agent #2 is running code locally..."
+        result = await asyncio.to_thread(self.resources.worker_pool.execute, plan_code)
+        out_ = result["output"].strip()
+        for png in result["images"]:
+            fid = "local-" + hashlib.sha256(png).hexdigest()[:24]
+            await asyncio.to_thread(self.resources.image_cache.put, fid, png)
+            job.image_file_ids.append(fid)
+            out_ += f"\n[ImageFileContentBlock with file_id={fid}]"
+        return out_.strip(), result["error"]
+
+    async def _create_thread(self) -> str:
+        return (await self.client.beta.threads.create()).id
+
+    async def _warm_up_thread(self, thread_id: str):
+        """
+        One short run so the thread's sandbox is started and the CSV loaded.
+        Its messages are deleted afterwards, so the conversation that leases
+        the thread starts with no history (only the sandbox stays warm).
+        """
+        await self.client.beta.threads.messages.create(
+            thread_id=thread_id, role="user", content=WARM_UP_MESSAGE
+        )
+        run_ = await self._limited(
+            self.config.agent2_model,
+            estimate_tokens(WARM_UP_MESSAGE) + 500,
+            lambda: self._limited_client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=self.resources.assistant_id,
+                instructions=AGENT2_RUN_INSTRUCTIONS,
+            ),
+            PRIORITY_BULK,
+        )
+        run_ = await self._poll_agent2_run(thread_id, run_.id)
+        if run_.status != "completed":
+            raise RuntimeError(f"warm-up run {run_.status}")
+        warm_up_messages = [m.id async for m in self.client.beta.threads.messages.list(thread_id=thread_id)]
+        await asyncio.gather(*(
+            self.client.beta.threads.messages.delete(message_id, thread_id=thread_id)
+            for message_id in warm_up_messages
+        ))
+
+    async def lease_thread(self) -> str:
+        """A Code Interpreter thread for a new conversation (pre-warmed when the pool has one)."""
+        if self.ci_pool is not None:
+            return await self.ci_pool.lease()
+        return await self._create_thread()
+
+    async def run_agent_2_remote(self, job: Job, plan_code: str) -> str:
+        job.stage = "Agent #2 is running code..."
+        out_ = ""
+        try:
+            if job.thread_id is None:
+                job.thread_id = await self.lease_thread()
+
+            content_ = (
+                "Here is the Python code from Agent #1. "
+                "Please run it and provide all outputs (text, plots, data). "
+                "Code:\n\n" + plan_code
+            )
+            await self.client.beta.threads.messages.create(
+                thread_id=job.thread_id,
+                role="user",
+                content=content_
+            )
+
+            instructions = AGENT2_RUN_INSTRUCTIONS
+            reserved = estimate_tokens(content_) + self.config.output_tokens_estimate
+            run_id, run_, messages = None, None, None
+            if self.config.agent2_stream_runs:
+                try:
+                    run_id, run_, messages = await self._stream_agent2_run(job, instructions, reserved)
+                except Exception:
+                    pass
+            if run_ is None:
+                if run_id is None:
+                    created = await self._limited(
+                        self.config.agent2_model,
+                        reserved,
+                        lambda: self._limited_client.beta.threads.runs.create(
+                            thread_id=job.thread_id,
+                            assistant_id=self.resources.assistant_id,
+                            instructions=instructions,
+                        ),
+                    )
+                    run_id = created.id
+                run_ = await self._poll_agent2_run(job.thread_id, run_id)
+
+            if messages is None:
+                # Only this run's messages (oldest first), so follow-ups don't
+                # re-parse earlier answers or re-collect their images. Iterating
+                # the page object follows the cursor across pages.
+                messages = [
+                    m async for m in self.client.beta.threads.messages.list(
+                        thread_id=job.thread_id,
+                        run_id=run_.id,
+                        order="asc",
+                        limit=100,
+                    )
+                ]
+            self._record_usage("agent2", self.config.agent2_model, reserved, getattr(run_, "usage", None))
+            for m in messages:
+                if m.role == "assistant":
+                    out_ += self._parse_message_content(job, m.content)
+            if run_.status != "completed" and not out_.strip():
+                return f"Error calling Agent #2: run {run_.status} ({run_.last_error})"
+            return out_.strip()
+        except Exception as ex:
+            return f"Error calling Agent #2: {ex}"
+
+    async def _stream_agent2_run(self, job: Job, instructions: str, reserved: int) -> tuple:
+        """
+        Creates the run with stream=True and follows its events: finished
+        steps are reported in job.progress, completed assistant messages are
+        collected, and the terminal run event ends it (no polling).
+        Returns (run_id, run, messages); run and messages are None if the
+        stream ended before a terminal event, so the caller polls run_id.
+        """
+        stream = await self._limited(
+            self.config.agent2_model,
+            reserved,
+            lambda: self._limited_client.beta.threads.runs.create(
+                thread_id=job.thread_id,
+                assistant_id=self.resources.assistant_id,
+                instructions=instructions,
+                stream=True,
+            ),
+        )
+        run_id, messages = None, []
+        try:
+            async for event in stream:
+                name, data = event.event, event.data
+                if name == "thread.run.created":
+                    run_id = data.id
+                elif name == "thread.run.step.created" and data.step_details.type == "tool_calls":
+                    job.stage = "Agent #2 is executing code..."
+                elif name == "thread.run.step.completed" and data.step_details.type == "tool_calls":
+                    self._record_tool_calls(job, data.step_details.tool_calls)
+                elif name == "thread.message.completed":
+                    messages.append(data)
+                elif name in _TERMINAL_RUN_EVENTS:
+                    return data.id, data, messages
+        except Exception:
+            pass
+        return run_id, None, None
+
+    @staticmethod
+    def _record_tool_calls(job: Job, tool_calls: list):
+        """Append one progress line per executed code block and per output it produced."""
+        for call in tool_calls:
+            if call.type != "code_interpreter":
+                continue
+            code = call.code_interpreter.input or ""
+            first = next((line for line in code.splitlines() if line.strip()), "")
+            job.progress.append(f"Executed code ({len(code.splitlines())} lines): {first[:80]}")
+            for output in call.code_interpreter.outputs or []:
+                if output.type == "image":
+                    job.progress.append(f"Created image {output.image.file_id}")
+                elif output.type == "logs" and output.logs.strip():
+                    job.progress.append(f"Output: {output.logs.strip().splitlines()[0][:120]}")
+
+    async def _poll_agent2_run(self, thread_id: str, run_id: str):
+        """
+        Fallback when streaming isn't available: polls the run until it's
+        terminal, starting at agent2_poll_initial seconds and backing off
+        x1.5 up to agent2_poll_max; the interval resets when the status changes.
+        """
+        interval = self.config.agent2_poll_initial
+        status = None
+        while True:
+            run_ = await self.client.beta.threads.runs.retrieve(run_id, thread_id=thread_id)
+            if run_.status in _TERMINAL_RUN_STATUSES:
+                return run_
+            if run_.status != status:
+                status, interval = run_.status, self.config.agent2_poll_initial
+            await asyncio.sleep(interval)
+            interval = min(self.config.agent2_poll_max, interval * 1.5)
+
+    @staticmethod
+    def _parse_message_content(job: Job, cval) -> str:
+        out_ = ""
+        if isinstance(cval, list):
+            for block in cval:
+                if isinstance(block, dict):
+                    btype = block.get("type")
+                    if btype == "text":
+                        txt_ = block["text"].get("value", "")
+                        out_ += txt_ + "\n\n"
+                    elif btype in ["image_file", "ImageFileContentBlock"]:
+                        im = block.get("image_file", {})
+                        fid = im.get("file_id", "")
+                        out_ += f"[ImageFileContentBlock with file_id={fid}]\n"
+                        job.image_file_ids.append(fid)
+                    else:
+                        out_ += str(block) + "\n\n"
+                else:
+                    block_str = str(block)
+                    if "type='image_file'" in block_str:
+                        match = re.search(r"file_id='(file-[^']+)'", block_str)
+                        if match:
+                            out_ += f"[ImageFileContentBlock with file_id={match.group(1)}]\n"
+                            job.image_file_ids.append(match.group(1))
+                    else:
+                        out_ += block_str + "\n\n"
+        else:
+            out_ += str(cval) + "\n\n"
+        return out_
+
+    ###########################################################################
+    # QUALITATIVE TEXT ANALYSIS
+    ###########################################################################
+    def _get_response_index(self):
+        """(ResponseIndex, embed) once its startup build has finished, else None."""
+        task = self._response_index
+        if task is None or not task.done() or task.exception() is not None:
+            return None
+        return task.result()
+
+    async def embed_for_retrieval(self, query: str):
+        """The query's vector in the response index's embedding space (None if unavailable)."""
+        resources = self._get_response_index()
+        if resources is None:
+            return None
+        _, embed = resources
+        return (await asyncio.to_thread(embed, [query]))[0]
+
+    async def retrieve_responses(self, query: str, columns: list, k: int, query_vector=None):
+        """
+        Top-k responses to `query` within `columns`, as "[column | row N] text"
+        lines. None if retrieval isn't available for these columns.
+        """
+        resources = self._get_response_index()
+        if resources is None:
+            return None
+        index, _ = resources
+        if any(c not in index.columns for c in columns):
+            return None
+        if query_vector is None:
+            query_vector = await self.embed_for_retrieval(query)
+        hits = await asyncio.to_thread(index.search, query_vector, k, columns)
+        df = self.resources.df
+        return [f"[{col} | row {row}] {df.at[row, col]}" for col, row, _ in hits]
+
+    async def answer_from_digest(self, columns: list, prompt: str):
+        """
+        Try to answer from the columns' precomputed digests. Returns None when
+        any column has no digest or the digests aren't enough, which a cheap
+        digest_check_model call decides first, so o1 only runs once either way.
+        """
+        digests = self.resources.digests
+        if not digests or any(c not in digests["columns"] for c in columns):
+            return None
+        marker = self.config.digest_needs_raw_marker
+        content = prompt + "".join(
+            "\n\n=== COLUMN DIGEST ===\n" + render_digest(c, digests["columns"][c])
+            for c in columns
+        )
+        check = await self._chat(
+            PRIORITY_NORMAL,
+            "qual_digest_check",
+            model=self.config.digest_check_model,
+            max_tokens=10,
+            messages=[
+                {"role": "developer", "content": (
+                    "You are given a task and precomputed digests (themes with counts, representative quotes, "
+                    "sentiment) of all responses to one or more survey questions. Do not do the task. If it "
+                    "can be done properly from the digests alone, reply with exactly DIGESTS_OK. If it requires "
+                    "reading the individual responses (e.g. searching for something specific the digests do "
+                    f"not cover), reply with exactly {marker}."
+                )},
+                {"role": "user", "content": content},
+            ]
+        )
+        if marker in (check.choices[0].message.content or ""):
+            return None
+        completion = await self._chat(
+            PRIORITY_NORMAL,
+            "qual_digest",
+            model=REASONING_MODEL,
+            messages=[
+                {"role": "developer", "content": (
+                    "You are a helpful assistant that includes direct quotes if possible. "
+                    "You are given precomputed digests (themes with counts, representative quotes, sentiment) "
+                    "of all responses to one or more survey questions. Answer from the digests."
+                )},
+                {"role": "user", "content": content},
+            ]
+        )
+        return completion.choices[0].message.content or ""
+
+    async def _analyze_text_chunk(self, prompt: str, chunk: str, idx: int, total: int) -> str:
+        """Map step: partial findings for one chunk."""
+        completion = await self._chat(
+            PRIORITY_BULK,
+            "qual_map",
+            model=self.config.qual_map_model,
+            messages=[
+                {"role": "developer", "content": (
+                    "You are a helpful assistant analyzing one part of a larger set of survey responses. "
+                    "Report the main themes with approximate counts of responses supporting each, "
+                    "and include verbatim direct quotes (copied exactly) that best illustrate them."
+                )},
+                {"role": "user", "content": (
+                    prompt
+                    + f"\n\n(This is part {idx+1} of {total} of the responses.)"
+                    + "\n\n=== SAMPLE TEXT DATA ===\n"
+                    + chunk
+                )},
+            ],
+        )
+        return completion.choices[0].message.content
+
+    @traced("run_local_llm_on_text")
+    async def run_local_llm_on_text(self, column_name, prompt: str, user_query: str = "",
+                                    query_vector=None) -> str:
+        """
+        Qualitative analysis of one column (or a list of columns). Answers from
+        the precomputed column digests when possible. Otherwise, with a user
+        query, prompts with the qual_retrieval_top_k most relevant responses
+        from the local response index (fixed prompt size). Without either, reads
+        the raw responses: columns that fit in one qual_chunk_tokens budget go in
+        a single o1 call; longer ones are map-reduced: chunks are analyzed
+        concurrently (qual_map_workers), then one reduce call merges the partial
+        findings and their quotes.
+        """
+        try:
+            df = self.resources.df
+            columns = column_name if isinstance(column_name, list) else [column_name]
+            for c in columns:
+                if c not in df.columns:
+                    return f"Error: The column '{c}' is not found in the dataset."
+
+            if self.config.qual_use_digests:
+                digest_answer = await self.answer_from_digest(columns, prompt)
+                if digest_answer is not None:
+                    return digest_answer
+
+            retrieved = None
+            if self.config.qual_retrieval_enabled and user_query:
+                retrieved = await self.retrieve_responses(
+                    user_query, columns, self.config.qual_retrieval_top_k, query_vector
+                )
+
+            if retrieved is not None:
+                text_data = retrieved
+            elif len(columns) == 1:
+                text_data = df[columns[0]].dropna().astype(str).tolist()
+            else:
+                text_data = [
+                    f"[{c}] {v}" for c in columns for v in df[c].dropna().astype(str).tolist()
+                ]
+            chunks = chunk_responses(text_data, self.config.qual_chunk_tokens)
+
+            if len(chunks) <= 1:
+                local_prompt = (
+                    prompt
+                    + (f"\n\n(The {len(text_data)} responses most relevant to the question were retrieved.)"
+                       if retrieved is not None else "")
+                    + "\n\n=== SAMPLE TEXT DATA ===\n"
+                    + (chunks[0] if chunks else "")
+                )
+            else:
+                sem = asyncio.Semaphore(self.config.qual_map_workers)
+
+                async def analyze(idx, chunk):
+                    async with sem:
+                        return await self._analyze_text_chunk(prompt, chunk, idx, len(chunks))
+
+                partials = await asyncio.gather(*(analyze(i, c) for i, c in enumerate(chunks)))
+                local_prompt = (
+                    prompt
+                    + f"\n\nThe {len(text_data)} responses were analyzed in {len(chunks)} parts. "
+                    "Merge the partial findings below into one analysis: combine overlapping themes, "
+                    "add up their counts, and keep only direct quotes that appear verbatim in the partial findings."
+                    + "".join(
+                        f"\n\n=== PARTIAL FINDINGS {i+1}/{len(partials)} ===\n{p}"
+                        for i, p in enumerate(partials)
+                    )
+                )
+
+            completion = await self._chat(
+                PRIORITY_NORMAL,
+                "qual_reduce",
+                model=REASONING_MODEL,
+                messages=[
+                    {"role": "developer", "content": "You are a helpful assistant that includes direct quotes if possible."},
+                    {"role": "user", "content": local_prompt}
+                ]
+            )
+            return completion.choices[0].message.content
+        except Exception as e:
+            return f"Error during local LLM call: {e}"
+
+    ###########################################################################
+    # AGENT #3 QUANT + QUAL (streamed into job.summary)
+    ###########################################################################
+    async def _stream_summary(self, job: Job, error_prefix: str, **create_kwargs) -> str:
+        try:
+            stream = await self._chat(
+                PRIORITY_INTERACTIVE, "agent3", stream=True, stream_options={"include_usage": True}, **create_kwargs
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    job.summary += chunk.choices[0].delta.content
+                if getattr(chunk, "usage", None):
+                    self._record_usage(
+                        "agent3", create_kwargs["model"],
+                        self._estimate_tokens(create_kwargs["messages"]), chunk.usage,
+                    )
+        except Exception as e:
+            job.summary = f"{error_prefix}: {e}"
+        return job.summary
+
+    @traced("run_agent_3_quant")
+    async def run_agent_3_quant(self, job: Job) -> str:
+        source = "Precomputed aggregate query results" if job.plan_type == "cube" else "Agent #2's code execution outputs"
+        final_msg = (
+            f"You are Agent #3. The user asked:\n'{job.query}'\n\n"
+            "Agent #1's plan/code:\n"
+            f"{job.plan}\n\n"
+            f"{source}:\n"
+            f"{job.analysis}\n\n"
+            + (PREDICTOR_NOTE if "top_predictors(" in job.analysis else "")
+            + "Please produce a concise final answer in **Markdown** with minimal jargon. "
+            "Start with a direct numeric/statistical answer, then a short explanation. "
+            "Do **not** embed any images or plots in your text. NEVER RETURN OR SHOW ANY CODE "
+            "Do not mention 'agents' or the underlying process, and never suggest that the dataset needs further refinement/cleaning."
+        )
+        return await self._stream_summary(
+            job,
+            "Error calling Agent #3 (quant)",
+            model=REASONING_MODEL,
+            reasoning_effort="high",
+            messages=[
+                {
+                    "role": "developer",
+                    "content": "You are Agent #3. Summarize a quantitative analysis in plain Markdown with no mention of images."
+                },
+                {"role": "user", "content": final_msg}
+            ]
+        )
+
+    @traced("run_agent_3_fast")
+    async def run_agent_3_fast(self, job: Job) -> str:
+        """Short answer to a fast-path lookup: a non-reasoning model is enough to read one table."""
+        final_msg = (
+            f"The user asked:\n'{job.query}'\n\n"
+            "Precomputed aggregate for the survey column it asks about:\n"
+            f"{job.analysis}\n\n"
+            "Answer in **Markdown** in a few sentences: start with the direct number(s) from the table "
+            "(counts and percentages of those who answered, and how many gave no answer), "
+            "then the most notable points of the distribution. Use only the numbers shown. "
+            "NEVER RETURN OR SHOW ANY CODE. Do not mention 'agents', tables or the underlying process."
+        )
+        return await self._stream_summary(
+            job,
+            "Error calling Agent #3 (fast)",
+            model=self.config.fast_path_model,
+            messages=[
+                {"role": "system", "content": "You answer simple survey statistics questions in plain Markdown."},
+                {"role": "user", "content": final_msg}
+            ]
+        )
+
+    @traced("run_agent_3_qual")
+    async def run_agent_3_qual(self, job: Job) -> str:
+        final_msg = (
+            f"You are Agent #3. The user asked:\n'{job.query}'\n\n"
+            "Agent #1's plan (qualitative text analysis):\n"
+            f"{job.plan}\n\n"
+            "Local LLM analysis outputs:\n"
+            f"{job.analysis}\n\n"
+            "Please produce a final answer in **Markdown** that emphasizes the rich text insights, "
+            "including direct quotes if they appear in the analysis. Begin with a direct conclusion, then highlight any themes or sentiments. "
+            "Do not mention 'agents' or the underlying process, just present the text-based findings in a structured, user-friendly manner."
+        )
+        return await self._stream_summary(
+            job,
+            "Error calling Agent #3 (qual)",
+            model=REASONING_MODEL,
+            reasoning_effort="high",
+            messages=[
+                {
+                    "role": "developer",
+                    "content": "You are Agent #3, summarizing a qualitative text analysis in plain Markdown with direct quotes."
+                },
+                {"role": "user", "content": final_msg}
+            ]
+        )
+
+    ###########################################################################
+    # IMAGE FETCH
+    ###########################################################################
+    async def fetch_image_bytes(self, file_id: str) -> bytes:
+        """Attempt the OpenAI library first, else a direct GET on the pooled HTTP client."""
+        try:
+            resp = await self.client.with_options(timeout=self.config.image_fetch_timeout).files.content(file_id)
+            return resp.content
+        except Exception:
+            pass
+        try:
+            r = await self._http.get(f"{self.client.base_url}files/{file_id}/content")
+            r.raise_for_status()
+            return r.content
+        except Exception:
+            return b""
+
+    @traced("fetch_images")
+    async def fetch_images(self, file_ids: list) -> list:
+        """
+        Resolve all file_ids, downloading only those missing from the image
+        cache, concurrently (at most image_fetch_workers at once).
+        Returns the bytes in the same order as file_ids (b"" on failure).
+        """
+        if not file_ids:
+            return []
+        cache = self.resources.image_cache
+        sem = asyncio.Semaphore(self.config.image_fetch_workers)
+
+        async def resolve(fid):
+            b_ = await asyncio.to_thread(cache.get, fid)
+            if b_ is not None or fid.startswith(SYNTHETIC_ID_PREFIXES):
+                return b_ or b""
+            async with sem:
+                b_ = await self.fetch_image_bytes(fid)
+            if b_:
+                await asyncio.to_thread(cache.put, fid, b_)
+            return b_
+
+        return list(await asyncio.gather(*(resolve(fid) for fid in file_ids)))
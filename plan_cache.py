@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+from answer_cache import normalize_query
+
+
+def schema_version(*parts: str) -> str:
+    """Short hash of everything Agent #1's plan depends on besides the query."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+class PlanCache:
+    """
+    Memoizes Agent #1's JSON plans by (schema version, normalized query),
+    independently of final answers, so a fresh summary can still be
+    generated without paying for the high-effort planning call again.
+
+    Pinned plans are vetted plans kept in a JSON file (`pinned_path`):
+      {"<normalized query>": {"schema_version": "...", "plan": "<plan JSON string>"}}
+    They take precedence over learned entries and never expire; pins made
+    against another schema version are ignored. Learned entries live in
+    SQLite and are dropped LRU beyond `max_entries`.
+
+    `stats` holds process-wide hit/miss counters. Thread-safe.
+    """
+
+    def __init__(self, path: str, pinned_path: str, schema_version: str, max_entries: int = 1000):
+        self.schema_version = schema_version
+        self.pinned_path = pinned_path
+        self.max_entries = max_entries
+        self.stats = {"pinned_hits": 0, "hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._pinned = self._load_pinned()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS plans (
+                    schema_version TEXT NOT NULL,
+                    query_norm     TEXT NOT NULL,
+                    plan           TEXT NOT NULL,
+                    created_at     REAL NOT NULL,
+                    last_used      REAL NOT NULL,
+                    hits           INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (schema_version, query_norm)
+                )
+                """
+            )
+            self._db.execute("DELETE FROM plans WHERE schema_version != ?", (schema_version,))
+
+    def _load_pinned(self) -> dict:
+        try:
+            with open(self.pinned_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, query: str):
+        """The cached plan string for `query`, or None (counted as a miss)."""
+        query_norm = normalize_query(query)
+        with self._lock:
+            pin = self._pinned.get(query_norm)
+            if pin and pin.get("schema_version") == self.schema_version:
+                self.stats["pinned_hits"] += 1
+                return pin["plan"]
+            with self._db:
+                row = self._db.execute(
+                    "SELECT plan FROM plans WHERE schema_version = ? AND query_norm = ?",
+                    (self.schema_version, query_norm),
+                ).fetchone()
+                if row is None:
+                    self.stats["misses"] += 1
+                    return None
+                self._db.execute(
+                    "UPDATE plans SET last_used = ?, hits = hits + 1 "
+                    "WHERE schema_version = ? AND query_norm = ?",
+                    (time.time(), self.schema_version, query_norm),
+                )
+            self.stats["hits"] += 1
+            return row[0]
+
+    def put(self, query: str, plan: str):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO plans VALUES (?, ?, ?, ?, ?, 0)",
+                (self.schema_version, normalize_query(query), plan, now, now),
+            )
+            self._db.execute(
+                "DELETE FROM plans WHERE rowid IN ("
+                "SELECT rowid FROM plans ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def _save_pinned(self):
+        tmp_path = self.pinned_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._pinned, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.pinned_path)
+
+    def pin(self, query: str, plan: str):
+        """Mark `plan` as the vetted plan for `query` (persisted to pinned_path)."""
+        with self._lock:
+            self._pinned[normalize_query(query)] = {"schema_version": self.schema_version, "plan": plan}
+            self._save_pinned()
+
+    def unpin(self, query: str):
+        with self._lock:
+            if self._pinned.pop(normalize_query(query), None) is not None:
+                self._save_pinned()
+
+    def is_pinned(self, query: str) -> bool:
+        pin = self._pinned.get(normalize_query(query))
+        return bool(pin) and pin.get("schema_version") == self.schema_version
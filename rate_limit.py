@@ -0,0 +1,180 @@
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+
+import openai
+
+# Priority lanes (lower is served first when a model's budget is contended)
+PRIORITY_INTERACTIVE = 0   # calls a user is directly waiting on (planning, final summary)
+PRIORITY_NORMAL = 1        # analysis calls
+PRIORITY_BULK = 2          # fan-out work (map-reduce chunks)
+LANE_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_NORMAL: "normal", PRIORITY_BULK: "bulk"}
+
+
+def is_retryable(exc: Exception) -> bool:
+    """429s, 5xx, timeouts and dropped connections are worth retrying."""
+    if isinstance(exc, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code >= 500
+
+
+def _retry_after(exc: Exception):
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class _ModelBudget:
+    """Requests/min + tokens/min token buckets and the priority queue of waiters for one model."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm, self.tpm = rpm, tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiters = []           # heap of (priority, seq)
+        self.cond = asyncio.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60.0)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60.0)
+
+    def delay_for(self, tokens: int) -> float:
+        """Seconds until one request of `tokens` fits in both buckets (0 if it fits now)."""
+        self._refill()
+        delay = max(0.0, self.paused_until - time.monotonic())
+        if self.requests < 1:
+            delay = max(delay, (1 - self.requests) * 60.0 / self.rpm)
+        if self.tokens < tokens:
+            delay = max(delay, (tokens - self.tokens) * 60.0 / self.tpm)
+        return delay
+
+
+class RateLimiter:
+    """
+    Process-wide client-side limiter for OpenAI calls, made on one asyncio
+    loop. Each model gets a requests/min and a tokens/min token bucket
+    (`limits`: {model: (rpm, tpm)}, `default_limit` for unlisted models).
+
+    Callers reserve an estimated token count up front and `settle` it
+    against the real usage afterwards. When a model's budget is exhausted,
+    waiters are served by priority lane, then FIFO. `call` adds retries
+    with exponential backoff + full jitter on 429/5xx/connection errors,
+    honouring Retry-After and pausing the whole model on a 429.
+
+    `stats()` reports per model/lane request counts, queue time and retries.
+    """
+
+    def __init__(self, limits: dict = None, default_limit: tuple = (500, 200_000),
+                 max_retries: int = 5, backoff_base: float = 1.0, backoff_max: float = 30.0):
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._budgets = {}
+        self._seq = itertools.count()
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def _budget(self, model: str) -> _ModelBudget:
+        if model not in self._budgets:
+            self._budgets[model] = _ModelBudget(*self.limits.get(model, self.default_limit))
+        return self._budgets[model]
+
+    def _record(self, model: str, priority: int, **deltas):
+        with self._stats_lock:
+            s = self._stats.setdefault((model, priority), {
+                "requests": 0, "queue_seconds": 0.0, "max_queue_seconds": 0.0,
+                "retries": 0, "rate_limited": 0,
+            })
+            for k, v in deltas.items():
+                if k == "max_queue_seconds":
+                    s[k] = max(s[k], v)
+                else:
+                    s[k] += v
+
+    def stats(self) -> dict:
+        """{"<model> / <lane>": {requests, queue_seconds, avg/max_queue_seconds, retries, rate_limited}}"""
+        with self._stats_lock:
+            out = {}
+            for (model, priority), s in sorted(self._stats.items()):
+                s = dict(s)
+                s["avg_queue_seconds"] = s["queue_seconds"] / s["requests"] if s["requests"] else 0.0
+                out[f"{model} / {LANE_NAMES.get(priority, priority)}"] = s
+            return out
+
+    async def acquire(self, model: str, tokens: int, priority: int = PRIORITY_NORMAL) -> float:
+        """Wait for budget for one request of ~`tokens`; returns the seconds spent queued."""
+        budget = self._budget(model)
+        tokens = min(tokens, budget.tpm)  # a single oversized request must still get through
+        entry = (priority, next(self._seq))
+        start = time.monotonic()
+        async with budget.cond:
+            heapq.heappush(budget.waiters, entry)
+            try:
+                while True:
+                    timeout = None
+                    if budget.waiters[0] == entry:
+                        timeout = budget.delay_for(tokens)
+                        if timeout <= 0:
+                            budget.requests -= 1
+                            budget.tokens -= tokens
+                            break
+                    try:
+                        await asyncio.wait_for(budget.cond.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                budget.waiters.remove(entry)
+                heapq.heapify(budget.waiters)
+                budget.cond.notify_all()
+        waited = time.monotonic() - start
+        self._record(model, priority, requests=1, queue_seconds=waited, max_queue_seconds=waited)
+        return waited
+
+    def settle(self, model: str, reserved: int, actual: int):
+        """Correct a reservation with the real token usage (refund or charge the difference)."""
+        if actual is None:
+            return
+        budget = self._budget(model)
+        budget.tokens = min(budget.tpm, budget.tokens + min(reserved, budget.tpm) - actual)
+
+    def _pause(self, model: str, seconds: float):
+        budget = self._budget(model)
+        budget.paused_until = max(budget.paused_until, time.monotonic() + seconds)
+
+    async def call(self, model: str, tokens: int, make_request, priority: int = PRIORITY_NORMAL,
+                   on_queue=None):
+        """
+        Await make_request() (a zero-arg coroutine function) within the
+        model's budget, retrying retryable failures. Re-raises the last error.
+        on_queue(seconds), if given, receives the time spent waiting for budget.
+        """
+        for attempt in range(self.max_retries + 1):
+            waited = await self.acquire(model, tokens, priority)
+            if on_queue is not None:
+                on_queue(waited)
+            try:
+                return await make_request()
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                if isinstance(e, openai.RateLimitError):
+                    self._pause(model, delay)
+                    self._record(model, priority, rate_limited=1)
+                self._record(model, priority, retries=1)
+                await asyncio.sleep(delay)
@@ -0,0 +1,229 @@
+"""
+Record OpenAI HTTP exchanges once, then replay them from a local stand-in
+server, for offline benchmarks (see benchmark.py).
+
+Fixtures are JSONL: an optional {"meta": {...}} line, then one exchange
+per line:
+  {"method", "path", "body_key", "status", "content_type", "content_encoding",
+   "ttfb": seconds to response headers,
+   "chunks": [[seconds since headers, base64 bytes], ...]}
+Streamed (SSE) responses keep their per-chunk timing, so replay reproduces
+time-to-first-token as well as total latency. Covers every endpoint the
+pipeline uses (chat completions, files, assistants, threads, messages,
+runs) since it works at the HTTP level.
+"""
+import json
+import time
+import base64
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import httpx
+
+
+def body_key(body: bytes) -> str:
+    """Stable key for a request body (JSON is canonicalized; anything else hashed raw)."""
+    try:
+        canonical = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False).encode("utf-8")
+    except (ValueError, UnicodeDecodeError):
+        canonical = body or b""
+    return hashlib.sha256(canonical).hexdigest()[:16]
+
+
+def _path(url) -> str:
+    """Request path below the API root, e.g. "/chat/completions" (query string kept)."""
+    path = url.raw_path.decode("ascii") if hasattr(url, "raw_path") else url
+    return path[path.index("/v1") + 3:] if "/v1" in path else path
+
+
+###############################################################################
+# RECORD
+###############################################################################
+class _RecordingStream(httpx.AsyncByteStream):
+    def __init__(self, inner, on_done):
+        self.inner = inner
+        self.on_done = on_done
+        self.start = time.monotonic()
+        self.chunks = []
+
+    async def __aiter__(self):
+        async for chunk in self.inner:
+            self.chunks.append([round(time.monotonic() - self.start, 4), base64.b64encode(chunk).decode("ascii")])
+            yield chunk
+
+    async def aclose(self):
+        await self.inner.aclose()
+        self.on_done(self.chunks)
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """httpx transport that forwards to `inner` and appends each exchange to `path`."""
+
+    def __init__(self, path: str, inner: httpx.AsyncBaseTransport = None, meta: dict = None):
+        self.path = path
+        self.inner = inner or httpx.AsyncHTTPTransport()
+        self._lock = threading.Lock()
+        if meta is not None:
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"meta": meta}) + "\n")
+
+    def _append(self, record: dict):
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        start = time.monotonic()
+        response = await self.inner.handle_async_request(request)
+        ttfb = round(time.monotonic() - start, 4)
+        record = {
+            "method": request.method,
+            "path": _path(request.url),
+            "body_key": body_key(body),
+            "status": response.status_code,
+            "content_type": response.headers.get("content-type", ""),
+            "content_encoding": response.headers.get("content-encoding", ""),
+            "ttfb": ttfb,
+        }
+
+        def done(chunks):
+            record["chunks"] = chunks
+            self._append(record)
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response.stream, done),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+###############################################################################
+# REPLAY
+###############################################################################
+def load_fixtures(path: str) -> tuple:
+    """(meta, {(method, path, body_key): [exchange, ...]}, {(method, path): [exchange, ...]})"""
+    meta, exact, by_path = {}, {}, {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "meta" in record:
+                meta = record["meta"]
+                continue
+            exact.setdefault((record["method"], record["path"], record["body_key"]), []).append(record)
+            by_path.setdefault((record["method"], record["path"]), []).append(record)
+    return meta, exact, by_path
+
+
+class ReplayServer:
+    """
+    Local stand-in for the OpenAI API serving recorded exchanges.
+
+    A request is matched on (method, path, body key); repeated identical
+    requests (e.g. run polling) get the recorded responses in order, then
+    the last one again. Unmatched requests fall back to any exchange
+    recorded for the same method + path, else a 404 error body.
+    `latency_scale` multiplies recorded delays (0 => no delay).
+    `stats` counts exact hits, path fallbacks and misses.
+    """
+
+    def __init__(self, fixtures_path: str, latency_scale: float = 1.0, host: str = "127.0.0.1", port: int = 0):
+        self.meta, self._exact, self._by_path = load_fixtures(fixtures_path)
+        self.latency_scale = latency_scale
+        self._counters = {}
+        self._lock = threading.Lock()
+        self.stats = {"exact": 0, "fallback": 0, "miss": 0}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get("content-length") or 0)
+                body = self.rfile.read(length) if length else b""
+                server._serve(self, self.command, _path(self.path), body)
+
+            do_GET = do_POST = do_DELETE = _handle
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _pick(self, method: str, path: str, body: bytes):
+        key = (method, path, body_key(body))
+        with self._lock:
+            candidates, kind = self._exact.get(key), "exact"
+            if candidates is None:
+                candidates, kind = self._by_path.get((method, path)), "fallback"
+                key = (method, path)
+            if candidates is None:
+                self.stats["miss"] += 1
+                return None
+            self.stats[kind] += 1
+            n = self._counters.get(key, 0)
+            self._counters[key] = n + 1
+            return candidates[min(n, len(candidates) - 1)]
+
+    def _serve(self, handler, method: str, path: str, body: bytes):
+        record = self._pick(method, path, body)
+        if record is None:
+            payload = json.dumps({"error": {"message": f"no fixture for {method} {path}", "type": "replay_miss"}}).encode()
+            handler.send_response(404)
+            handler.send_header("content-type", "application/json")
+            handler.send_header("content-length", str(len(payload)))
+            handler.end_headers()
+            handler.wfile.write(payload)
+            return
+
+        time.sleep(record["ttfb"] * self.latency_scale)
+        chunks = [(offset, base64.b64decode(data)) for offset, data in record.get("chunks", [])]
+        handler.send_response(record["status"])
+        handler.send_header("content-type", record["content_type"] or "application/json")
+        if record.get("content_encoding"):
+            handler.send_header("content-encoding", record["content_encoding"])  # chunks are stored as received
+        handler.send_header("transfer-encoding", "chunked")
+        handler.end_headers()
+        start = time.monotonic()
+        for offset, data in chunks:
+            delay = offset * self.latency_scale - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+            if data:
+                handler.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                handler.wfile.flush()
+        handler.wfile.write(b"0\r\n\r\n")
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="replay-server", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def serve_forever(fixtures_path: str, latency_scale: float, conn):
+    """
+    Entry point for running the server in a separate process: sends
+    base_url through `conn`, then answers "stats" until "stop".
+    """
+    server = ReplayServer(fixtures_path, latency_scale)
+    conn.send(server.start())
+    while conn.recv() != "stop":
+        conn.send(dict(server.stats))
+    server.stop()
@@ -0,0 +1,112 @@
+import os
+import json
+
+import numpy as np
+
+DEFAULT_EMBEDDING_MODEL = "BAAI/bge-small-en-v1.5"  # small, CPU-only (ONNX via fastembed)
+
+
+def load_embedder(model_name: str = DEFAULT_EMBEDDING_MODEL):
+    """
+    Returns embed(texts: list[str]) -> float32 array (n, dim), L2-normalized.
+    fastembed is imported lazily so the app still runs without it.
+    """
+    from fastembed import TextEmbedding
+    model = TextEmbedding(model_name)
+
+    def embed(texts: list) -> np.ndarray:
+        vecs = np.asarray(list(model.embed(texts)), dtype=np.float32)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vecs / norms
+
+    return embed
+
+
+class ResponseIndex:
+    """
+    Vector index over free-text survey responses.
+
+    On disk (`index_dir`):
+      vectors.npy  float32 (n, dim), L2-normalized, memory-mapped on load
+      ids.npy      int32 (n, 2): (column id, DataFrame row index) per vector
+      meta.json    {"model", "dataset_sha256", "columns": [names by column id]}
+
+    Response text is not stored; callers resolve (column, row) against the
+    DataFrame, so the index holds no plaintext survey data.
+    """
+
+    def __init__(self, index_dir: str, vectors, ids, meta: dict):
+        self.index_dir = index_dir
+        self.vectors = vectors
+        self.ids = ids
+        self.meta = meta
+        self.columns = meta["columns"]
+
+    @classmethod
+    def build(cls, index_dir: str, df, columns: list, embed, dataset_sha256: str,
+              model_name: str = DEFAULT_EMBEDDING_MODEL, batch_size: int = 256):
+        texts, ids, names = [], [], []
+        for col_id, column in enumerate(c for c in columns if c in df.columns):
+            names.append(column)
+            series = df[column].dropna().astype(str)
+            for row, text in series.items():
+                if text.strip():
+                    texts.append(text)
+                    ids.append((col_id, int(row)))
+
+        if texts:
+            vectors = np.concatenate([
+                embed(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)
+            ]).astype(np.float32)
+        else:
+            vectors = np.zeros((0, 1), dtype=np.float32)
+
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, "vectors.npy"), vectors)
+        np.save(os.path.join(index_dir, "ids.npy"), np.asarray(ids, dtype=np.int32).reshape(-1, 2))
+        meta = {"model": model_name, "dataset_sha256": dataset_sha256, "columns": names}
+        with open(os.path.join(index_dir, "meta.json"), "w") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        return cls.load(index_dir)
+
+    @classmethod
+    def load(cls, index_dir: str):
+        with open(os.path.join(index_dir, "meta.json"), "r") as f:
+            meta = json.load(f)
+        vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+        ids = np.load(os.path.join(index_dir, "ids.npy"), mmap_mode="r")
+        return cls(index_dir, vectors, ids, meta)
+
+    @classmethod
+    def load_or_build(cls, index_dir: str, df, columns: list, embed, dataset_sha256: str,
+                      model_name: str = DEFAULT_EMBEDDING_MODEL):
+        """Reuse the on-disk index if it matches dataset, model and columns; else rebuild."""
+        try:
+            index = cls.load(index_dir)
+            wanted = [c for c in columns if c in df.columns]
+            if (index.meta.get("dataset_sha256") == dataset_sha256
+                    and index.meta.get("model") == model_name
+                    and index.columns == wanted):
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+        return cls.build(index_dir, df, columns, embed, dataset_sha256, model_name)
+
+    def search(self, query_vec, k: int = 50, columns: list = None) -> list:
+        """
+        Top-k (column name, row index, score) by cosine similarity,
+        optionally restricted to `columns`.
+        """
+        if len(self.ids) == 0:
+            return []
+        scores = np.asarray(self.vectors @ np.asarray(query_vec, dtype=np.float32).ravel())
+        if columns:
+            col_ids = [i for i, c in enumerate(self.columns) if c in columns]
+            scores = np.where(np.isin(self.ids[:, 0], col_ids), scores, -np.inf)
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.columns[self.ids[i, 0]], int(self.ids[i, 1]), float(scores[i])) for i in top]
@@ -0,0 +1,86 @@
+import re
+
+from prompts import dataset_context
+
+# Identity / contact / bookkeeping columns: never summarized, indexed or quoted.
+PII_COLUMNS = {
+    "First name",
+    "Last name",
+    "Phone number",
+    "Email",
+    "Full Mosed Name",
+    "Address",
+    "Address line 2",
+    "City/Town",
+    "State/Region/Province",
+    "Zip/Post code",
+    "Can you accept a PayPal? What is the email connected to your account?",
+    "What number is best to add to the group?",
+    "Submitted At",
+    "Token",
+}
+
+
+def parse_dataset_context(context: str = dataset_context) -> list:
+    """
+    Parse the column blocks of prompts.dataset_context into dicts:
+      {"index", "name", "samples", "unique_count", "type", "dtype"}
+    in column order.
+    """
+    columns = []
+    for block in re.split(r"\n---\n", context):
+        idx = re.search(r"^\*\*(\d+)\*\*", block.strip())
+        name = re.search(r'Column Name:\*\* "(.*)"', block)
+        if not idx or not name:
+            continue
+        samples = re.search(r"Sample Responses:\*\* (.*)", block)
+        unique = re.search(r"Unique Values Count:\*\* (\d+)", block)
+        type_ = re.search(r"Type:\*\* (.*)", block)
+        dtype = re.search(r"DType:\*\* (\S+)", block)
+        columns.append({
+            "index": int(idx.group(1)),
+            "name": name.group(1),
+            "samples": samples.group(1).strip() if samples else "",
+            "unique_count": int(unique.group(1)) if unique else 0,
+            "type": type_.group(1).strip() if type_ else "",
+            "dtype": dtype.group(1) if dtype else "object",
+        })
+    return columns
+
+
+def open_ended_text_columns(columns: list = None) -> list:
+    """
+    Names of the free-text survey columns worth summarizing: open-ended,
+    stored as text, not empty, not identity/contact data.
+    """
+    columns = columns if columns is not None else parse_dataset_context()
+    return [
+        c["name"] for c in columns
+        if re.match(r"Open.ended text", c["type"])
+        and "date/time" not in c["type"]
+        and c["dtype"] == "object"
+        and c["unique_count"] > 0
+        and c["name"] not in PII_COLUMNS
+    ]
+
+
+def compact_dataset_context(columns: list = None, max_samples: int = 3, max_sample_chars: int = 40) -> str:
+    """
+    One line per column (index, exact name, type, dtype, unique count, a few
+    short samples): a much smaller stand-in for prompts.dataset_context.
+    Deterministic, so prompts built on it stay byte-identical across calls.
+    """
+    columns = columns if columns is not None else parse_dataset_context()
+    lines = [
+        "Columns of the cleaned CSV (index. \"exact header\" | type | dtype | unique values | samples):"
+    ]
+    for c in columns:
+        samples = re.findall(r'"((?:[^"\\]|\\.)*)"', c["samples"])[:max_samples]
+        samples = ", ".join(
+            '"' + (s if len(s) <= max_sample_chars else s[:max_sample_chars - 1] + "…") + '"'
+            for s in samples
+        )
+        lines.append(
+            f'{c["index"]}. "{c["name"]}" | {c["type"]} | {c["dtype"]} | {c["unique_count"]} | {samples}'
+        )
+    return "\n".join(lines)
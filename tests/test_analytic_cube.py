@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytic_cube import AnalyticCube, _cramers_v_corrected, _eta_corrected, cube_columns
+
+
+def _entry(index, name, type_, dtype, unique_count):
+    return {"index": index, "name": name, "samples": "", "unique_count": unique_count,
+            "type": type_, "dtype": dtype}
+
+
+COLUMNS = [
+    _entry(0, "Role", "Selected text (predefined roles)", "object", 3),
+    _entry(1, "Shift", "Selected text", "object", 2),
+    _entry(2, "Satisfaction", "Selected text (numeric rating)", "float64", 5),
+    _entry(3, "Years", "Open‑ended text (numeric responses)", "float64", 30),
+    _entry(4, "Comments", "Open‑ended text", "object", 200),
+    _entry(5, "Submitted", "Open‑ended text (date/time)", "object", 200),
+    _entry(6, "Noise", "Selected text (predefined options)", "object", 20),
+]
+
+
+@pytest.fixture(scope="module")
+def df():
+    rng = np.random.default_rng(0)
+    n = 200
+    role = rng.choice(["Nurse", "Doctor", "Aide"], n)
+    satisfaction = np.where(role == "Nurse", 2.0, np.where(role == "Doctor", 4.0, 3.0)) + rng.normal(0, 0.3, n)
+    return pd.DataFrame({
+        # case and whitespace variants of the same answers
+        "Role": np.where(np.arange(n) % 10 == 0, np.char.upper(role.astype(str)), role),
+        "Shift": np.where(role == "Nurse", " Night ", "Day"),
+        "Satisfaction": np.where(np.arange(n) % 25 == 0, np.nan, satisfaction),
+        "Years": satisfaction * 5 + rng.normal(0, 0.5, n),
+        "Comments": [f"comment {i}" for i in range(n)],
+        "Submitted": ["2024-01-01"] * n,
+        "Noise": rng.choice([f"n{i}" for i in range(20)], n),
+    })
+
+
+@pytest.fixture(scope="module")
+def cube(df):
+    return AnalyticCube(df, columns=COLUMNS)
+
+
+def test_cube_columns_split_categorical_and_measures():
+    categorical, measures = cube_columns(COLUMNS)
+    assert [c["name"] for c in categorical] == ["Role", "Shift", "Noise"]
+    assert [c["name"] for c in measures] == ["Satisfaction", "Years"]
+    categorical, _ = cube_columns(COLUMNS, max_categories=10)
+    assert [c["name"] for c in categorical] == ["Role", "Shift"]
+
+
+def test_resolve_by_name_index_and_prefix(cube):
+    assert cube.resolve("Role") == "Role"
+    assert cube.resolve(2) == "Satisfaction"
+    assert cube.resolve("sat") == "Satisfaction"
+    with pytest.raises(KeyError):
+        cube.resolve("Comments")
+    with pytest.raises(KeyError):
+        cube.resolve("4")
+
+
+def test_counts_merge_case_and_whitespace_variants(cube, df):
+    counts = cube.counts("Role")
+    assert set(counts.index) == {"Nurse", "Doctor", "Aide", "(no answer)"}
+    assert counts["count"].sum() == len(df)
+    assert counts.loc["(no answer)", "count"] == 0
+    assert cube.counts("Shift").index[:2].tolist() in (["Day", "Night"], ["Night", "Day"])
+
+
+def test_counts_of_a_measure_report_missing_answers(cube):
+    counts = cube.counts("Satisfaction")
+    assert counts.loc["(no answer)", "count"] == 8
+
+
+def test_crosstab_orientation_and_normalization(cube):
+    table = cube.crosstab("Role", "Shift")
+    assert table.loc["Nurse", "Night"] == cube.counts("Role").loc["Nurse", "count"]
+    assert table.loc["Nurse", "Day"] == 0
+    assert cube.crosstab("Shift", "Role").equals(table.T)
+    assert (cube.crosstab("Role", "Shift", normalize="row").sum(axis=1) == 100).all()
+    with pytest.raises(ValueError):
+        cube.crosstab("Role", "Role")
+    with pytest.raises(ValueError):
+        cube.crosstab("Role", "Years")
+
+
+def test_mean_by_matches_pandas(cube, df):
+    out = cube.mean_by("Satisfaction", "Role")
+    assert out.index.tolist() == ["Doctor", "Aide", "Nurse"]
+    expected = df.assign(Role=df["Role"].str.title()).groupby("Role")["Satisfaction"].mean()
+    assert out["mean"].to_dict() == pytest.approx(expected.round(3).to_dict())
+    with pytest.raises(ValueError):
+        cube.mean_by("Role", "Satisfaction")
+
+
+def test_association_statistic_per_column_kinds(cube):
+    assert cube.association("Role", "Shift")["statistic"] == "cramers_v"
+    assert cube.association("Role", "Shift")["value"] == pytest.approx(1.0)
+    eta = cube.association("Satisfaction", "Role")
+    assert eta["statistic"] == "eta" and eta["value"] > 0.9 and eta["n"] == 192
+    assert cube.association("Years", "Satisfaction")["statistic"] == "pearson_r"
+    with pytest.raises(ValueError):
+        cube.association("Role", "Role")
+
+
+def test_corrected_statistics_do_not_reward_many_categories():
+    rng = np.random.default_rng(1)
+    a, b = rng.integers(0, 20, 500), rng.integers(0, 20, 500)
+    table = np.zeros((20, 20))
+    np.add.at(table, (a, b), 1)
+    assert _cramers_v_corrected(table) < 0.05
+    assert _eta_corrected(0.3, 50, 20) < 0.3
+    assert _eta_corrected(0.5, 5, 10) == 0.0
+
+
+def test_top_predictors_ranks_each_statistic_separately(cube):
+    out = cube.top_predictors("Satisfaction", k=1)
+    assert out.columns.tolist() == ["statistic", "column", "value", "n"]
+    assert out.set_index("statistic")["column"].to_dict() == {
+        "eta_corrected": "Role", "pearson_r": "Years",
+    }
+
+    out = cube.top_predictors("Role", k=5)
+    v = out[out["statistic"] == "cramers_v_corrected"]
+    assert v["column"].tolist() == ["Shift", "Noise"]
+    assert v["value"].is_monotonic_decreasing
+    assert set(out["statistic"]) == {"cramers_v_corrected", "eta_corrected"}
+
+
+def test_run_renders_the_query_and_rejects_unknown_ops(cube):
+    text = cube.run({"op": "counts", "column": "Role"})
+    assert text.startswith("counts(column=Role):\n")
+    assert "Nurse" in text
+    assert "statistic" in cube.run({"op": "association", "a": "Role", "b": "Shift"})
+    with pytest.raises(ValueError):
+        cube.run({"op": "drop_table"})
+    with pytest.raises(TypeError):
+        cube.run({"op": "counts", "bogus": 1})
+
+
+def test_prompt_lists_columns_by_index(cube):
+    prompt = cube.prompt()
+    assert "categorical: 0, 1, 6" in prompt
+    assert "numeric measures: 2, 3" in prompt
@@ -0,0 +1,104 @@
+import numpy as np
+
+from answer_cache import AnswerCache, content_terms, normalize_query
+
+
+def _cache(tmp_path, dataset_hash="d1", **kwargs):
+    return AnswerCache(str(tmp_path / "answers.sqlite"), dataset_hash, **kwargs)
+
+
+def _put(cache, query, embedding=None, images=()):
+    cache.put(query, "plan:" + query, "analysis", "summary:" + query, list(images), embedding=embedding)
+
+
+def test_normalize_query():
+    assert normalize_query("  How many   Respondents?  ") == "how many respondents"
+    assert normalize_query('"Average salary."') == "average salary"
+
+
+def test_content_terms_keep_negations_subgroups_and_numbers():
+    base = content_terms(normalize_query("How many nurses are there?"))
+    assert content_terms(normalize_query("how many nurse")) == base
+    assert content_terms(normalize_query("How many nurses are not there?")) != base
+    assert content_terms(normalize_query("How many nurses over 40?")) != base
+    assert content_terms(normalize_query("How many nurses over 50?")) != \
+        content_terms(normalize_query("How many nurses over 40?"))
+
+
+def test_exact_hit_ignores_case_whitespace_and_punctuation(tmp_path):
+    cache = _cache(tmp_path)
+    _put(cache, "How many respondents?", images=[b"png"])
+    hit = cache.get("  how many RESPONDENTS ")
+    assert hit["match"] == "exact"
+    assert hit["summary"] == "summary:How many respondents?"
+    assert hit["images"] == [b"png"]
+    assert cache.get("How many respondents are nurses?") is None
+
+
+def test_put_replaces_the_previous_entry_and_its_images(tmp_path):
+    cache = _cache(tmp_path)
+    _put(cache, "q", images=[b"a", b"b"])
+    _put(cache, "q", images=[b"c"])
+    assert cache.get("q")["images"] == [b"c"]
+
+
+def test_other_dataset_hash_invalidates_entries(tmp_path):
+    _put(_cache(tmp_path, "d1"), "q")
+    assert _cache(tmp_path, "d1").get("q") is not None
+    assert _cache(tmp_path, "d2").get("q") is None
+    # reopening against the old hash finds the purge was permanent
+    assert _cache(tmp_path, "d1").get("q") is None
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    cache = _cache(tmp_path, ttl_seconds=-1)
+    _put(cache, "q")
+    assert cache.get("q") is None
+
+
+def test_least_recently_used_entries_beyond_max_entries_are_dropped(tmp_path):
+    cache = _cache(tmp_path, max_entries=2)
+    _put(cache, "a")
+    _put(cache, "b")
+    cache.get("a")
+    _put(cache, "c")
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_semantic_hit_requires_same_content_terms(tmp_path):
+    cache = _cache(tmp_path, similarity_threshold=0.9)
+    embedding = np.array([1.0, 0.0, 0.0])
+    _put(cache, "How many nurses are there?", embedding=embedding)
+
+    rephrased = "how many nurses"
+    assert cache.get(rephrased) is None
+    assert cache.has_similar(rephrased)
+    hit = cache.get_similar(rephrased, np.array([0.99, 0.05, 0.0]))
+    assert hit["match"] == "semantic"
+    assert hit["plan"] == "plan:How many nurses are there?"
+
+    # a near-identical embedding can't bridge a negation or a subgroup
+    for other in ("how many nurses are not there", "how many nurses in paris"):
+        assert not cache.has_similar(other)
+        assert cache.get_similar(other, embedding) is None
+
+
+def test_semantic_miss_below_threshold(tmp_path):
+    cache = _cache(tmp_path, similarity_threshold=0.95)
+    _put(cache, "how many nurses", embedding=[1.0, 0.0])
+    assert cache.has_similar("How many nurses?")
+    assert cache.get_similar("How many nurses?", [0.7, 0.7]) is None
+
+
+def test_entries_without_embedding_are_not_semantic_candidates(tmp_path):
+    cache = _cache(tmp_path)
+    _put(cache, "how many nurses")
+    assert not cache.has_similar("nurses how many")
+
+
+def test_exact_tier_only_when_threshold_is_none(tmp_path):
+    cache = _cache(tmp_path, similarity_threshold=None)
+    _put(cache, "how many nurses", embedding=[1.0, 0.0])
+    assert not cache.has_similar("nurses how many")
+    assert cache.get_similar("nurses how many", [1.0, 0.0]) is None
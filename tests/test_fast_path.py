@@ -0,0 +1,123 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytic_cube import AnalyticCube
+from fast_path import FastPathRouter
+from pipeline import Job, PipelineEngine
+
+
+def _entry(index, name, type_, dtype, unique_count, samples):
+    return {"index": index, "name": name, "samples": samples, "unique_count": unique_count,
+            "type": type_, "dtype": dtype}
+
+
+COLUMNS = [
+    _entry(0, "What is your role?", "Selected text (predefined roles)", "object", 3, "Nurse, Doctor, Aide"),
+    _entry(1, "Population size of your community", "Selected text (population ranges)", "object", 2,
+           "450-750, Less than 100"),
+    _entry(2, "How often do you host holiday programs?", "Selected text (usage frequency)", "object", 4,
+           "Never, Sometimes, Often, Always"),
+    _entry(3, "Satisfaction with your work", "Selected text (numeric rating)", "float64", 5,
+           "1, 2, 3, 4, 5"),
+]
+
+
+@pytest.fixture(scope="module")
+def router():
+    rng = np.random.default_rng(0)
+    n = 100
+    df = pd.DataFrame({
+        COLUMNS[0]["name"]: rng.choice(["Nurse", "Doctor", "Aide"], n),
+        COLUMNS[1]["name"]: rng.choice(["450-750", "Less than 100"], n),
+        COLUMNS[2]["name"]: rng.choice(["Never", "Sometimes", "Often", "Always"], n),
+        COLUMNS[3]["name"]: rng.integers(1, 6, n).astype(float),
+    })
+    return FastPathRouter(AnalyticCube(df, columns=COLUMNS), columns=COLUMNS)
+
+
+@pytest.mark.parametrize("query, op", [
+    ("What is the distribution of roles?",
+     {"op": "counts", "column": "What is your role?"}),
+    ("How often do respondents host holiday programs?",
+     None),  # no count / average wording
+    ("What percentage of respondents host holiday programs often?",
+     {"op": "counts", "column": "How often do you host holiday programs?"}),
+    ("What is the breakdown of community population size?",
+     {"op": "counts", "column": "Population size of your community"}),
+    ("What is the average work satisfaction?",
+     {"op": "describe", "measure": "Satisfaction with your work"}),
+])
+def test_plain_questions_route_to_one_column(router, query, op):
+    plan = router.route(query)
+    if op is None:
+        assert plan is None
+    else:
+        assert plan == {"type": "fast", "column": op.get("column", op.get("measure")), "queries": [op]}
+
+
+@pytest.mark.parametrize("query", [
+    # filters: a whole-column count would answer a different question
+    "What is the distribution of roles among communities with population size less than a hundred?",
+    "What is the distribution of roles for respondents who host holiday programs often?",
+    "What is the breakdown of roles of people whose community population size is small?",
+    "What is the distribution of roles with holiday programs?",
+    "What is the distribution of roles only in small communities?",
+    "How many nurses are not satisfied with their work?",
+    # comparisons, relationships and numbers
+    "What is the distribution of roles by population size?",
+    "Does population size predict satisfaction with work?",
+    "How many respondents rate satisfaction above 3?",
+    # averages of categorical columns and unknown or ambiguous subjects
+    "What is the average role?",
+    "How many respondents have children?",
+    "What is the distribution?",
+])
+def test_filtered_comparative_and_ambiguous_questions_escalate(router, query):
+    assert router.route(query) is None
+
+
+def test_stats_count_routed_and_escalated(router):
+    before = dict(router.stats)
+    router.route("What is the distribution of roles?")
+    router.route("Why do roles differ?")
+    assert router.stats["fast"] == before["fast"] + 1
+    assert router.stats["escalated"] == before["escalated"] + 1
+
+
+class _ReachedAgent1(Exception):
+    pass
+
+
+class _RecordingRouter:
+    def __init__(self):
+        self.queries = []
+
+    def route(self, query):
+        self.queries.append(query)
+        return None
+
+
+def _engine_stub(router):
+    async def get_agent1_plan(query):
+        raise _ReachedAgent1(query)
+
+    return SimpleNamespace(
+        resources=SimpleNamespace(answer_cache=None),
+        config=SimpleNamespace(speculative_execution=False),
+        router=router,
+        get_agent1_plan=get_agent1_plan,
+    )
+
+
+@pytest.mark.parametrize("thread_id, routed", [(None, True), ("thread_abc", False)])
+def test_follow_ups_skip_the_fast_path(thread_id, routed):
+    # a follow-up ("and what about doctors?") leans on conversation context the router can't see
+    router = _RecordingRouter()
+    job = Job(id="j", query="What is the distribution of roles?", thread_id=thread_id)
+    with pytest.raises(_ReachedAgent1):
+        asyncio.run(PipelineEngine._run_stages(_engine_stub(router), job))
+    assert router.queries == ([job.query] if routed else [])
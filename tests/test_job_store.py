@@ -0,0 +1,131 @@
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+
+from job_store import JobStore
+
+HOST = socket.gethostname()
+
+
+def _job(job_id, status="running", created_at=None, **fields):
+    job = {
+        "id": job_id, "query": "q " + job_id, "thread_id": None, "status": status, "stage": "plan",
+        "plan": None, "plan_type": None, "analysis": None, "summary": None,
+        "image_file_ids": [], "images": [], "cached": None, "error": None,
+        "created_at": created_at or time.time(), "finished_at": None, "owner": "session",
+    }
+    job.update(fields)
+    return job
+
+
+def _store(tmp_path, process_id=None, **kwargs):
+    store = JobStore(str(tmp_path / "jobs.sqlite"), **kwargs)
+    if process_id is not None:
+        store.process_id = process_id
+    return store
+
+
+def _dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def test_save_and_load_round_trip(tmp_path):
+    store = _store(tmp_path)
+    job = _job("a", plan='{"x": 1}', image_file_ids=["file-1"], images=[("file-1", "cached-abc")])
+    store.save(job)
+    assert store.load("a") == job
+    assert store.load("missing") is None
+
+
+def test_old_stores_are_migrated(tmp_path):
+    db = sqlite3.connect(str(tmp_path / "jobs.sqlite"))
+    db.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, query TEXT NOT NULL, thread_id TEXT, "
+        "status TEXT NOT NULL, stage TEXT, plan TEXT, plan_type TEXT, analysis TEXT, summary TEXT, "
+        "image_file_ids TEXT, images TEXT, cached TEXT, error TEXT, created_at REAL NOT NULL, "
+        "finished_at REAL, updated_at REAL NOT NULL)"
+    )
+    db.execute("INSERT INTO jobs (id, query, status, created_at, updated_at) "
+               "VALUES ('old', 'q', 'running', 1, 1)")
+    db.commit()
+    db.close()
+
+    store = _store(tmp_path)
+    assert store.load("old")["owner"] is None
+    # unclaimed jobs from before ownership are resumable
+    assert [j["id"] for j in store.claim_unfinished(stale_seconds=60)] == ["old"]
+
+
+def test_finished_jobs_beyond_max_finished_are_dropped_oldest_first(tmp_path):
+    store = _store(tmp_path, max_finished=2)
+    for i, job_id in enumerate("abc"):
+        store.save(_job(job_id, status="done", finished_at=100.0 + i))
+    assert store.load("a") is None
+    assert store.load("b") and store.load("c")
+
+
+def test_claim_skips_own_and_finished_jobs(tmp_path):
+    store = _store(tmp_path)
+    store.save(_job("mine"))
+    store.save(_job("done", status="done", finished_at=time.time()))
+    assert store.claim_unfinished(stale_seconds=60) == []
+
+
+def test_claim_leaves_live_remote_owners_alone_until_stale(tmp_path):
+    _store(tmp_path, "otherhost:1:aaa").save(_job("remote"))
+    store = _store(tmp_path)
+    assert store.claim_unfinished(stale_seconds=60) == []
+    assert [j["id"] for j in store.claim_unfinished(stale_seconds=0)] == ["remote"]
+
+
+def test_claim_leaves_live_local_pids_alone(tmp_path):
+    _store(tmp_path, f"{HOST}:{os.getppid()}:aaa").save(_job("sibling"))
+    assert _store(tmp_path).claim_unfinished(stale_seconds=60) == []
+
+
+def test_claim_takes_over_dead_local_pids(tmp_path):
+    _store(tmp_path, f"{HOST}:{_dead_pid()}:aaa").save(_job("orphan"))
+    assert [j["id"] for j in _store(tmp_path).claim_unfinished(stale_seconds=60)] == ["orphan"]
+
+
+def test_claim_takes_over_a_dead_predecessor_with_the_same_host_and_pid(tmp_path):
+    # a restarted container can reuse both hostname and PID; the instance ID tells them apart
+    before = _store(tmp_path)
+    before.save(_job("interrupted"))
+    after = _store(tmp_path)
+    assert after.process_id.split(":")[:2] == before.process_id.split(":")[:2]
+    assert after.process_id != before.process_id
+    assert [j["id"] for j in after.claim_unfinished(stale_seconds=60)] == ["interrupted"]
+
+
+def test_claimed_jobs_come_oldest_first_with_their_checkpoint(tmp_path):
+    dead = _store(tmp_path, f"{HOST}:{_dead_pid()}:aaa")
+    dead.save(_job("new", created_at=200.0))
+    dead.save(_job("old", created_at=100.0, stage="summary", analysis="result"))
+    claimed = _store(tmp_path).claim_unfinished(stale_seconds=60)
+    assert [j["id"] for j in claimed] == ["old", "new"]
+    assert claimed[0]["stage"] == "summary" and claimed[0]["analysis"] == "result"
+
+
+def test_a_job_is_claimed_by_only_one_process(tmp_path):
+    _store(tmp_path, f"{HOST}:{_dead_pid()}:aaa").save(_job("orphan"))
+    first, second = _store(tmp_path, "h1:1:x"), _store(tmp_path, "h2:2:y")
+    assert [j["id"] for j in first.claim_unfinished(stale_seconds=60)] == ["orphan"]
+    # the new owner is a live remote process with a fresh heartbeat
+    assert second.claim_unfinished(stale_seconds=60) == []
+
+
+def test_heartbeat_keeps_claims_fresh(tmp_path):
+    owner = _store(tmp_path, "otherhost:1:aaa")
+    owner.save(_job("remote"))
+    other = _store(tmp_path)
+    time.sleep(0.3)
+    owner.heartbeat()
+    assert other.claim_unfinished(stale_seconds=0.2) == []
+    time.sleep(0.3)
+    assert [j["id"] for j in other.claim_unfinished(stale_seconds=0.2)] == ["remote"]
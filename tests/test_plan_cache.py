@@ -0,0 +1,69 @@
+import json
+
+from plan_cache import PlanCache, schema_version
+
+
+def _cache(tmp_path, version="v1", **kwargs):
+    return PlanCache(str(tmp_path / "plans.sqlite"), str(tmp_path / "pinned.json"), version, **kwargs)
+
+
+def test_schema_version_depends_on_every_part():
+    assert schema_version("a", "b") == schema_version("a", "b")
+    assert schema_version("a", "b") != schema_version("a", "c")
+    # parts are delimited, so moving a boundary changes the version
+    assert schema_version("ab", "c") != schema_version("a", "bc")
+
+
+def test_learned_plans_are_keyed_on_the_normalized_query(tmp_path):
+    cache = _cache(tmp_path)
+    assert cache.get("How many nurses?") is None
+    cache.put("How many nurses?", '{"plan": 1}')
+    assert cache.get("  how many NURSES ") == '{"plan": 1}'
+    assert cache.get("how many doctors") is None
+    assert cache.stats == {"pinned_hits": 0, "hits": 1, "misses": 2}
+
+
+def test_schema_change_invalidates_learned_plans(tmp_path):
+    _cache(tmp_path, "v1").put("q", "p")
+    assert _cache(tmp_path, "v1").get("q") == "p"
+    assert _cache(tmp_path, "v2").get("q") is None
+    assert _cache(tmp_path, "v1").get("q") is None
+
+
+def test_least_recently_used_plans_beyond_max_entries_are_dropped(tmp_path):
+    cache = _cache(tmp_path, max_entries=2)
+    cache.put("a", "pa")
+    cache.put("b", "pb")
+    cache.get("a")
+    cache.put("c", "pc")
+    assert cache.get("b") is None
+    assert cache.get("a") == "pa" and cache.get("c") == "pc"
+
+
+def test_pins_take_precedence_and_persist(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put("q", "learned")
+    cache.pin("Q?", "vetted")
+    assert cache.is_pinned("q")
+    assert cache.get("q") == "vetted"
+    assert cache.stats["pinned_hits"] == 1
+
+    with open(tmp_path / "pinned.json") as f:
+        assert json.load(f) == {"q": {"schema_version": "v1", "plan": "vetted"}}
+    assert _cache(tmp_path).get("q") == "vetted"
+
+    cache.unpin("q")
+    assert not cache.is_pinned("q")
+    assert cache.get("q") == "learned"
+
+
+def test_pins_for_another_schema_version_are_ignored(tmp_path):
+    _cache(tmp_path, "v1").pin("q", "vetted")
+    cache = _cache(tmp_path, "v2")
+    assert not cache.is_pinned("q")
+    assert cache.get("q") is None
+
+
+def test_unreadable_pin_file_is_treated_as_empty(tmp_path):
+    (tmp_path / "pinned.json").write_text("{not json")
+    assert _cache(tmp_path).get("q") is None
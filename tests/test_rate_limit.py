@@ -0,0 +1,138 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from rate_limit import (
+    PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, RateLimiter, is_retryable,
+)
+
+
+def _status_error(cls, status, headers=None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/responses")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return cls("error", response=response, body=None)
+
+
+def test_acquire_charges_both_buckets():
+    limiter = RateLimiter({"m": (10, 1000)})
+
+    async def go():
+        await limiter.acquire("m", 300)
+        return limiter._budget("m")
+
+    budget = asyncio.run(go())
+    assert budget.requests == pytest.approx(9, abs=0.01)
+    assert budget.tokens == pytest.approx(700, abs=1)
+
+
+def test_settle_refunds_and_charges_the_difference():
+    limiter = RateLimiter({"m": (10, 1000)})
+
+    async def go():
+        await limiter.acquire("m", 300)
+
+    asyncio.run(go())
+    budget = limiter._budget("m")
+    limiter.settle("m", reserved=300, actual=100)
+    assert budget.tokens == pytest.approx(900, abs=1)
+    limiter.settle("m", reserved=0, actual=400)
+    assert budget.tokens == pytest.approx(500, abs=1)
+    limiter.settle("m", reserved=300, actual=None)
+    assert budget.tokens == pytest.approx(500, abs=1)
+
+
+def test_delay_for_reflects_missing_tokens():
+    limiter = RateLimiter({"m": (60, 600)})
+    budget = limiter._budget("m")
+    budget.tokens = 0
+    # 600 tokens/min refill 10 tokens/s, so 100 tokens are 10 s away
+    assert budget.delay_for(100) == pytest.approx(10, abs=0.1)
+    budget.tokens, budget.requests = 600, 0
+    assert budget.delay_for(1) == pytest.approx(1, abs=0.1)
+
+
+def test_oversized_request_is_capped_at_the_bucket_size():
+    limiter = RateLimiter({"m": (10, 1000)})
+    waited = asyncio.run(asyncio.wait_for(limiter.acquire("m", 50_000), 1))
+    assert waited < 0.5
+    assert limiter._budget("m").tokens == pytest.approx(0, abs=1)
+
+
+def test_contended_budget_serves_waiters_by_priority_then_fifo():
+    # 1200 rpm: one request slot every 50 ms once the bucket is drained
+    limiter = RateLimiter({"m": (1200, 10**9)})
+    order = []
+
+    async def waiter(name, priority):
+        await limiter.acquire("m", 1, priority)
+        order.append(name)
+
+    async def go():
+        limiter._budget("m").requests = 0
+        tasks = [
+            asyncio.create_task(waiter("bulk", PRIORITY_BULK)),
+            asyncio.create_task(waiter("normal-1", PRIORITY_NORMAL)),
+            asyncio.create_task(waiter("interactive", PRIORITY_INTERACTIVE)),
+            asyncio.create_task(waiter("normal-2", PRIORITY_NORMAL)),
+        ]
+        await asyncio.wait_for(asyncio.gather(*tasks), 5)
+
+    asyncio.run(go())
+    assert order == ["interactive", "normal-1", "normal-2", "bulk"]
+
+
+def test_is_retryable():
+    assert is_retryable(_status_error(openai.RateLimitError, 429))
+    assert is_retryable(_status_error(openai.InternalServerError, 503))
+    assert is_retryable(openai.APIConnectionError(request=httpx.Request("POST", "https://x")))
+    assert not is_retryable(_status_error(openai.BadRequestError, 400))
+    assert not is_retryable(ValueError("nope"))
+
+
+def test_call_retries_retryable_errors_and_pauses_the_model_on_429():
+    limiter = RateLimiter({"m": (1000, 10**6)}, backoff_base=0.01, backoff_max=0.01)
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise _status_error(openai.RateLimitError, 429, {"retry-after": "0.05"})
+        if len(attempts) == 2:
+            raise _status_error(openai.InternalServerError, 500)
+        return "ok"
+
+    assert asyncio.run(limiter.call("m", 10, request)) == "ok"
+    assert len(attempts) == 3
+    stats = limiter.stats()["m / normal"]
+    assert stats["requests"] == 3
+    assert stats["retries"] == 2
+    assert stats["rate_limited"] == 1
+    assert limiter._budget("m").paused_until > 0
+
+
+def test_call_reraises_non_retryable_errors_immediately():
+    limiter = RateLimiter({"m": (1000, 10**6)}, backoff_base=0.01)
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        raise _status_error(openai.BadRequestError, 400)
+
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(limiter.call("m", 10, request))
+    assert len(attempts) == 1
+
+
+def test_call_gives_up_after_max_retries():
+    limiter = RateLimiter({"m": (1000, 10**6)}, max_retries=2, backoff_base=0.001, backoff_max=0.001)
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        raise _status_error(openai.InternalServerError, 502)
+
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(limiter.call("m", 10, request))
+    assert len(attempts) == 3
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from response_index import ResponseIndex
+
+WORDS = ["funding", "volunteers", "space", "time"]
+
+
+def _embed(texts):
+    """Bag-of-words over WORDS, L2-normalized (stands in for the sentence model)."""
+    vecs = np.array([[t.lower().count(w) for w in WORDS] for t in texts], dtype=np.float32) + 1e-3
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def _df():
+    return pd.DataFrame({
+        "Challenges": ["Not enough funding", None, "  ", "We need volunteers", "funding and space"],
+        "Ideas": ["More time", "Bigger space", "volunteers", None, "time"],
+        "Score": [1, 2, 3, 4, 5],
+    })
+
+
+def test_build_indexes_non_blank_answers_only(tmp_path):
+    index = ResponseIndex.build(str(tmp_path), _df(), ["Challenges", "Ideas", "Missing"], _embed, "sha")
+    assert index.columns == ["Challenges", "Ideas"]
+    assert len(index.ids) == 3 + 4
+    assert (tmp_path / "vectors.npy").exists() and (tmp_path / "meta.json").exists()
+
+
+def test_search_ranks_by_similarity_and_filters_columns(tmp_path):
+    index = ResponseIndex.build(str(tmp_path), _df(), ["Challenges", "Ideas"], _embed, "sha")
+    query = _embed(["funding"])[0]
+    top = index.search(query, k=2)
+    assert [(c, r) for c, r, _ in top] == [("Challenges", 0), ("Challenges", 4)]
+    assert top[0][2] >= top[1][2]
+    only_ideas = index.search(_embed(["space"])[0], k=10, columns=["Ideas"])
+    assert {c for c, _, _ in only_ideas} == {"Ideas"}
+    assert only_ideas[0][:2] == ("Ideas", 1)
+    assert len(only_ideas) == 4
+
+
+def test_load_or_build_reuses_a_matching_index_and_rebuilds_otherwise(tmp_path):
+    calls = []
+
+    def embed(texts):
+        calls.append(len(texts))
+        return _embed(texts)
+
+    df = _df()
+    ResponseIndex.load_or_build(str(tmp_path), df, ["Challenges"], embed, "sha")
+    ResponseIndex.load_or_build(str(tmp_path), df, ["Challenges"], embed, "sha")
+    assert len(calls) == 1
+    ResponseIndex.load_or_build(str(tmp_path), df, ["Challenges"], embed, "other-sha")
+    ResponseIndex.load_or_build(str(tmp_path), df, ["Challenges", "Ideas"], embed, "other-sha")
+    ResponseIndex.load_or_build(str(tmp_path), df, ["Challenges", "Ideas"], embed, "other-sha", model_name="m2")
+    assert len(calls) == 4
+
+
+def test_empty_index_searches_return_nothing(tmp_path):
+    index = ResponseIndex.build(str(tmp_path), _df(), ["Score-less"], _embed, "sha")
+    assert index.search(np.ones(4), k=5) == []
@@ -0,0 +1,170 @@
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.fernet import Fernet
+
+DIGEST_FORMAT_VERSION = 1
+DIGESTS_PATH = "super_cleaned_data.digests.json.encrypted"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+def chunk_responses(responses: list, max_tokens: int) -> list:
+    """
+    Greedily pack responses (kept whole, in order) into chunks whose
+    estimated size stays under max_tokens. Returns a list of joined strings.
+    """
+    chunks, current, current_tokens = [], [], 0
+    for r in responses:
+        t = estimate_tokens(r) + 1
+        if current and current_tokens + t > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(r)
+        current_tokens += t
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def dataset_sha256(csv_bytes: bytes) -> str:
+    return hashlib.sha256(csv_bytes).hexdigest()
+
+
+###############################################################################
+# BUILD (offline)
+###############################################################################
+_MAP_INSTRUCTIONS = (
+    "You are summarizing one part of the free-text survey responses to the question:\n'{column}'\n\n"
+    "Return JSON only:\n"
+    '{{"themes":[{{"theme":"short label","count":<responses in this part expressing it>,'
+    '"quotes":["verbatim quote", ...]}}],'
+    '"sentiment":{{"positive":<n>,"neutral":<n>,"negative":<n>}}}}\n'
+    "Quotes must be copied exactly from the responses (at most 3 per theme). "
+    "Sentiment counts must add up to the number of responses in this part."
+)
+
+_REDUCE_INSTRUCTIONS = (
+    "Merge these partial theme summaries of the survey question:\n'{column}'\n\n"
+    "Combine overlapping themes (sum their counts), keep at most {max_themes} themes ordered by count, "
+    "and at most 3 verbatim quotes per theme, taken only from the partial summaries. Return JSON only:\n"
+    '{{"themes":[{{"theme":"...","count":<n>,"quotes":["...", ...]}}]}}'
+)
+
+
+def _json_completion(client, model: str, instructions: str, content: str) -> dict:
+    completion = client.chat.completions.create(
+        model=model,
+        response_format={"type": "json_object"},
+        messages=[
+            {"role": "developer", "content": instructions},
+            {"role": "user", "content": content},
+        ],
+    )
+    return json.loads(completion.choices[0].message.content)
+
+
+def build_column_digest(client, column: str, responses: list, model: str = "gpt-4o",
+                        chunk_tokens: int = 12000, max_workers: int = 4, max_themes: int = 12) -> dict:
+    """
+    Theme clusters (with counts and representative verbatim quotes),
+    sentiment counts and response counts for one open-ended column.
+    Chunks are summarized concurrently, then merged in one reduce call.
+    """
+    responses = [r for r in responses if r.strip()]
+    digest = {
+        "response_count": len(responses),
+        "unique_response_count": len(set(responses)),
+        "themes": [],
+        "sentiment": {"positive": 0, "neutral": 0, "negative": 0},
+    }
+    if not responses:
+        return digest
+
+    chunks = chunk_responses(responses, chunk_tokens)
+    map_instructions = _MAP_INSTRUCTIONS.format(column=column)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+        partials = list(pool.map(
+            lambda chunk: _json_completion(client, model, map_instructions, chunk),
+            chunks,
+        ))
+
+    for p in partials:
+        for k in digest["sentiment"]:
+            digest["sentiment"][k] += int(p.get("sentiment", {}).get(k, 0) or 0)
+
+    if len(partials) == 1:
+        themes = partials[0].get("themes", [])
+    else:
+        merged = _json_completion(
+            client, model,
+            _REDUCE_INSTRUCTIONS.format(column=column, max_themes=max_themes),
+            json.dumps([p.get("themes", []) for p in partials], ensure_ascii=False),
+        )
+        themes = merged.get("themes", [])
+    digest["themes"] = sorted(themes, key=lambda t: -int(t.get("count", 0) or 0))[:max_themes]
+    return digest
+
+
+def build_digests(client, df, columns: list, csv_bytes: bytes, schema_version: str, **kwargs) -> dict:
+    """Digest artifact for every column in `columns` that exists in df."""
+    artifact = {
+        "format_version": DIGEST_FORMAT_VERSION,
+        "dataset_sha256": dataset_sha256(csv_bytes),
+        "schema_version": schema_version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "columns": {},
+    }
+    for column in columns:
+        if column not in df.columns:
+            continue
+        responses = df[column].dropna().astype(str).tolist()
+        artifact["columns"][column] = build_column_digest(client, column, responses, **kwargs)
+    return artifact
+
+
+###############################################################################
+# STORAGE (encrypted with the same key as the CSV)
+###############################################################################
+def save_digests(artifact: dict, encryption_key: str, path: str = DIGESTS_PATH):
+    payload = json.dumps(artifact, ensure_ascii=False).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(Fernet(encryption_key).encrypt(payload))
+
+
+def load_digests(encryption_key: str, csv_bytes: bytes, path: str = DIGESTS_PATH):
+    """
+    The digest artifact, or None if missing, unreadable, of another format
+    version, or built from a different dataset.
+    """
+    try:
+        with open(path, "rb") as f:
+            artifact = json.loads(Fernet(encryption_key).decrypt(f.read()))
+    except Exception:
+        return None
+    if artifact.get("format_version") != DIGEST_FORMAT_VERSION:
+        return None
+    if artifact.get("dataset_sha256") != dataset_sha256(csv_bytes):
+        return None
+    return artifact
+
+
+def render_digest(column: str, digest: dict) -> str:
+    """Plain-text rendering of one column digest, for prompting."""
+    s = digest["sentiment"]
+    lines = [
+        f"Question: {column}",
+        f"Responses: {digest['response_count']} ({digest['unique_response_count']} unique)",
+        f"Sentiment: {s['positive']} positive, {s['neutral']} neutral, {s['negative']} negative",
+        "Themes (count = responses expressing it):",
+    ]
+    for t in digest["themes"]:
+        lines.append(f"- {t.get('theme', '')} ({t.get('count', 0)})")
+        for q in t.get("quotes", []):
+            lines.append(f'    "{q}"')
+    return "\n".join(lines)
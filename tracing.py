@@ -0,0 +1,180 @@
+import json
+import time
+import uuid
+import functools
+import threading
+import contextlib
+import contextvars
+from collections import deque
+
+# USD per 1M tokens: (input, cached input, output). Reasoning tokens bill as output.
+DEFAULT_MODEL_PRICES = {
+    "o1-2024-12-17": (15.00, 7.50, 60.00),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "text-embedding-3-small": (0.02, 0.02, 0.0),
+}
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    One timed stage. Token counts, cost and queue time recorded on a span
+    also roll up into its ancestors, so a job's root span carries totals.
+    """
+
+    def __init__(self, name: str, trace_id: str, parent=None, **attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = parent
+        self.attributes = attributes
+        self.start = time.time()
+        self.end = None
+        self.status = "ok"
+        self.error = ""
+        self.queue_seconds = 0.0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self.reasoning_tokens = 0
+        self.cost_usd = 0.0
+
+    def _chain(self):
+        span = self
+        while span is not None:
+            yield span
+            span = span.parent
+
+    def add_queue_time(self, seconds: float):
+        for span in self._chain():
+            span.queue_seconds += seconds
+
+    def add_usage(self, input_tokens: int, cached_tokens: int, output_tokens: int,
+                  reasoning_tokens: int, cost_usd: float):
+        for span in self._chain():
+            span.input_tokens += input_tokens
+            span.cached_tokens += cached_tokens
+            span.output_tokens += output_tokens
+            span.reasoning_tokens += reasoning_tokens
+            span.cost_usd += cost_usd
+
+    def to_dict(self) -> dict:
+        """OpenTelemetry-shaped record (ids, unix-nano times, flat attributes)."""
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent.span_id if self.parent else None,
+            "start_time_unix_nano": int(self.start * 1e9),
+            "end_time_unix_nano": int((self.end or time.time()) * 1e9),
+            "status": {"code": self.status, "message": self.error},
+            "attributes": {
+                **self.attributes,
+                "wall_seconds": round((self.end or time.time()) - self.start, 4),
+                "queue_seconds": round(self.queue_seconds, 4),
+                "input_tokens": self.input_tokens,
+                "cached_tokens": self.cached_tokens,
+                "output_tokens": self.output_tokens,
+                "reasoning_tokens": self.reasoning_tokens,
+                "cost_usd": round(self.cost_usd, 6),
+            },
+        }
+
+
+class Tracer:
+    """
+    Records spans around pipeline stages. Finished spans are appended to a
+    JSONL file (`path`, one OpenTelemetry-shaped span per line; None => no
+    export) and the last `max_spans` are kept in memory for the admin panel.
+
+    The current span is tracked in a contextvar, so it follows asyncio
+    tasks and asyncio.to_thread calls started inside it. Thread-safe.
+    """
+
+    def __init__(self, path: str = None, max_spans: int = 2000, prices: dict = None):
+        self.path = path
+        self.prices = prices if prices is not None else DEFAULT_MODEL_PRICES
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name: str, trace_id: str = None, **attributes):
+        """Time a block as a span (child of the current span unless trace_id starts a new root)."""
+        parent = _current_span.get() if trace_id is None else None
+        span = Span(
+            name,
+            trace_id or (parent.trace_id if parent else uuid.uuid4().hex),
+            parent,
+            **attributes,
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status, span.error = "error", str(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end = time.time()
+            self._finish(span)
+
+    def _finish(self, span: Span):
+        record = span.to_dict()
+        with self._lock:
+            self._spans.append(record)
+            if self.path:
+                try:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                except OSError:
+                    pass
+
+    @staticmethod
+    def current():
+        return _current_span.get()
+
+    def add_queue_time(self, seconds: float):
+        span = _current_span.get()
+        if span is not None:
+            span.add_queue_time(seconds)
+
+    def add_usage(self, model: str, usage):
+        """Attribute an OpenAI usage object (chat, run or embeddings) to the current span."""
+        span = _current_span.get()
+        if span is None or usage is None:
+            return
+        input_tokens = usage.prompt_tokens or 0
+        output_tokens = getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+        out_details = getattr(usage, "completion_tokens_details", None)
+        reasoning = (getattr(out_details, "reasoning_tokens", 0) or 0) if out_details else 0
+        price_in, price_cached, price_out = self.prices.get(model, (0.0, 0.0, 0.0))
+        cost = ((input_tokens - cached) * price_in + cached * price_cached + output_tokens * price_out) / 1e6
+        span.add_usage(input_tokens, cached, output_tokens, reasoning, cost)
+
+    def spans(self, trace_id: str = None) -> list:
+        """Recent finished spans (as dicts), optionally only those of one trace."""
+        with self._lock:
+            records = list(self._spans)
+        if trace_id is not None:
+            records = [r for r in records if r["trace_id"] == trace_id]
+        return records
+
+
+def traced(name: str = None):
+    """
+    Decorator for PipelineEngine coroutine methods: runs the call in a span
+    on self.tracer. A returned "Error..." string marks the span as failed.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, *args, **kwargs):
+            with self.tracer.span(name or fn.__name__) as span:
+                result = await fn(self, *args, **kwargs)
+                if isinstance(result, str) and result.startswith("Error"):
+                    span.status, span.error = "error", result[:500]
+                return result
+        return wrapper
+    return decorate